@@ -1,18 +1,296 @@
-from fastapi import FastAPI, HTTPException
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel
+import asyncio
+import hmac
 import json
+import multiprocessing
+import os
+import threading
+import numpy as np
 
-app = FastAPI()
+from utils import encoding_utils, io_utils, metrics_utils
+from utils.encoding_utils import EncodedBodies
+from utils.explain_utils import EXPLANATIONS_PATH, model_version
+from utils.inference_utils import MODEL_MANIFEST_PATH, RESIDUAL_MODEL_PATH, TREND_MODEL_PATH, load_models
+from utils.metrics_utils import (METRICS_SAVE_INTERVAL, MetricsMiddleware, MetricsRegistry, collect_metrics,
+                                 render_gauges, save_process_metrics)
+from utils.monitoring_utils import MONITORING_PATH
+from utils.refresh_utils import (FORECAST_PATH, REFRESH_STATUS_PATH, REFRESH_TRIGGER_PATH, SCHEDULER_LOCK_PATH,
+                                 RefreshScheduler, read_status, request_refresh, run_refresh)
 
-with open('data/results/six_month_forecast.json', 'r') as file:
-    six_month_forecast = json.load(file)
+def serving_files_signature() -> tuple:
+    # the modification times of the files a ServingState is loaded from
+    signature = []
+    for path in [FORECAST_PATH, MODEL_MANIFEST_PATH, TREND_MODEL_PATH, RESIDUAL_MODEL_PATH]:
+        try:
+            signature.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+class ServingState:
+    '''
+    The forecast and models being served.
+
+    A refresh replaces the whole state at once, so a request that reads
+    it once never mixes the old and new models.
+    '''
+
+    def __init__(self):
+        # taken first, so files replaced while loading are loaded again
+        self.signature = serving_files_signature()
+        with open(FORECAST_PATH, 'r') as file:
+            self.six_month_forecast = json.load(file)
+
+        # published together by model_utils.save_models, so xgboost and sklearn are not needed here
+        self.trend_model, self.residual_model = load_models()
+        self.version = model_version(self.trend_model, self.residual_model)
+
+        # the forecast in each requested format and encoding, built once per forecast
+        self.forecast_bodies = EncodedBodies(self.six_month_forecast)
+
+serving = ServingState()
+serving_lock = threading.Lock()
+
+def current_serving() -> ServingState:
+    # reloaded when its files change, e.g. after a refresh run by another worker
+    global serving
+    current = serving
+    if current.signature != serving_files_signature():
+        with serving_lock:
+            if serving is current:
+                serving = ServingState()
+        current = serving
+    return current
+
+async def current_serving_async() -> ServingState:
+    # current_serving for async endpoints: loading the files and hashing the models
+    # runs in a thread, so it does not block the other requests on the event loop
+    current = serving
+    if current.signature == serving_files_signature():
+        return current
+    return await run_in_threadpool(current_serving)
+
+# set API_REFRESH_INTERVAL (seconds) to refresh on a schedule; POST /refresh triggers a refresh
+scheduler = None
+
+def swap_serving_state(forecast):
+    # the refresh has written the new forecast and models to disk (called in a thread, see RefreshScheduler)
+    global serving
+    with serving_lock:
+        serving = ServingState()
+
+def scheduler_running() -> bool:
+    # whether some process (this one or another worker) holds the scheduler lock
+    if scheduler is not None:
+        return True
+    with io_utils.file_lock(SCHEDULER_LOCK_PATH, blocking=False) as is_free:
+        return not is_free
+
+@asynccontextmanager
+async def refresh_scheduler():
+    global scheduler
+    interval = float(os.environ.get('API_REFRESH_INTERVAL', 0)) or None
+
+    # only one process (e.g. one of the gunicorn workers) schedules and runs refreshes;
+    # the others pass POST /refresh on through REFRESH_TRIGGER_PATH, and reload the
+    # forecast and models when the refresh has rewritten them (see current_serving)
+    with io_utils.file_lock(SCHEDULER_LOCK_PATH, blocking=False) as is_scheduler:
+        if not is_scheduler:
+            yield
+            return
+
+        # refreshes run in a separate process, so they do not hold the GIL while serving requests
+        # (the process is only started by the first refresh)
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        scheduler = RefreshScheduler(run_refresh, swap_serving_state, executor, interval,
+                                     trigger_path=REFRESH_TRIGGER_PATH, status_path=REFRESH_STATUS_PATH)
+        scheduler.start()
+        try:
+            yield
+        finally:
+            await scheduler.stop()
+            executor.shutdown(cancel_futures=True)
+            scheduler = None
+
+async def save_metrics_periodically(directory):
+    while True:
+        await asyncio.sleep(METRICS_SAVE_INTERVAL)
+        save_process_metrics(metrics, directory)
+
+@asynccontextmanager
+async def lifespan(app):
+    # with API_METRICS_DIR set (see gunicorn.conf.py), each worker saves its request metrics for /metrics
+    directory = metrics_utils.METRICS_DIR
+    saver = asyncio.get_running_loop().create_task(save_metrics_periodically(directory)) if directory else None
+    try:
+        async with refresh_scheduler():
+            yield
+    finally:
+        if saver is not None:
+            saver.cancel()
+            save_process_metrics(metrics, directory)
+
+app = FastAPI(lifespan=lifespan)
+
+# set API_TRACE_IDS=1 to return an X-Request-ID header with every response
+metrics = MetricsRegistry()
+app.add_middleware(MetricsMiddleware, registry=metrics, trace_ids=os.environ.get('API_TRACE_IDS') == '1')
+
+# these files are rewritten on each refresh, so they are reloaded when the file changes
+cached_files = {} # path -> (mtime, content)
+
+def load_cached_json(path, cache, transform):
+    if not os.path.exists(path):
+        return None
+
+    mtime = os.stat(path).st_mtime_ns
+    cached = cached_files.get(path)
+    metrics.observe_cache(cache, hit=cached is not None and cached[0] == mtime)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as file:
+            cached = cached_files[path] = (mtime, transform(json.load(file)))
+    return cached[1]
+
+def load_monitoring_report():
+    return load_cached_json(MONITORING_PATH, 'monitoring_report',
+                            lambda report: {key: value for key, value in report.items() if key != 'state'})
+
+def load_explanations(version):
+    # only the explanations of the loaded models are served
+    explanations = load_cached_json(EXPLANATIONS_PATH, 'explanations', lambda explanations: explanations['versions'])
+    return None if explanations is None else explanations.get(version)
+
+def negotiate(accept: str, accept_encoding: str) -> tuple[str, str]:
+    media_type = encoding_utils.negotiate_media_type(accept)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Available formats: {', '.join(encoding_utils.MEDIA_TYPES)}")
+    return media_type, encoding_utils.negotiate_encoding(accept_encoding)
+
+def encoded_response(body: bytes, media_type: str, encoding: str, etag: str = None) -> Response:
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    if etag is not None:
+        headers['ETag'] = etag
+    return Response(body, media_type=media_type, headers=headers)
+
+class PredictionRequest(BaseModel):
+    time_index: list[float]
+    features: list[dict[str, float]]
 
 @app.get('/')
 def root():
     return {'message': 'Blue Archive 6-month Forecast API'}
 
+# JSON by default, or MessagePack or Arrow IPC with the Accept header, compressed with gzip
+# or Brotli if the Accept-Encoding header allows. Each body is built once per forecast version.
+# async, so the cache metrics are updated on the event loop thread (see below)
 @app.get('/six_month_forecast')
-def get_six_month_forecast():
-    if six_month_forecast:
-        return six_month_forecast
+async def get_six_month_forecast(accept: str = Header(default=''), accept_encoding: str = Header(default=''),
+                                 if_none_match: str = Header(default='')):
+    current = await current_serving_async()
+    if not current.six_month_forecast:
+        raise HTTPException(status_code=404, detail="Six-month forecast data not found")
+
+    media_type, encoding = negotiate(accept, accept_encoding)
+
+    # the ETag changes with the forecast (not only the models), and is checked before any encoding
+    etag = f'"{current.forecast_bodies.version}-{media_type.rsplit("/", 1)[-1]}-{encoding}"'
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers={'ETag': etag, 'Vary': 'Accept, Accept-Encoding'})
+
+    body, body_encoding, hit = current.forecast_bodies.get(media_type, encoding)
+    metrics.observe_cache('forecast_bodies', hit=hit)
+    return encoded_response(body, media_type, body_encoding, etag)
+
+@app.post('/predict')
+def predict(request: PredictionRequest, accept: str = Header(default=''), accept_encoding: str = Header(default='')):
+    if len(request.time_index) != len(request.features):
+        raise HTTPException(status_code=400, detail="time_index and features must have the same length")
+
+    current = current_serving() # read once, so a refresh during this request cannot mix old and new models
+    trend_model, residual_model = current.trend_model, current.residual_model
+    try:
+        X = np.array([[row[name] for name in residual_model.feature_names] for row in request.features], dtype=np.float32)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Missing feature: {e.args[0]}")
+    X = X.reshape(len(request.features), len(residual_model.feature_names))
+
+    media_type, encoding = negotiate(accept, accept_encoding)
+    predictions = trend_model.predict(request.time_index) + residual_model.predict(X)
+    body, encoding = encoding_utils.compress(encoding_utils.encode({'predictions': predictions.tolist()}, media_type), encoding)
+    return encoded_response(body, media_type, encoding)
+
+# async, so these run on the event loop thread like MetricsMiddleware (metrics are not locked)
+@app.get('/monitoring')
+async def get_monitoring():
+    report = load_monitoring_report()
+    if report is None:
+        raise HTTPException(status_code=404, detail="Monitoring report not found")
+    return report
+
+@app.get('/explanations')
+async def get_explanations():
+    version = (await current_serving_async()).version
+    explanations = load_explanations(version)
+    if explanations is None:
+        raise HTTPException(status_code=404, detail="Explanations not found for the current model")
+    return {'model_version': version, **explanations}
+
+@app.get('/explanations/{month}')
+async def get_month_explanation(month: str):
+    version = (await current_serving_async()).version
+    explanations = load_explanations(version)
+    if explanations is None or month not in explanations['months']:
+        raise HTTPException(status_code=404, detail=f"Explanation not found for {month}")
+    return {'model_version': version, 'month': month, **explanations['months'][month]}
+
+@app.post('/refresh', status_code=202)
+async def trigger_refresh(x_refresh_token: str = Header(default='')):
+    # refreshes are only triggered with the API_REFRESH_TOKEN in the X-Refresh-Token header
+    token = os.environ.get('API_REFRESH_TOKEN')
+    if not token:
+        raise HTTPException(status_code=403, detail="Refreshes are disabled, set API_REFRESH_TOKEN to enable them")
+    if not hmac.compare_digest(x_refresh_token, token):
+        raise HTTPException(status_code=403, detail="Invalid refresh token")
+    if scheduler is not None:
+        return {'status': scheduler.trigger('webhook')}
+    if not scheduler_running():
+        raise HTTPException(status_code=503, detail="Refreshes are not running")
+    request_refresh('webhook', REFRESH_TRIGGER_PATH)
+    return {'status': 'requested'}
+
+@app.get('/refresh')
+async def get_refresh_status():
+    if scheduler is not None:
+        status = {'pending': scheduler.pending, **scheduler.status}
     else:
-        raise HTTPException(status_code=404, detail="Six-month forecast data not found")
\ No newline at end of file
+        status = read_status(REFRESH_STATUS_PATH) if scheduler_running() else None
+    if status is None:
+        raise HTTPException(status_code=503, detail="Refreshes are not running")
+    return {'model_version': (await current_serving_async()).version, **status}
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    # every worker's request metrics, when they are saved to API_METRICS_DIR
+    directory = metrics_utils.METRICS_DIR
+    text = (collect_metrics(metrics, directory) if directory else metrics).render()
+
+    report = load_monitoring_report()
+    if report is not None:
+        features = report['features']
+        text += render_gauges('forecast_monitoring_status', 'Status of the last refresh (1 for the current status).',
+                              {report['status']: 1}, label='status')
+        text += render_gauges('forecast_feature_psi', 'PSI of each feature since the reference.',
+                              {name: stats['psi'] for name, stats in features.items()}, label='feature')
+        text += render_gauges('forecast_feature_mean', 'Running mean of each feature.',
+                              {name: stats['mean'] for name, stats in features.items()}, label='feature')
+        text += render_gauges('forecast_feature_drift', 'Whether each feature has drifted (PSI above the threshold).',
+                              {name: stats['drift'] for name, stats in features.items()}, label='feature')
+
+    return PlainTextResponse(text, media_type='text/plain; version=0.0.4')
@@ -0,0 +1,41 @@
+'''
+Size and encoding time of forecast payloads in each response format and
+encoding of the API (encoding_utils), for the 6-month forecast and for
+larger per-scenario forecasts (the same 6 months under many scenarios).
+
+Formats whose package (msgpack, brotli) is not installed are skipped.
+
+Run from the root directory of this project:
+    python benchmarks/bench_encodings.py
+'''
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from utils import encoding_utils
+
+def make_payload(n_scenarios: int, rng) -> dict:
+    dates = [f'2025-{month:02d}' for month in range(8, 13)] + ['2026-01']
+    predictions = rng.lognormal(15.5, 0.5, size=(n_scenarios, len(dates)))
+    return {'scenario': np.repeat(np.arange(n_scenarios), len(dates)).tolist(),
+            'dates': dates * n_scenarios,
+            'predictions': predictions.ravel().tolist()}
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'scenarios':>9}  {'format':<38}{'encoding':<10}{'KB':>10}{'encode (ms)':>13}")
+    for n_scenarios in [1, 1000, 100_000]:
+        payload = make_payload(n_scenarios, rng)
+        number = max(1, 1000 // n_scenarios)
+        for media_type in encoding_utils.MEDIA_TYPES:
+            for encoding in encoding_utils.ENCODINGS:
+                def encode():
+                    return encoding_utils.compress(encoding_utils.encode(payload, media_type), encoding, best=True)
+                body, used = encode()
+                seconds = min(timeit.repeat(encode, number=number, repeat=3)) / number
+                print(f'{n_scenarios:>9}  {media_type:<38}{used:<10}{len(body) / 1024:>10.1f}{seconds * 1000:>13.2f}')
+
+if __name__ == '__main__':
+    main()
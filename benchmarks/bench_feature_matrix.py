@@ -0,0 +1,105 @@
+'''
+Memory and latency of passing the residual features to the models as
+float64 DataFrames vs as a float32 FeatureMatrix (matrix_utils), in batch
+scenario scoring (many what-if feature rows for the same forecast months)
+and in backtests (model_utils.backtest_XGB_residual_model).
+
+Larger datasets are made by repeating the residual features with noise.
+Memory is the peak of the allocations made while scoring (tracemalloc,
+which sees numpy's buffers but not xgboost's own), plus the size of the features.
+
+Run from the root directory of this project:
+    python benchmarks/bench_feature_matrix.py
+'''
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from utils import calendar_utils, inference_utils, model_utils
+from utils.matrix_utils import FeatureMatrix
+
+HORIZON = 6
+N_FOLDS = 4
+
+def make_data(n_copies: int, rng) -> tuple[pd.DataFrame, pd.Series]:
+    revenue = pd.read_pickle('data/fixtures/integration_testing/test_model_training/revenue.pkl')
+    revenue_2 = model_utils.create_XGB_features(revenue)
+    X = pd.concat([revenue_2.drop(columns=['JP'])] * n_copies, ignore_index=True)
+    X = X * rng.normal(1, 0.05, size=X.shape)
+    y = pd.concat([revenue_2['JP']] * n_copies, ignore_index=True) * rng.normal(1, 0.05, size=len(X))
+    return X, y
+
+def frame_nbytes(X: pd.DataFrame) -> int:
+    return int(X.memory_usage(index=False).sum())
+
+def best_time(func, repeat=5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def peak_memory(func) -> int:
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def score_scenarios(trend_model, residual_model, X, time_index) -> np.ndarray:
+    # every scenario forecasts the same HORIZON months, so the trend is computed once
+    trend_pred = trend_model.predict(time_index)
+    residual_pred = residual_model.predict(model_utils.residual_model_input(residual_model, X))
+    return residual_pred.reshape(-1, HORIZON) + trend_pred
+
+def scoring(rng):
+    X_train, y_train = make_data(1, rng)
+    xgb_model = model_utils.fit_XGB_residual_model(X_train, y_train, save=False)
+    compiled_model = inference_utils.export_residual_model(xgb_model, path=None)
+    trend_model = model_utils.fit_spline_trend_model(y_train, plot=False, save=False)
+
+    time_index = calendar_utils.get_trend_process(len(y_train)).out_of_sample(steps=HORIZON).to_numpy()
+
+    print('batch scenario scoring')
+    print(f"{'scenarios':>9}  {'model':<10}{'DataFrame (ms)':>16}{'matrix (ms)':>13}{'DataFrame (MB)':>16}{'matrix (MB)':>13}")
+    for n_scenarios in [1000, 10_000, 100_000]:
+        X, _ = make_data(n_scenarios * HORIZON // len(X_train) + 1, rng)
+        X = X.iloc[:n_scenarios * HORIZON]
+        X_matrix = FeatureMatrix.from_frame(X)
+        for name, model in [('xgboost', xgb_model), ('compiled', compiled_model)]:
+            frame_time = best_time(lambda: score_scenarios(trend_model, model, X, time_index))
+            matrix_time = best_time(lambda: score_scenarios(trend_model, model, X_matrix, time_index))
+            frame_memory = frame_nbytes(X) + peak_memory(lambda: score_scenarios(trend_model, model, X, time_index))
+            matrix_memory = X_matrix.nbytes + peak_memory(lambda: score_scenarios(trend_model, model, X_matrix, time_index))
+            print(f'{n_scenarios:>9}  {name:<10}{frame_time * 1000:>16.2f}{matrix_time * 1000:>13.2f}'
+                  f'{frame_memory / 1e6:>16.1f}{matrix_memory / 1e6:>13.1f}')
+
+def backtests(rng):
+    print()
+    print(f'backtests ({N_FOLDS} folds, building the training matrix each time)')
+    print(f"{'rows':>9}  {'DataFrame (ms)':>16}{'matrix (ms)':>13}{'DataFrame (MB)':>16}{'matrix (MB)':>13}")
+    for n_copies in [1, 100, 1000]:
+        X, y = make_data(n_copies, rng)
+        X_matrix = FeatureMatrix.from_frame(X)
+        horizon = HORIZON * n_copies
+        frame_time = best_time(lambda: model_utils.backtest_XGB_residual_model(X, y, horizon, N_FOLDS), repeat=3)
+        matrix_time = best_time(lambda: model_utils.backtest_XGB_residual_model(X_matrix, y, horizon, N_FOLDS), repeat=3)
+        frame_memory = frame_nbytes(X) + peak_memory(lambda: model_utils.backtest_XGB_residual_model(X, y, horizon, N_FOLDS))
+        matrix_memory = X_matrix.nbytes + peak_memory(lambda: model_utils.backtest_XGB_residual_model(X_matrix, y, horizon, N_FOLDS))
+        print(f'{len(X):>9}  {frame_time * 1000:>16.1f}{matrix_time * 1000:>13.1f}'
+              f'{frame_memory / 1e6:>16.1f}{matrix_memory / 1e6:>13.1f}')
+
+def main():
+    warnings.filterwarnings('ignore', message='X has feature names') # the spline is fit on an array
+    rng = np.random.default_rng(0)
+    scoring(rng)
+    backtests(rng)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Training and inference time: one spline-free XGB model per series vs one
+global model (global_model_utils) over all series.
+
+The series are copies of the JP revenue with a random scale and noise.
+
+Run from the root directory of this project:
+    python benchmarks/bench_global_model.py
+'''
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+import utils.global_model_utils as global_model_utils
+import utils.model_utils as model_utils
+
+HORIZON = 6
+
+def make_panel(revenue: pd.DataFrame, n_series: int, rng) -> pd.DataFrame:
+    scales = rng.lognormal(0, 1, size=n_series)
+    noise = rng.normal(1, 0.1, size=(n_series, len(revenue)))
+    series = [revenue.assign(series=f'title_{i}', revenue=revenue['JP'] * scales[i] * noise[i]) for i in range(n_series)]
+    return pd.concat(series, ignore_index=True).drop(columns=['JP'])
+
+def per_series(panel: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    for _, series in panel.groupby('series', sort=False):
+        revenue_2 = model_utils.create_XGB_features(series.drop(columns=['series']).rename(columns={'revenue': 'JP'}))
+        X_train, X_test = revenue_2.iloc[:-HORIZON].drop(columns=['JP']), revenue_2.iloc[-HORIZON:].drop(columns=['JP'])
+        xgb_model = model_utils.fit_XGB_residual_model(X_train, revenue_2['JP'].iloc[:-HORIZON], save=False)
+        xgb_model.predict(X_test)
+    return time.perf_counter() - start
+
+def global_model(panel: pd.DataFrame, train_end) -> float:
+    start = time.perf_counter()
+    features, scales = global_model_utils.create_global_features(panel, train_end=train_end)
+    is_train = features['Date'] <= train_end
+    model = global_model_utils.fit_global_model(features[is_train])
+    global_model_utils.predict_global_model(model, features[~is_train], scales)
+    return time.perf_counter() - start
+
+def main():
+    revenue = pd.read_pickle('data/fixtures/integration_testing/test_model_training/revenue.pkl')
+    train_end = revenue['Date'].iloc[-HORIZON - 1]
+    rng = np.random.default_rng(0)
+
+    print(f"{'series':>8}{'per-series (s)':>16}{'global (s)':>12}{'speedup':>10}")
+    for n_series in [1, 4, 16, 64, 256]:
+        panel = make_panel(revenue, n_series, rng)
+        per_series_time = min(per_series(panel) for _ in range(3))
+        global_time = min(global_model(panel, train_end) for _ in range(3))
+        print(f'{n_series:>8}{per_series_time:>16.3f}{global_time:>12.3f}{per_series_time / global_time:>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Latency benchmark: joblib (xgboost + sklearn) models vs the exported numpy models.
+
+Run from the root directory of this project:
+    python benchmarks/bench_inference.py
+'''
+import subprocess
+import sys
+import timeit
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+import utils.inference_utils as inference_utils
+
+def time_per_call(func, number=200) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+def time_import(statement: str) -> float:
+    code = f'import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)'
+    return float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout)
+
+def main():
+    trend_model = joblib.load('data/saved_models/trend_model.joblib')
+    xgb_model = joblib.load('data/saved_models/xgb_residual_model.joblib')
+    trend = inference_utils.PiecewiseLinearTrend.load()
+    compiled_model = inference_utils.CompiledResidualModel.load()
+
+    print(f"{'import':<28}{'seconds':>12}")
+    print(f"{'xgboost + sklearn':<28}{time_import('import xgboost, sklearn.pipeline'):>12.3f}")
+    print(f"{'utils.inference_utils':<28}{time_import('import utils.inference_utils'):>12.3f}")
+    print()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8}{'joblib (us)':>16}{'compiled (us)':>16}{'speedup':>10}")
+    for n_rows in [6, 100, 10_000]:
+        X = pd.DataFrame(rng.normal(size=(n_rows, len(compiled_model.feature_names))), columns=compiled_model.feature_names)
+        time_index = np.arange(46, 46 + n_rows, dtype=float).reshape(-1, 1)
+
+        number = max(1, 2000 // n_rows)
+        original = time_per_call(lambda: trend_model.predict(time_index) + xgb_model.predict(X), number)
+        compiled = time_per_call(lambda: trend.predict(time_index) + compiled_model.predict(X), number)
+        print(f'{n_rows:>8}{original * 1e6:>16.1f}{compiled * 1e6:>16.1f}{original / compiled:>9.1f}x')
+    print()
+
+    print(f"{'trend scenarios x horizons':<28}{'sklearn (us)':>14}{'closed-form (us)':>18}{'speedup':>10}")
+    for n_scenarios, n_horizons in [(1, 6), (1000, 6), (1000, 120)]:
+        time_index = np.arange(30, 30 + n_scenarios).reshape(-1, 1) + np.arange(1, n_horizons + 1)
+
+        number = max(1, 20_000 // time_index.size)
+        original = time_per_call(lambda: trend_model.predict(time_index.reshape(-1, 1)).reshape(time_index.shape), number)
+        compiled = time_per_call(lambda: trend.evaluate(time_index), number)
+        print(f"{f'{n_scenarios} x {n_horizons}':<28}{original * 1e6:>14.1f}{compiled * 1e6:>18.1f}{original / compiled:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''
+Overhead of MetricsMiddleware per request.
+
+The middleware wraps a minimal ASGI app that responds immediately, and is
+called directly (no server or network), so the difference in time per
+request is the cost of the middleware alone.
+
+Run from the root directory of this project:
+    python benchmarks/bench_metrics.py
+'''
+import asyncio
+import sys
+from time import perf_counter
+
+sys.path.insert(0, '.')
+from utils.metrics_utils import MetricsMiddleware, MetricsRegistry
+
+N_REQUESTS = 50_000
+
+class Route:
+    path = '/six_month_forecast'
+
+async def forecast_app(scope, receive, send):
+    scope['route'] = Route # set by the router in FastAPI
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': b'{"dates":["2025-08"],"predictions":[11060935.997246603]}'})
+
+async def time_requests(app) -> float:
+    scope = {'type': 'http', 'method': 'GET', 'path': '/six_month_forecast', 'headers': []}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    start = perf_counter()
+    for _ in range(N_REQUESTS):
+        await app(dict(scope), receive, send)
+    return (perf_counter() - start) / N_REQUESTS
+
+def main():
+    apps = {'no middleware': forecast_app,
+            'metrics': MetricsMiddleware(forecast_app, MetricsRegistry()),
+            'metrics + trace ids': MetricsMiddleware(forecast_app, MetricsRegistry(), trace_ids=True)}
+
+    # interleave the runs and keep the fastest, to reduce noise
+    results = {name: float('inf') for name in apps}
+    for _ in range(7):
+        for name, app in apps.items():
+            results[name] = min(results[name], asyncio.run(time_requests(app)))
+
+    print(f"{'':<24}{'us/request':>12}{'overhead (us)':>16}")
+    for name, seconds in results.items():
+        print(f"{name:<24}{seconds * 1e6:>12.2f}{(seconds - results['no middleware']) * 1e6:>16.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+'''
+Benchmarks of every stage of the pipeline, with pytest-benchmark, at the
+size of the real data and at 10x and 100x that size.
+
+The larger datasets repeat the real data further back in time: 10x has
+10 times as many months of revenue, banners and events. (So they start
+before the cached calendar of calendar_utils, and the Fourier terms are
+computed on the fly.)
+
+Run from the root directory of this project with run_benchmarks.py, which
+saves the results in benchmarks/results/ and fails if a stage got slower
+than the last saved run:
+    python benchmarks/run_benchmarks.py
+
+Or run them directly, e.g. only at the real size:
+    BENCH_SCALES=1 pytest benchmarks/bench_pipeline.py
+'''
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, '.')
+from utils import cache_utils, cleaning_utils, dataloader_utils, df_utils, model_utils
+import utils.calendar_utils as calendar_utils
+
+# time the functions themselves, not their memoized results
+cache_utils.CACHE_ENABLED = False
+
+SCALES = [int(scale) for scale in os.environ.get('BENCH_SCALES', '1,10,100').split(',')]
+ROUNDS = {1: 20, 10: 5, 100: 1} # fewer rounds for the slow, large sizes
+HORIZON = 6
+N_MONTHS = 45 # months of real revenue
+
+def run(benchmark, scale, func, *args, setup=None, **kwargs):
+    # setup gives fresh arguments for each round, e.g. for functions that cache per table
+    rounds = ROUNDS.get(scale, 1)
+    warmup_rounds = 1 if scale <= 10 else 0
+    if setup is not None:
+        return benchmark.pedantic(func, setup=lambda: (setup(), {}), rounds=rounds, warmup_rounds=warmup_rounds)
+    return benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=rounds, warmup_rounds=warmup_rounds)
+
+def scaled_dates(n_months: int) -> pd.DatetimeIndex:
+    # ends at the last real month, unless that would go before pandas' earliest date
+    end = pd.Timestamp('2025-07-01')
+    if n_months > 12 * (end.year - 1700):
+        return pd.date_range(start='1700-01-01', periods=n_months, freq='MS')
+    return pd.date_range(end=end, periods=n_months, freq='MS')
+
+def tile_rows(df: pd.DataFrame, scale: int, date_cols: list, months: int = N_MONTHS) -> pd.DataFrame:
+    # copy i is moved back by i blocks of months, so it lands in the extended history
+    last_date = scaled_dates(months * scale)[-1]
+    end_shift = (last_date.year - 2025) * 12 + last_date.month - 7
+    copies = []
+    for i in range(scale):
+        copy = df.copy()
+        for col in date_cols:
+            copy[col] = copy[col] + pd.DateOffset(months=end_shift - months * i)
+        copies.append(copy)
+    return pd.concat(copies, ignore_index=True)
+
+def tile_revenue(revenue: pd.DataFrame, scale: int) -> pd.DataFrame:
+    revenue = pd.concat([revenue] * scale, ignore_index=True)
+    revenue['Date'] = scaled_dates(len(revenue))
+    return revenue
+
+@pytest.fixture(scope='module', params=SCALES, ids=lambda scale: f'{scale}x')
+def data(request, tmp_path_factory):
+    scale = request.param
+    root = tmp_path_factory.mktemp(f'data_{scale}x')
+    (root / 'data' / 'fixtures').mkdir(parents=True)
+
+    # workbooks and fixtures in a copy of the data/ layout, for the loaders
+    for name, usecols in [('reddit-monthly-revenue-report', 3), ('revenue-ennead-cc-revenue-report', None)]:
+        workbook = pd.read_excel(f'./data/{name}.xlsx', engine='openpyxl')
+        workbook = workbook.iloc[:, :usecols] if usecols else workbook
+        pd.concat([workbook] * scale, ignore_index=True).to_excel(root / 'data' / f'{name}.xlsx', index=False)
+
+    banners = {}
+    for region in ['en', 'jp']:
+        region_banners = tile_rows(pd.read_pickle(f'./data/fixtures/all_banners_{region}.pkl'), scale, ['startAt', 'endAt'])
+        region_banners['id'] += np.repeat(np.arange(scale), len(region_banners) // scale) * 1_000_000
+        region_banners.to_pickle(root / 'data' / 'fixtures' / f'all_banners_{region}.pkl')
+        banners[region] = region_banners
+
+    _, event_jp = dataloader_utils.load_events()
+    event_jp = tile_rows(event_jp, scale, ['Start date', 'End date'])
+    copy_number = np.repeat(np.arange(scale), len(event_jp) // scale)
+    event_jp['Name (EN)'] = event_jp['Name (EN)'] + np.where(copy_number > 0, ' #' + copy_number.astype(str), '')
+
+    revenue = tile_revenue(dataloader_utils.load_revenue(), scale)
+    revenue = cleaning_utils.drop_global_data_from_revenue(revenue)
+    model_revenue = tile_revenue(pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb')), scale)
+
+    return {'scale': scale, 'root': root, 'banners_jp': banners['jp'], 'event_jp': event_jp,
+            'revenue': revenue, 'model_revenue': model_revenue}
+
+@pytest.fixture(scope='module')
+def models(data):
+    model_revenue = data['model_revenue']
+    X_train, y_train, X_test, y_test = model_utils.prepare_train_test_split(model_revenue)
+    dp = calendar_utils.get_trend_process(len(y_train))
+    trend_model = model_utils.fit_spline_trend_model(y_train, plot=False, save=False)
+
+    revenue_2 = model_utils.create_XGB_features(model_revenue)
+    X_train2 = revenue_2.iloc[:-HORIZON].drop(columns=['JP'])
+    X_test2 = revenue_2.iloc[-HORIZON:].drop(columns=['JP'])
+    y_train2 = (y_train - trend_model.predict(dp.in_sample())).loc[X_train2.index]
+    xgb_model = model_utils.fit_XGB_residual_model(X_train2, y_train2, save=False)
+    return {'y_train': y_train, 'dp': dp, 'trend_model': trend_model, 'xgb_model': xgb_model,
+            'X_train2': X_train2, 'y_train2': y_train2, 'X_test2': X_test2}
+
+def test_excel_load(benchmark, data, monkeypatch):
+    monkeypatch.chdir(data['root'])
+    revenue = run(benchmark, data['scale'], dataloader_utils.load_revenue)
+    assert len(revenue) == (45 + 9) * data['scale']
+
+def test_banner_fixture_load(benchmark, data, monkeypatch):
+    monkeypatch.chdir(data['root'])
+    def no_api(*args, **kwargs):
+        raise ConnectionError('benchmarking the fixtures')
+    monkeypatch.setattr(dataloader_utils.requests, 'get', no_api)
+
+    banners_en, banners_jp = run(benchmark, data['scale'], dataloader_utils.load_banners)
+    assert len(banners_jp) == len(data['banners_jp'])
+
+def test_cleaning(benchmark, data):
+    # a fresh copy each round, like a newly loaded events table
+    event_jp = run(benchmark, data['scale'], cleaning_utils.clean_event_data, setup=lambda: (data['event_jp'].copy(),))
+    assert event_jp['Notes'].notna().all()
+
+def test_fourier_features(benchmark, data):
+    revenue = run(benchmark, data['scale'], df_utils.create_fourier_features, data['revenue'])
+    assert len(revenue) == len(data['revenue'])
+
+def test_monthly_banner_count(benchmark, data):
+    pickup_banners = data['banners_jp'][data['banners_jp']['gachaType'] == 'PickupGacha']
+    monthly_count = run(benchmark, data['scale'], df_utils.group_into_monthly_count, pickup_banners, data['revenue'])
+    assert len(monthly_count) == len(data['revenue'])
+
+def test_monthly_banner_types(benchmark, data):
+    revenue = run(benchmark, data['scale'], df_utils.group_banner_types_into_monthly_count,
+                  {'jp': data['banners_jp']}, data['revenue'], coverage=True)
+    assert len(revenue) == len(data['revenue'])
+
+def test_monthly_event_count(benchmark, data):
+    event_jp = cleaning_utils.clean_event_data(data['event_jp'])
+    revenue = run(benchmark, data['scale'], df_utils.group_event_types_into_monthly_count,
+                  setup=lambda: (event_jp.copy(), data['revenue']))
+    assert len(revenue) == len(data['revenue'])
+
+def test_create_XGB_features(benchmark, data):
+    revenue_2 = run(benchmark, data['scale'], model_utils.create_XGB_features, data['model_revenue'])
+    assert len(revenue_2) == len(data['model_revenue']) - 6
+
+def test_spline_fit(benchmark, data, models):
+    run(benchmark, data['scale'], model_utils.fit_spline_trend_model, models['y_train'], 7, False, False)
+
+def test_XGB_fit(benchmark, data, models):
+    run(benchmark, data['scale'], model_utils.fit_XGB_residual_model, models['X_train2'], models['y_train2'], False)
+
+def test_final_prediction(benchmark, data, models):
+    final_pred = run(benchmark, data['scale'], model_utils.final_prediction,
+                     models['trend_model'], models['xgb_model'], models['X_test2'], models['dp'])
+    assert len(final_pred) == HORIZON
+
+@pytest.fixture(scope='module')
+def client():
+    from fastapi.testclient import TestClient
+    import api
+    return TestClient(api.app), api.serving.residual_model.feature_names
+
+def test_api_forecast(benchmark, client, data):
+    if data['scale'] != 1:
+        pytest.skip('the forecast response does not depend on the data size')
+    test_client, _ = client
+    response = run(benchmark, 1, test_client.get, '/six_month_forecast')
+    assert response.status_code == 200
+
+def test_api_predict(benchmark, client, data):
+    test_client, feature_names = client
+    n_rows = HORIZON * data['scale']
+    body = {'time_index': list(range(40, 40 + n_rows)), 'features': [dict.fromkeys(feature_names, 1.0)] * n_rows}
+    response = run(benchmark, data['scale'], test_client.post, '/predict', json=body)
+    assert response.status_code == 200
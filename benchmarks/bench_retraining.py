@@ -0,0 +1,60 @@
+'''
+Monthly retraining: a full refit every month vs incremental updates
+(model_utils.retrain_models), with a full refit every 6 months or never.
+
+Each retrain adds one month and forecasts the next 6 months, and the
+forecasts are scored against the actual revenue (mean absolute percentage
+error). The longer histories are synthetic (synthetic_utils.generate_revenue).
+
+Run from the root directory of this project:
+    python benchmarks/bench_retraining.py
+'''
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from utils import calendar_utils, cleaning_utils, df_utils, model_utils, synthetic_utils
+
+HORIZON = 6
+N_RETRAINS = 12
+SCHEDULES = {'full': 0, 'incremental (refit every 6)': 6, 'incremental only': N_RETRAINS}
+
+def make_revenue(n_months: int) -> pd.DataFrame:
+    if n_months == 45:
+        return pd.read_pickle('data/fixtures/integration_testing/test_model_training/revenue.pkl')
+    revenue = synthetic_utils.generate_revenue(n_months, seed=0)
+    return df_utils.create_fourier_features(cleaning_utils.drop_global_data_from_revenue(revenue))
+
+def simulate(revenue: pd.DataFrame, full_refit_every: int) -> tuple[float, float]:
+    # mean seconds per retrain (after the first full fit) and mean absolute forecast error, in %
+    y = revenue['JP']
+    revenue_2 = model_utils.create_XGB_features(revenue, errors='ignore') # the synthetic revenue has no banner or event counts
+    first = len(y) - HORIZON - N_RETRAINS
+
+    state = model_utils.retrain_models(y.iloc[:first], revenue_2)
+    errors = []
+    for n_train in range(first + 1, first + N_RETRAINS + 1):
+        state = model_utils.retrain_models(y.iloc[:n_train], revenue_2, state, full_refit_every)
+        X_forecast = revenue_2.loc[n_train:n_train + HORIZON - 1].drop(columns=['JP'])
+        forecast = model_utils.final_prediction(state['trend_model'], state['xgb_model'], X_forecast,
+                                                calendar_utils.get_trend_process(n_train))
+        actual = y.loc[X_forecast.index].to_numpy()
+        errors.append(np.mean(np.abs(forecast - actual) / actual) * 100)
+    seconds = np.mean([entry['seconds'] for entry in state['history'][1:]])
+    return seconds, np.mean(errors)
+
+def main():
+    warnings.filterwarnings('ignore', message='X has feature names') # the spline is fit on an array
+    print(f'{N_RETRAINS} monthly retrains, forecasting {HORIZON} months after each')
+    print(f"{'months':>7}  {'schedule':<28}{'ms / retrain':>13}{'forecast error':>16}")
+    for n_months in [45, 240, 1200]:
+        revenue = make_revenue(n_months)
+        for name, full_refit_every in SCHEDULES.items():
+            seconds, error = simulate(revenue, full_refit_every)
+            print(f'{n_months:>7}  {name:<28}{seconds * 1000:>13.1f}{error:>15.1f}%')
+
+if __name__ == '__main__':
+    main()
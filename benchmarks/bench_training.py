@@ -0,0 +1,66 @@
+'''
+Backtest and tuning time: fit_XGB_residual_model (the sklearn wrapper builds
+a new matrix for every fit) vs one DMatrix sliced by
+fit_XGB_residual_booster for each fold and trial.
+
+Larger datasets are made by repeating the residual features with noise.
+
+Run from the root directory of this project:
+    python benchmarks/bench_training.py
+'''
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+import utils.model_utils as model_utils
+
+HORIZON = 6
+N_FOLDS = 4
+TRIALS = [{'max_depth': depth, 'learning_rate': rate} for depth in [3, 6] for rate in [0.05, 0.1]]
+
+def make_data(n_copies: int, rng) -> tuple[pd.DataFrame, pd.Series]:
+    revenue = pd.read_pickle('data/fixtures/integration_testing/test_model_training/revenue.pkl')
+    revenue_2 = model_utils.create_XGB_features(revenue)
+    X = pd.concat([revenue_2.drop(columns=['JP'])] * n_copies, ignore_index=True)
+    X = X * rng.normal(1, 0.05, size=X.shape)
+    y = pd.concat([revenue_2['JP']] * n_copies, ignore_index=True) * rng.normal(1, 0.05, size=len(X))
+    return X, y
+
+def with_wrapper(X, y, horizon):
+    for trial in TRIALS:
+        for fold in range(N_FOLDS):
+            test_start = len(X) - (N_FOLDS - fold) * horizon
+            xgb_model = model_utils.XGBRegressor(n_estimators=model_utils.XGB_RESIDUAL_ROUNDS, **trial)
+            xgb_model.fit(X.iloc[:test_start], y.iloc[:test_start])
+            xgb_model.predict(X.iloc[test_start:test_start + horizon])
+
+def with_reuse(X, y, horizon, nthread):
+    dtrain = model_utils.make_residual_dmatrix(X, y, nthread=nthread)
+    for trial in TRIALS:
+        model_utils.backtest_XGB_residual_model(X, y, horizon, N_FOLDS, params={**trial, 'nthread': nthread}, dtrain=dtrain)
+
+def best_time(func, repeat=3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f'{model_utils.available_threads()} CPUs available, {len(TRIALS)} trials x {N_FOLDS} folds')
+    print(f"{'rows':>8}{'nthread':>9}{'wrapper (s)':>13}{'reused (s)':>12}{'speedup':>10}")
+    for n_copies in [1, 100, 1000]:
+        X, y = make_data(n_copies, rng)
+        horizon = HORIZON * n_copies
+        nthread = model_utils.tune_nthread(model_utils.make_residual_dmatrix(X, y))
+        wrapper_time = best_time(lambda: with_wrapper(X, y, horizon))
+        reuse_time = best_time(lambda: with_reuse(X, y, horizon, nthread))
+        print(f'{len(X):>8}{nthread:>9}{wrapper_time:>13.3f}{reuse_time:>12.3f}{wrapper_time / reuse_time:>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Memory and throughput of the API served by gunicorn (gunicorn.conf.py)
+with 1, 2, 4 and 8 workers, with and without preloading. Linux only, since memory is read from /proc.
+
+Throughput only scales with workers if there are spare CPU cores
+(the clients run on the same machine).
+
+RSS counts shared pages once per process, so it grows with every worker
+even when the pages are shared. PSS splits shared pages between the
+processes sharing them, so its total is the real memory used.
+
+Run from the root directory of this project:
+    python benchmarks/bench_workers.py
+'''
+from concurrent.futures import ProcessPoolExecutor
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+HOST, PORT = '127.0.0.1', 8765
+N_CLIENTS = 8 # client processes
+DURATION = 5 # seconds of load per configuration
+
+def memory_kb(pid: int) -> tuple[int, int]:
+    rss = pss = 0
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        for line in file:
+            if line.startswith('Rss:'):
+                rss = int(line.split()[1])
+            elif line.startswith('Pss:'):
+                pss = int(line.split()[1])
+    return rss, pss
+
+def children(pid: int) -> list[int]:
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return [int(child) for child in file.read().split()]
+
+def wait_until_ready(n_workers: int, master_pid: int, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(HOST, PORT, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            if len(children(master_pid)) == n_workers:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError('gunicorn did not start')
+
+def client(deadline: float) -> int:
+    connection = http.client.HTTPConnection(HOST, PORT)
+    n_requests = 0
+    while time.time() < deadline:
+        connection.request('GET', '/six_month_forecast')
+        connection.getresponse().read()
+        n_requests += 1
+    return n_requests
+
+def main():
+    print(f"{'preload':>8}{'workers':>8}{'RSS (MB)':>12}{'PSS (MB)':>12}{'PSS/worker':>12}{'req/s':>10}")
+    for preload, n_workers in [(preload, n_workers) for preload in ['1', '0'] for n_workers in [1, 2, 4, 8]]:
+        env = {**os.environ, 'API_WORKERS': str(n_workers), 'API_BIND': f'{HOST}:{PORT}', 'API_PRELOAD': preload}
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'api:app', '-c', 'gunicorn.conf.py'],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(n_workers, server.pid)
+
+            deadline = time.time() + DURATION
+            with ProcessPoolExecutor(N_CLIENTS) as executor:
+                n_requests = sum(executor.map(client, [deadline] * N_CLIENTS))
+
+            # measured after the load, once the workers have handled requests
+            rss, pss = map(sum, zip(*[memory_kb(pid) for pid in [server.pid] + children(server.pid)]))
+            print(f'{preload:>8}{n_workers:>8}{rss / 1024:>12.1f}{pss / 1024:>12.1f}{pss / 1024 / n_workers:>12.1f}{n_requests / DURATION:>10.0f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+'''
+Runs the pipeline benchmarks (bench_pipeline.py), saves the results in
+benchmarks/results/, and fails if any stage is slower than in the last
+saved run by more than the threshold.
+
+Runs that fail are not saved, so a regression cannot become the new baseline.
+
+Run from the root directory of this project:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --threshold 10 --scales 1,10
+'''
+import argparse
+import glob
+import os
+import sys
+
+import pytest
+
+STORAGE = 'benchmarks/results'
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threshold', type=float, default=25, help='allowed slowdown of the minimum time, in percent (default 25)')
+    parser.add_argument('--scales', default='1,10,100', help='data sizes to run, as multiples of the real data (default 1,10,100)')
+    args, pytest_args = parser.parse_known_args()
+
+    os.environ['BENCH_SCALES'] = args.scales
+    saved_runs = set(glob.glob(f'{STORAGE}/**/*.json', recursive=True))
+
+    options = ['benchmarks/bench_pipeline.py', '-p', 'no:cacheprovider',
+               f'--benchmark-storage=file://{STORAGE}', '--benchmark-autosave',
+               '--benchmark-columns=min,median,max,rounds', '--benchmark-sort=name']
+    if saved_runs:
+        options += ['--benchmark-compare', f'--benchmark-compare-fail=min:{args.threshold:g}%']
+
+    try:
+        exit_code = int(pytest.main(options + pytest_args))
+    except Exception as e: # pytest-benchmark raises PerformanceRegression after the session
+        print(e)
+        exit_code = 1
+
+    if exit_code != 0:
+        for path in set(glob.glob(f'{STORAGE}/**/*.json', recursive=True)) - saved_runs:
+            os.remove(path)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+# Production serving mode for the API:
+#   gunicorn api:app -c gunicorn.conf.py
+#
+# The app (forecast, models and monitoring report) is loaded once in the parent
+# process before the workers are forked, so the workers share those pages with
+# the parent (copy-on-write) instead of each loading their own copy.
+# Each worker saves its request metrics to API_METRICS_DIR, and /metrics adds up
+# those of every worker (see metrics_utils.collect_metrics).
+import gc
+import glob
+import os
+import tempfile
+
+bind = os.environ.get('API_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('API_WORKERS', '4'))
+worker_class = 'uvicorn_worker.UvicornWorker'
+preload_app = os.environ.get('API_PRELOAD', '1') == '1' # API_PRELOAD=0 to compare without it
+
+# set before the app is loaded, so metrics_utils.METRICS_DIR sees it
+os.environ.setdefault('API_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'forecast-api-metrics'))
+
+def on_starting(server):
+    # the metrics of a previous run are not added to this one
+    directory = os.environ['API_METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+def when_ready(server):
+    # Move everything loaded so far out of the garbage collector's generations.
+    # Otherwise the first collection in each worker writes to every object header,
+    # which copies the shared pages into each worker.
+    gc.freeze()
+
+def child_exit(server, worker):
+    # keep the counts of exited workers, so the totals never go down
+    from utils import metrics_utils
+    metrics_utils.mark_process_dead(worker.pid, os.environ['API_METRICS_DIR'])
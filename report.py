@@ -0,0 +1,38 @@
+'''
+Generates the analysis report (the figures and metrics of analysis.ipynb)
+as static PNG files and an index.html page, without running the notebook.
+
+Figures are rendered in parallel worker processes, and figures whose
+inputs have not changed since the last run are skipped.
+
+Run from the root directory of this project:
+    python report.py [--out data/results/report] [--workers N] [--force]
+'''
+import argparse
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+
+from utils import report_utils
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Generate the analysis report as HTML and PNG files.')
+    parser.add_argument('--out', default=report_utils.REPORT_DIR, help='where to write the report')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: one per CPU, 0: no workers)')
+    parser.add_argument('--force', action='store_true', help='render every figure, even unchanged ones')
+    parser.add_argument('--horizon', type=int, default=6, help='number of test months')
+    args = parser.parse_args(argv)
+
+    result = report_utils.generate_report(args.out, args.workers, args.force, args.horizon)
+    print(f"rendered {len(result['rendered'])} figures, skipped {len(result['skipped'])} unchanged")
+    for name, seconds in result['seconds'].items():
+        print(f'  {name:<24}{seconds:>8.2f}s')
+    for name, error in result['failed'].items():
+        print(f'  {name:<24}failed: {error}', file=sys.stderr)
+    print(f"report: {result['html']}")
+    return 1 if result['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -100,7 +100,7 @@ def test_model_training():
     y_train2 = train_residuals.iloc[X_train2.index]
     y_test2 = test_residuals
 
-    xgb_model = model_utils.fit_XGB_residual_model(X_train2, y_train2)
+    xgb_model = model_utils.fit_XGB_residual_model(X_train2, y_train2, save=False)
 
     final_pred = model_utils.final_prediction(trend_model, xgb_model, X_test2, dp)
 
@@ -0,0 +1,22 @@
+import pickle
+
+import numpy as np
+import pytest
+import utils.model_utils as model_utils
+
+@pytest.fixture(scope='session')
+def fitted_models():
+    '''
+    The trend and residual models fit on all but the last 6 months of the fixture revenue, 
+    with the residual features of the train and test months and the trend index of the test months.
+    '''
+    revenue = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    X_train, y_train, X_test, y_test = model_utils.prepare_train_test_split(revenue)
+    trend_model = model_utils.fit_spline_trend_model(y_train, plot=False, save=False)
+
+    revenue_2 = model_utils.create_XGB_features(revenue)
+    X_train2 = revenue_2.iloc[:-6].drop(columns=['JP'])
+    X_test2 = revenue_2.iloc[-6:].drop(columns=['JP'])
+    xgb_model = model_utils.fit_XGB_residual_model(X_train2, y_train.loc[X_train2.index], save=False)
+    time_index = np.arange(len(y_train) + 1, len(y_train) + 7).reshape(-1, 1)
+    return trend_model, xgb_model, X_train2, X_test2, time_index
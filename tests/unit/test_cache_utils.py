@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import utils.cache_utils as cache_utils
+
+def make_df():
+    return pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=4, freq='MS'),
+                         'JP': [1.0, 2.0, 3.0, 4.0],
+                         'Notes': ['a', None, 'b', 'a'],
+                         'rateups': [['x'], ['y', 'z'], [], ['x']]})
+
+def test_fingerprint_depends_on_content_only():
+    df = make_df()
+    assert cache_utils.fingerprint(df) == cache_utils.fingerprint(make_df())
+    assert cache_utils.fingerprint(df, 1) != cache_utils.fingerprint(df, 2)
+
+    changed = [df.assign(JP=df['JP'] + [0, 0, 0, 1e-9]),
+               df.assign(JP=df['JP'].astype('float32')),
+               df.rename(columns={'JP': 'Global'}),
+               df.set_axis([1, 2, 3, 4]),
+               df.assign(Notes=['a', None, 'b', 'c']),
+               df.assign(rateups=[['x'], ['y', 'z'], [], ['y']]),
+               df.iloc[::-1]]
+    fingerprints = {cache_utils.fingerprint(other) for other in changed}
+    assert len(fingerprints) == len(changed) and cache_utils.fingerprint(df) not in fingerprints
+
+    # mixed object columns are not hashed as strings
+    assert cache_utils.fingerprint(pd.Series([1, 'a'], dtype=object)) != cache_utils.fingerprint(pd.Series(['1', 'a'], dtype=object))
+
+def test_memoize_returns_copies_and_counts_hits(monkeypatch):
+    monkeypatch.setattr(cache_utils, 'CACHE_DIR', None)
+    calls = []
+
+    @cache_utils.memoize(maxsize=2)
+    def double(df, factor=2):
+        calls.append(1)
+        return df.assign(JP=df['JP'] * (factor() if callable(factor) else factor))
+
+    df = make_df()
+    first = double(df)
+    first.loc[0, 'JP'] = -1 # callers can modify the result
+    pd.testing.assert_frame_equal(double(make_df()), df.assign(JP=df['JP'] * 2))
+    assert len(calls) == 1
+
+    double(df, factor=3)
+    double(df.assign(JP=0.0))
+    double(df) # evicted by the two calls above
+    assert len(calls) == 4
+    assert double.cache_info() == {'hits': 1, 'disk_hits': 0, 'misses': 4, 'uncacheable': 0, 'maxsize': 2, 'currsize': 2}
+
+    double(df, factor=lambda: 2) # not picklable, so not cached
+    assert double.cache_info()['uncacheable'] == 1
+    assert 'test_cache_utils.test_memoize_returns_copies_and_counts_hits.<locals>.double' in cache_utils.cache_report().index[-1]
+
+def test_memoize_disk_tier(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache_utils, 'CACHE_DIR', str(tmp_path))
+    calls = []
+
+    @cache_utils.memoize()
+    def total(df):
+        calls.append(1)
+        return {'total': df['JP'].sum(), 'rows': np.arange(len(df))}
+
+    assert total(make_df())['total'] == 10.0
+    total.cache_clear() # like a new session
+    result = total(make_df())
+
+    assert len(calls) == 1 and len(list(tmp_path.glob('*.pkl'))) == 1
+    assert total.cache_info()['disk_hits'] == 1
+    np.testing.assert_array_equal(result['rows'], np.arange(4))
+
+    monkeypatch.setattr(cache_utils, 'CACHE_ENABLED', False)
+    total(make_df())
+    assert len(calls) == 2
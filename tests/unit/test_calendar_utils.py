@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import utils.calendar_utils as calendar_utils
+
+from statsmodels.tsa.deterministic import DeterministicProcess
+
+def test_fourier_is_zero_copy_slice():
+    calendar = calendar_utils.get_calendar()
+    assert calendar_utils.get_calendar() is calendar
+
+    result_df = calendar.fourier('2022-03-01', '2023-02-01')
+
+    assert len(result_df) == 12
+    assert result_df.index[0] == pd.Timestamp('2022-03-01')
+    assert np.shares_memory(result_df.to_numpy(), calendar.values)
+
+def test_fourier_matches_deterministic_process():
+    dates = pd.date_range(start='2023-01-01', periods=24, freq='MS')
+    dp = DeterministicProcess(
+        index=dates,
+        constant=False,
+        order=0,
+        seasonal=False,
+        additional_terms=calendar_utils.fourier_terms('MS'),
+        drop=True,
+    )
+
+    result_df = calendar_utils.get_calendar().fourier(dates[0], dates[-1])
+
+    pdt.assert_frame_equal(result_df, dp.in_sample(), check_freq=False)
+
+def test_trend_process_matches_deterministic_process():
+    dp = DeterministicProcess(index=pd.RangeIndex(30), order=1)
+    trend_process = calendar_utils.get_trend_process(30)
+
+    pdt.assert_frame_equal(trend_process.in_sample(), dp.in_sample())
+    pdt.assert_frame_equal(trend_process.out_of_sample(steps=6), dp.out_of_sample(steps=6), check_index_type=False)
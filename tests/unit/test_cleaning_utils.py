@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import utils.cleaning_utils as cleaning_utils
+
+def _events():
+    return pd.DataFrame({
+        'Name (EN)': ['Event A', 'Event B', '(Rerun) Event A', 'Joint Firing Drill', 'Collab X', 'Event B'],
+        'Start date': pd.to_datetime(['2021-02-04', '2021-03-20', '2021-06-01', '2021-06-15', '2021-07-01', '2021-08-28']),
+        'End date': pd.to_datetime(['2021-02-18', '2021-04-03', '2021-06-15', '2021-06-22', '2021-07-14', '2021-09-10']),
+        'Notes': [np.nan, np.nan, 'Rerun', 'Operation: Total Assault', 'Collaboration Event', np.nan],
+    })
+
+def test_classify_notes():
+    notes = pd.Series(['Collab Rerun', 'rerun', 'Operation', 'Original', np.nan, 'Rerun of an operation'])
+    categories = cleaning_utils.classify_notes(notes)
+    assert list(categories) == ['Collaboration Event', 'Rerun', 'Operation', 'Other', 'Other', 'Rerun']
+    assert list(categories) == [cleaning_utils.classify_note(note) for note in notes]
+
+def test_normalize_events_matches_cleaning_steps():
+    events = _events()
+    expected = cleaning_utils.group_all_operation_events_together(
+        cleaning_utils.mark_duplicates_as_rerun(cleaning_utils.remove_rerun_prefix(events)))
+
+    normalized = cleaning_utils.normalize_events(events)
+    assert normalized['Name (EN)'].tolist() == expected['Name (EN)'].tolist()
+    assert normalized['Notes'].tolist() == ['Original', 'Original', 'Rerun', 'Operation', 'Collaboration Event', 'Rerun']
+    assert normalized['Notes'].tolist() == expected['Notes'].tolist()
+    assert normalized['Is Rerun'].tolist() == [False, False, True, False, False, True]
+    assert normalized['Category'].tolist() == ['Other', 'Other', 'Rerun', 'Operation', 'Collaboration Event', 'Rerun']
+    pd.testing.assert_frame_equal(cleaning_utils.clean_event_data(events), expected)
+
+def test_normalize_events_groups_every_operation():
+    events = pd.DataFrame({'Name (EN)': ['Collab Y', 'Event C', 'Joint Firing Drill'],
+                           'Notes': ['Collab Operation', 'Rerun of Operation X', 'operation']})
+    expected = cleaning_utils.group_all_operation_events_together(events)
+
+    normalized = cleaning_utils.normalize_events(events)
+    assert normalized['Notes'].tolist() == ['Operation', 'Operation', 'Operation']
+    assert normalized['Notes'].tolist() == expected['Notes'].tolist()
+    assert normalized['Category'].tolist() == ['Operation', 'Operation', 'Operation']
+
+def test_normalize_events_is_cached_on_content():
+    events = _events()
+    pd.testing.assert_frame_equal(cleaning_utils.normalize_events(events), cleaning_utils.normalize_events(events.copy()))
+
+    # a table edited in place is normalized again
+    events.loc[0, 'Notes'] = 'Operation'
+    assert cleaning_utils.normalize_events(events)['Notes'].iloc[0] == 'Operation'
+    assert cleaning_utils.clean_event_data(events)['Notes'].iloc[0] == 'Operation'
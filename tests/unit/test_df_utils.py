@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import utils.df_utils as df_utils
 
@@ -146,6 +147,94 @@ def test_create_fourier_features():
     assert len(result_df) == len(df)
     assert result_df.shape[1] == df.shape[1] + 8  # 8 new features added
 
+def test_create_fourier_features_daily():
+    dates = pd.date_range(start='2023-01-01', periods=730, freq='D')
+    df = pd.DataFrame({'Date': dates})
 
+    result_df = df_utils.create_fourier_features(df, freq='D')
 
+    for i in range(1, 5):
+        assert f'sin({i},freq=YE-DEC)' in result_df.columns
+    for i in range(1, 4):
+        assert f'sin({i},freq=W-SUN)' in result_df.columns
+
+    assert len(result_df) == len(df)
+    assert (result_df.drop(columns=['Date']).dtypes == np.float32).all()
+
+def test_group_into_daily_activity():
+    banners = pd.DataFrame(
+        {'gachaType': ['PickupGacha', 'PickupGacha', 'FesGacha', 'PickupGacha'],
+        'startAt': pd.to_datetime(['2023-03-01 03:00', '2023-03-03 03:00', '2023-03-02 03:00', '2023-02-20 03:00']),
+        'endAt': pd.to_datetime(['2023-03-02 02:59', '2023-03-10 02:59', '2023-03-02 23:59', '2023-02-25 02:59'])})
     
+    revenue = pd.DataFrame({'Date': pd.date_range(start='2023-03-01', periods=5, freq='D'), 'JP': 1.0})
+
+    result_df = df_utils.group_into_daily_activity(banners, revenue)
+    assert result_df['Banner Count'].tolist() == [1, 2, 1, 1, 1]
+    assert result_df['Banner Count'].dtype == np.float32
+
+    result_df = df_utils.group_into_daily_activity(banners, revenue, by='gachaType')
+    assert result_df['PickupGacha Count'].tolist() == [1, 1, 1, 1, 1]
+    assert result_df['FesGacha Count'].tolist() == [0, 1, 0, 0, 0]
+
+def test_group_event_types_into_monthly_count():
+    events = pd.DataFrame({
+        'Name (EN)': ['Event A', '(Rerun) Event A', 'Event B'],
+        'Start date': pd.to_datetime(['2021-01-25', '2021-03-01', '2021-03-10']),
+        'End date': pd.to_datetime(['2021-02-08', '2021-03-15', '2021-04-20']),
+        'Notes': [np.nan, np.nan, np.nan],
+    })
+    revenue = pd.DataFrame({'Date': pd.date_range('2021-01-01', periods=3, freq='MS'), 'JP': [1.0, 2.0, 3.0]})
+
+    result = df_utils.group_event_types_into_monthly_count(events, revenue)
+    assert result.columns.tolist() == ['Date', 'JP', 'Original Count', 'Rerun Count']
+    assert result['Original Count'].tolist() == [1, 1, 1] # the April end month is outside revenue
+    assert result['Rerun Count'].tolist() == [0, 0, 1]
+
+def test_group_banner_types_into_monthly_count():
+    banners_jp = pd.DataFrame({
+        'gachaType': ['PickupGacha', 'PickupGacha', 'FesGacha', 'LimitedGacha', 'Birthday'],
+        'startAt': pd.to_datetime(['2023-01-10', '2023-01-25', '2023-02-01', '2023-02-10', '2023-01-01']),
+        'endAt': pd.to_datetime(['2023-01-20', '2023-02-08', '2023-03-01', '2023-02-17', '2023-01-31'])})
+    banners_en = banners_jp.iloc[:1]
+    revenue = pd.DataFrame({'Date': pd.date_range('2023-01-01', periods=3, freq='MS'), 'JP': 1.0})
+
+    # the same counts as one group_into_monthly_count per gacha type
+    result = df_utils.group_banner_types_into_monthly_count({'jp': banners_jp}, revenue, coverage=True)
+    assert result.columns[:5].tolist() == ['Date', 'JP', 'Pickup Banner Count', 'Limited Banner Count', 'Fes Banner Count']
+    for gacha_type, name in df_utils.BANNER_TYPES.items():
+        expected = df_utils.group_into_monthly_count(banners_jp[banners_jp['gachaType'] == gacha_type], revenue)
+        assert result[f'{name} Banner Count'].tolist() == expected['Banner Count'].tolist()
+
+    # banner-days per day of the month
+    np.testing.assert_allclose(result['Pickup Banner Coverage'], [(10 + 7) / 31, 7 / 28, 0])
+    np.testing.assert_allclose(result['Fes Banner Coverage'], [0, 1, 0])
+
+    counts, coverage = df_utils.group_banners_into_monthly_tensor({'jp': banners_jp, 'en': banners_en}, revenue)
+    assert counts.shape == coverage.shape == (3, 3, 2)
+    assert counts[:, 0, 1].tolist() == [1, 0, 0]
+
+    tidy = df_utils.group_banner_types_into_monthly_count({'jp': banners_jp, 'en': banners_en}, revenue, tidy=True)
+    assert len(tidy) == 3 * 3 * 2
+    assert tidy.groupby('region')['Banner Count'].sum().to_dict() == {'en': 1, 'jp': 6}
+
+def test_create_story_features():
+    story = pd.DataFrame({
+        'Volume': [1, 1, 2, 2, 'Final', 3],
+        'Chapter': [1, 2, 1, 1, 1, 1],
+        'Part': [np.nan, 1.0, 1.0, 2.0, np.nan, 1.0],
+        'Release Date': ['2020-12-20', '02/10/2021', pd.Timestamp('2021-02-20'), pd.Timestamp('2021-05-03'),
+                         pd.Timestamp('2021-05-30'), pd.Timestamp('2021-08-01')],
+    })
+    revenue = pd.DataFrame({'Date': pd.date_range('2021-01-01', periods=6, freq='MS'), 'JP': 1.0})
+
+    result = df_utils.create_story_features(story, revenue)
+    assert result.columns.tolist() == ['Date', 'Story Release Count', 'Periods Since Story', 'Story Finale']
+    assert result['Story Release Count'].tolist() == [0, 2, 0, 0, 2, 0] # the August release is after the last month
+    assert result['Periods Since Story'].tolist() == [1, 0, 1, 2, 0, 1]
+    assert result['Story Finale'].tolist() == [0, 1, 0, 0, 1, 0] # volumes 1 and 2 end, 'Final' is still the latest
+
+    daily = pd.DataFrame({'Date': pd.date_range('2021-02-09', periods=4, freq='D'), 'JP': 1.0})
+    result = df_utils.create_story_features(story, daily)
+    assert result['Story Release Count'].tolist() == [0, 1, 0, 0]
+    assert result['Periods Since Story'].tolist() == [1, 0, 1, 2]
@@ -0,0 +1,74 @@
+import gzip
+import json
+
+import pytest
+import utils.encoding_utils as encoding_utils
+from utils.encoding_utils import ARROW, JSON, MSGPACK
+
+FORECAST = {'dates': ['2025-08', '2025-09'], 'predictions': [11060935.997246603, 4468605.254743805]}
+
+def test_negotiate_media_type():
+    media_types = [JSON, MSGPACK, ARROW]
+    assert encoding_utils.negotiate_media_type('', media_types) == JSON
+    assert encoding_utils.negotiate_media_type('*/*', media_types) == JSON
+    assert encoding_utils.negotiate_media_type('application/x-msgpack', media_types) == MSGPACK
+    assert encoding_utils.negotiate_media_type(f'{JSON};q=0.5, {ARROW}', media_types) == ARROW
+    assert encoding_utils.negotiate_media_type(f'application/*;q=0.2, {JSON};q=0', media_types) == MSGPACK
+    assert encoding_utils.negotiate_media_type('text/html', media_types) is None
+    assert encoding_utils.negotiate_media_type(MSGPACK, [JSON]) is None # not installed
+
+def test_negotiate_encoding():
+    encodings = ['br', 'gzip', 'identity']
+    assert encoding_utils.negotiate_encoding('', encodings) == 'identity'
+    assert encoding_utils.negotiate_encoding('gzip, deflate, br', encodings) == 'br'
+    assert encoding_utils.negotiate_encoding('br;q=0.5, gzip', encodings) == 'gzip'
+    assert encoding_utils.negotiate_encoding('gzip', ['gzip', 'identity']) == 'gzip'
+    assert encoding_utils.negotiate_encoding('deflate', encodings) == 'identity'
+
+def test_encode_and_cache_bodies(monkeypatch):
+    assert json.loads(encoding_utils.encode(FORECAST, JSON)) == FORECAST
+    if ARROW in encoding_utils.MEDIA_TYPES:
+        import pyarrow as pa
+        assert pa.ipc.open_stream(encoding_utils.encode(FORECAST, ARROW)).read_all().to_pydict() == FORECAST
+
+    monkeypatch.setattr(encoding_utils, 'MINIMUM_COMPRESS_SIZE', 0)
+    bodies = encoding_utils.EncodedBodies(FORECAST)
+    body, encoding, hit = bodies.get(JSON, 'gzip')
+    assert encoding == 'gzip' and not hit
+    assert json.loads(gzip.decompress(body)) == FORECAST
+    assert bodies.get(JSON, 'gzip') == (body, 'gzip', True)
+    assert bodies.version == encoding_utils.EncodedBodies(dict(reversed(FORECAST.items()))).version
+    assert bodies.version != encoding_utils.EncodedBodies({**FORECAST, 'predictions': [0.0, 0.0]}).version
+
+    # small bodies are not compressed
+    monkeypatch.setattr(encoding_utils, 'MINIMUM_COMPRESS_SIZE', 500)
+    assert encoding_utils.compress(body, 'gzip') == (body, 'identity')
+    with pytest.raises(ValueError):
+        encoding_utils.encode(FORECAST, 'text/csv')
+
+def test_api_negotiates_forecast_formats(monkeypatch):
+    from fastapi.testclient import TestClient
+    import api
+
+    client = TestClient(api.app)
+    response = client.get('/six_month_forecast')
+    assert response.headers['content-type'] == JSON and response.json() == api.serving.six_month_forecast
+    assert response.headers['vary'] == 'Accept, Accept-Encoding'
+
+    cached = client.get('/six_month_forecast', headers={'If-None-Match': response.headers['etag']})
+    assert cached.status_code == 304
+
+    # a new forecast from the same models gets a new ETag
+    state = api.serving
+    monkeypatch.setattr(state, 'six_month_forecast', {**state.six_month_forecast, 'predictions': [0.0] * 6})
+    monkeypatch.setattr(state, 'forecast_bodies', encoding_utils.EncodedBodies(state.six_month_forecast))
+    response = client.get('/six_month_forecast', headers={'If-None-Match': response.headers['etag']})
+    assert response.status_code == 200 and response.json()['predictions'] == [0.0] * 6
+    monkeypatch.undo()
+    assert client.get('/six_month_forecast', headers={'Accept': 'text/html'}).status_code == 406
+
+    if ARROW in encoding_utils.MEDIA_TYPES:
+        import pyarrow as pa
+        response = client.get('/six_month_forecast', headers={'Accept': ARROW})
+        assert response.headers['content-type'] == ARROW
+        assert pa.ipc.open_stream(response.content).read_all().to_pydict() == api.serving.six_month_forecast
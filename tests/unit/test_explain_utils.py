@@ -0,0 +1,48 @@
+import json
+from unittest import mock
+
+import numpy as np
+import utils.explain_utils as explain_utils
+import utils.inference_utils as inference_utils
+
+def test_explanations_add_up_to_the_forecast(fitted_models):
+    trend_model, xgb_model, _, X_test2, time_index = fitted_models
+    months = ['2025-08', '2025-09', '2025-10', '2025-11', '2025-12', '2026-01']
+
+    explanations = explain_utils.explain_forecast(trend_model, xgb_model, X_test2, time_index, months)
+    forecast = trend_model.predict(time_index) + xgb_model.predict(X_test2)
+
+    assert list(explanations) == months
+    for explanation, prediction in zip(explanations.values(), forecast):
+        assert list(explanation['contributions']) == X_test2.columns.tolist()
+        total = explanation['trend'] + explanation['base_value'] + sum(explanation['contributions'].values())
+        assert np.isclose(total, explanation['prediction'])
+        assert np.isclose(explanation['prediction'], prediction, rtol=1e-6)
+
+def test_model_version_matches_exported_models(tmp_path, fitted_models):
+    trend_model, xgb_model, _, _, _ = fitted_models
+    trend = inference_utils.export_trend_model(trend_model, path=tmp_path / 'trend_model.json')
+    residual = inference_utils.export_residual_model(xgb_model, path=tmp_path / 'xgb_residual_model.npz')
+
+    version = explain_utils.model_version(trend, residual)
+    loaded_version = explain_utils.model_version(inference_utils.PiecewiseLinearTrend.load(tmp_path / 'trend_model.json'),
+                                                 inference_utils.CompiledResidualModel.load(tmp_path / 'xgb_residual_model.npz'))
+    assert len(version) == 12
+    assert loaded_version == version
+
+def test_update_explanations_only_computes_new_months(tmp_path, fitted_models):
+    trend_model, xgb_model, _, X_test2, time_index = fitted_models
+    path = tmp_path / 'explanations.json'
+    months = ['2025-08', '2025-09', '2025-10', '2025-11', '2025-12', '2026-01']
+
+    explain_utils.update_explanations(trend_model, xgb_model, X_test2.iloc[:3], time_index[:3], months[:3], path=path)
+    with mock.patch.object(explain_utils, 'explain_forecast', wraps=explain_utils.explain_forecast) as explain_forecast:
+        entry = explain_utils.update_explanations(trend_model, xgb_model, X_test2, time_index, months, path=path)
+
+    assert explain_forecast.call_args.args[4] == months[3:]
+    assert list(entry['months']) == months
+    assert next(iter(entry['feature_importance'])) in X_test2.columns
+
+    cache = json.load(open(path))
+    assert list(cache['versions']) == [cache['latest']]
+    assert cache['versions'][cache['latest']] == entry
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+import utils.global_model_utils as global_model_utils
+import utils.model_utils as model_utils
+
+def make_revenue():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'Date': pd.date_range('2022-01-01', periods=24, freq='MS'),
+                         'JP': rng.uniform(2e6, 2e7, 24),
+                         'Global': rng.uniform(5e5, 5e6, 24),
+                         'Pickup Banner Count': rng.integers(0, 5, 24)})
+
+def test_global_features_match_single_series_features():
+    revenue = make_revenue()
+    panel = global_model_utils.revenue_to_panel(revenue)
+    features, scales = global_model_utils.create_global_features(panel, lags=[1, 6], train_end='2023-06-01')
+
+    assert scales.index.tolist() == ['Global', 'JP']
+    assert scales['JP'] == pytest.approx(revenue['JP'].iloc[:18].mean())
+    assert features['series'].dtype == 'category'
+    assert len(features) == 2 * (24 - 6)
+
+    for series in ['JP', 'Global']:
+        single = revenue[['Date', series]].rename(columns={series: 'JP'})
+        single['JP'] /= scales[series]
+        expected = model_utils.make_rolling_stats(model_utils.make_lags(single, [1, 6]), window_size=4).dropna()
+
+        result = features[features['series'] == series]
+        np.testing.assert_allclose(result[['revenue', 'lag1', 'lag6', 'rolling_std_4']].to_numpy(),
+                                   expected[['JP', 'lag1', 'lag6', 'rolling_std_4']].to_numpy())
+        np.testing.assert_array_equal(result['Pickup Banner Count'], revenue['Pickup Banner Count'].iloc[6:])
+
+def test_global_features_drop_the_residual_model_columns():
+    revenue = make_revenue().assign(**{'Rerun Count': 1, 'Fes Banner Count': 0})
+    features, _ = global_model_utils.create_global_features(global_model_utils.revenue_to_panel(revenue))
+    single = model_utils.create_XGB_features(revenue.drop(columns=['Global']), errors='ignore')
+
+    assert 'Rerun Count' not in features.columns
+    assert set(features.columns.drop(['series', 'Date', 'revenue'])) == set(single.columns.drop('JP'))
+
+def test_global_model_predicts_in_revenue_units():
+    revenue = make_revenue()
+    panel = global_model_utils.revenue_to_panel(revenue)
+    features, scales = global_model_utils.create_global_features(panel, train_end='2023-06-01')
+    is_train = features['Date'] <= '2023-06-01'
+
+    global_model = global_model_utils.fit_global_model(features[is_train])
+    predictions = global_model_utils.predict_global_model(global_model, features[~is_train], scales)
+
+    assert global_model.get_params()['tree_method'] == 'hist'
+    assert predictions.index.equals(features[~is_train].index)
+    is_jp = features.loc[~is_train, 'series'] == 'JP'
+    assert predictions[is_jp].mean() > predictions[~is_jp].mean() # JP revenue is larger than Global
+
+def test_global_features_reject_duplicate_rows():
+    panel = global_model_utils.revenue_to_panel(make_revenue())
+    with pytest.raises(ValueError):
+        global_model_utils.create_global_features(pd.concat([panel, panel.iloc[:1]]))
@@ -0,0 +1,71 @@
+import numpy as np
+import utils.inference_utils as inference_utils
+from utils.matrix_utils import FeatureMatrix
+
+def test_trend_matches_spline_pipeline(tmp_path, fitted_models):
+    trend_model, _, _, _, _ = fitted_models
+    time_index = np.linspace(-20, 80, 501).reshape(-1, 1) # includes extrapolation on both sides
+
+    trend = inference_utils.export_trend_model(trend_model, path=tmp_path / 'trend_model.json')
+    np.testing.assert_allclose(trend.predict(time_index), trend_model.predict(time_index), rtol=1e-9)
+
+    loaded_trend = inference_utils.PiecewiseLinearTrend.load(tmp_path / 'trend_model.json')
+    np.testing.assert_array_equal(loaded_trend.predict(time_index), trend.predict(time_index))
+
+def test_trend_batched_evaluation(fitted_models):
+    trend_model, _, _, _, _ = fitted_models
+    trend = inference_utils.export_trend_model(trend_model, path=None)
+
+    # 1000 scenarios (different forecast origins) x 24 horizons
+    time_index = np.arange(30, 1030).reshape(-1, 1) + np.arange(1, 25)
+    result = trend.evaluate(time_index)
+
+    assert result.shape == (1000, 24)
+    np.testing.assert_allclose(result.ravel(), trend_model.predict(time_index.reshape(-1, 1)), rtol=1e-9)
+
+def test_trend_to_bytes():
+    trend = inference_utils.PiecewiseLinearTrend([4.0, 10.0, 16.0], 1000.0, [100.0, -50.0])
+    data = trend.to_bytes()
+
+    assert len(data) == 8 * 6
+    loaded_trend = inference_utils.PiecewiseLinearTrend.from_bytes(data)
+    np.testing.assert_array_equal(loaded_trend.evaluate([0.0, 4.0, 13.0, 20.0]), [600.0, 1000.0, 1450.0, 1100.0])
+
+def test_residual_model_matches_xgboost(tmp_path, fitted_models):
+    _, xgb_model, X_train2, _, _ = fitted_models
+    rng = np.random.default_rng(0)
+    X = X_train2.sample(500, replace=True, random_state=0) * rng.uniform(0.5, 1.5, size=(500, X_train2.shape[1]))
+    X.iloc[::5, 0] = np.nan # missing values go to the default child
+
+    model = inference_utils.export_residual_model(xgb_model, path=tmp_path / 'xgb_residual_model.npz')
+    np.testing.assert_array_equal(model.predict(X), xgb_model.predict(X))
+
+    loaded_model = inference_utils.CompiledResidualModel.load(tmp_path / 'xgb_residual_model.npz')
+    np.testing.assert_array_equal(loaded_model.predict(X.to_numpy()), xgb_model.predict(X))
+
+    # a FeatureMatrix is reordered by name too
+    X_matrix = FeatureMatrix.from_frame(X, columns=X.columns[::-1])
+    np.testing.assert_array_equal(loaded_model.predict(X_matrix), xgb_model.predict(X))
+
+def test_publish_models_switches_the_pair_at_once(tmp_path, monkeypatch, fitted_models):
+    trend_model, xgb_model, X_train2, _, _ = fitted_models
+    trend = inference_utils.export_trend_model(trend_model, path=tmp_path / 'trend_model.json')
+    residual = inference_utils.export_residual_model(xgb_model, path=tmp_path / 'xgb_residual_model.npz')
+    manifest_path = str(tmp_path / 'manifest.json')
+
+    # before anything is published, the exported models are loaded
+    loaded_trend, _ = inference_utils.load_models(manifest_path)
+    np.testing.assert_array_equal(loaded_trend.knots, trend.knots)
+
+    versions = []
+    for shift in [0.0, 1.0, 2.0, 3.0]:
+        shifted_trend = inference_utils.PiecewiseLinearTrend(trend.knots, trend.intercept + shift, trend.slopes)
+        versions.append(inference_utils.publish_models(shifted_trend, residual, manifest_path))
+        loaded_trend, loaded_residual = inference_utils.load_models(manifest_path)
+        assert loaded_trend.intercept == trend.intercept + shift
+        assert inference_utils.model_version(loaded_trend, loaded_residual) == versions[-1]
+
+    # the exported models next to the manifest are not touched, and old versions are deleted
+    assert inference_utils.PiecewiseLinearTrend.load(tmp_path / 'trend_model.json').intercept == trend.intercept
+    kept = sorted(path.name for path in (tmp_path / 'versions').iterdir())
+    assert kept == sorted(versions[-inference_utils.KEPT_MODEL_VERSIONS:])
@@ -0,0 +1,62 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+import utils.dataloader_utils as dataloader_utils
+import utils.ingest_utils as ingest_utils
+
+def banner_payload():
+    banners = pd.read_pickle('./data/fixtures/all_banners_jp.pkl').drop(columns=['startAt', 'endAt'])
+    records = banners.to_dict('records')
+    payload = {'meta': {'note': '"ended": [1]', 'pages': [1, 2]},
+               'ended': records[:-3], 'current': records[-3:-1], 'upcoming': records[-1:],
+               'count': 1234567890, 'empty': []}
+    return json.dumps(payload, ensure_ascii=False, indent=1), records
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_iter_json_array_items(chunk_size):
+    text, records = banner_payload()
+    items = list(ingest_utils.iter_json_array_items(io.StringIO(text), keys=['ended', 'current', 'upcoming'], chunk_size=chunk_size))
+
+    assert [item for _, item in items] == records
+    assert [key for key, _ in items[-2:]] == ['current', 'upcoming']
+
+def test_iter_json_array_items_numbers_split_across_chunks():
+    text = '{"ended":[{"v":1.25,"w":12},{"v":3e10},2.5,10.75, -0.5E-3 ]}'
+    expected = [('ended', item) for item in json.loads(text)['ended']]
+    for chunk_size in range(1, len(text) + 1):
+        assert list(ingest_utils.iter_json_array_items(io.StringIO(text), chunk_size=chunk_size)) == expected, chunk_size
+
+def test_iter_json_array_items_all_arrays():
+    text = '{"a": [1, 22, 333], "b": {"c": []}, "d": [true, null], "e": []}'
+    items = list(ingest_utils.iter_json_array_items(io.StringIO(text), chunk_size=1))
+    assert items == [('a', 1), ('a', 22), ('a', 333), ('d', True), ('d', None)]
+
+    with pytest.raises(ValueError):
+        list(ingest_utils.iter_json_array_items(io.StringIO('{"a": [1, 2')))
+
+def test_iter_excel_chunks():
+    path = './data/reddit-monthly-revenue-report.xlsx'
+    chunks = list(ingest_utils.iter_excel_chunks(path, chunksize=10, usecols=3))
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10, 10, 5]
+    expected = pd.read_excel(path, engine='openpyxl').iloc[:, :3]
+    pd.testing.assert_frame_equal(pd.concat(chunks).astype('float64', errors='ignore'), expected.astype('float64', errors='ignore'))
+
+def test_ingest_into_partitioned_dataset(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    text, records = banner_payload()
+    (tmp_path / 'banners_jp.json').write_text(text, encoding='utf-8')
+    writer = dataloader_utils.ingest_banners(tmp_path / 'banners', sources={'jp': str(tmp_path / 'banners_jp.json')}, chunksize=100)
+    assert writer.n_rows == len(records)
+    assert len(writer.files) == -(-len(records) // 100)
+
+    banners = ingest_utils.read_dataset(tmp_path / 'banners', filters=[('region', '==', 'jp')])
+    assert banners['id'].tolist() == [record['id'] for record in records]
+
+    writer = dataloader_utils.ingest_revenue(tmp_path / 'revenue', chunksize=10)
+    assert writer.n_rows == 45 + 9
+    revenue = dataloader_utils.load_revenue_dataset(tmp_path / 'revenue')
+    pd.testing.assert_frame_equal(revenue, dataloader_utils.load_revenue().astype({'JP': 'float64', 'Global': 'float64'}))
@@ -0,0 +1,44 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import utils.io_utils as io_utils
+
+def write_payload(args):
+    path, value = args
+    io_utils.write_json({'value': value, 'padding': [value] * 100_000}, path)
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / 'forecast.json'
+    io_utils.write_json({'value': 1}, path)
+    io_utils.write_json({'value': 2}, path)
+
+    assert json.load(open(path)) == {'value': 2}
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / 'forecast.json'
+    io_utils.write_json({'value': 1}, path)
+
+    with pytest.raises(RuntimeError):
+        with io_utils.atomic_write(path, mode='w') as file:
+            file.write('{"value": ')
+            raise RuntimeError('simulated failure while writing')
+
+    assert json.load(open(path)) == {'value': 1}
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
+
+def test_concurrent_writers(tmp_path):
+    path = tmp_path / 'forecast.json'
+    io_utils.write_json({'value': -1, 'padding': []}, path)
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        writes = executor.map(write_payload, [(path, i) for i in range(16)])
+
+        # readers never see a partially written file
+        for _ in range(50):
+            payload = json.load(open(path))
+            assert payload['padding'] in ([], [payload['value']] * 100_000)
+        list(writes)
+
+    assert json.load(open(path))['value'] in range(16)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.matrix_utils import FeatureMatrix
+
+def test_feature_matrix_from_frame():
+    df = pd.DataFrame({'a': [1, 2, 3], 'b': [0.5, np.nan, 1.5], 'c': pd.array([1, None, 3], dtype='Int64')},
+                      index=[10, 11, 12])
+    X = FeatureMatrix.from_frame(df, columns=['c', 'a'])
+
+    assert X.feature_names == ['c', 'a'] and X.shape == (3, 2) and X.nbytes == 3 * 2 * 4
+    assert X.values.dtype == np.float32 and X.values.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(X.values, [[1, 1], [np.nan, 2], [3, 3]])
+    pd.testing.assert_frame_equal(X.to_frame(), df[['c', 'a']].astype(np.float32))
+
+    # row slices are views that keep the names and row labels
+    tail = X[1:]
+    assert np.shares_memory(tail.values, X.values)
+    assert tail.feature_names == ['c', 'a'] and tail.index.tolist() == [11, 12]
+
+def test_feature_matrix_select():
+    X = FeatureMatrix(np.arange(6).reshape(2, 3), ['a', 'b', 'c'])
+    assert X.select(['a', 'b', 'c']) is X
+    np.testing.assert_array_equal(X.select(['c', 'a']).values, [[2, 0], [5, 3]])
+
+    with pytest.raises(KeyError):
+        X.select(['a', 'd'])
+    with pytest.raises(ValueError):
+        FeatureMatrix(np.zeros((2, 2)), ['a', 'b', 'c'])
@@ -0,0 +1,82 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import utils.metrics_utils as metrics_utils
+
+def make_client(trace_ids=False):
+    registry = metrics_utils.MetricsRegistry()
+    app = FastAPI()
+    app.add_middleware(metrics_utils.MetricsMiddleware, registry=registry, trace_ids=trace_ids)
+
+    @app.get('/items/{item_id}')
+    def get_item(item_id: int):
+        return {'item_id': item_id}
+
+    return TestClient(app), registry
+
+def test_histogram():
+    histogram = metrics_utils.Histogram((1, 5, 10))
+    for value in [0.5, 1, 3, 7, 20]:
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.sum == 31.5
+
+def test_middleware_records_requests():
+    client, registry = make_client()
+    client.get('/items/1')
+    client.get('/items/2')
+    client.get('/items/abc')
+    client.get('/missing')
+
+    assert registry.requests == {('GET', '/items/{item_id}', 200): 2,
+                                 ('GET', '/items/{item_id}', 422): 1,
+                                 ('GET', 'unmatched', 404): 1}
+    assert sum(registry.latency['/items/{item_id}'].counts) == 3
+    assert registry.response_size['/items/{item_id}'].sum > 0
+
+    text = registry.render()
+    assert 'http_requests_total{method="GET",path="/items/{item_id}",status="200"} 2' in text
+    assert 'http_request_duration_seconds_bucket{path="/items/{item_id}",le="+Inf"} 3' in text
+    assert 'http_request_duration_seconds_count{path="unmatched"} 1' in text
+
+def test_middleware_trace_ids():
+    client, _ = make_client(trace_ids=True)
+
+    assert client.get('/items/1', headers={'X-Request-ID': 'abc123'}).headers['X-Request-ID'] == 'abc123'
+    first, second = client.get('/items/1').headers['X-Request-ID'], client.get('/items/1').headers['X-Request-ID']
+    assert first != second
+
+    client, _ = make_client(trace_ids=False)
+    assert 'X-Request-ID' not in client.get('/items/1').headers
+
+def test_render_gauges():
+    text = metrics_utils.render_gauges('forecast_feature_psi', 'PSI.', {'lag6': 0.25, 'sin(2,freq=YE-DEC)': None}, label='feature')
+
+    assert text == ('# HELP forecast_feature_psi PSI.\n'
+                    '# TYPE forecast_feature_psi gauge\n'
+                    'forecast_feature_psi{feature="lag6"} 0.25\n')
+
+def test_collect_metrics_adds_up_workers(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    client, registry = make_client()
+    client.get('/items/1')
+    client.get('/items/abc')
+    registry.observe_cache('forecast_bodies', hit=True)
+
+    # another worker, which has exited since
+    other_client, other_registry = make_client()
+    other_client.get('/items/2')
+    monkeypatch.setattr(metrics_utils.os, 'getpid', lambda: 12345)
+    metrics_utils.save_process_metrics(other_registry, directory)
+    metrics_utils.mark_process_dead(12345, directory)
+    monkeypatch.undo()
+
+    total = metrics_utils.collect_metrics(registry, directory)
+    assert total.requests == {('GET', '/items/{item_id}', 200): 2, ('GET', '/items/{item_id}', 422): 1}
+    assert sum(total.latency['/items/{item_id}'].counts) == 3
+    assert total.cache == {('forecast_bodies', 'hit'): 1}
+
+    # this worker's own metrics are current, and saving again does not count them twice
+    client.get('/items/3')
+    assert metrics_utils.collect_metrics(registry, directory).requests[('GET', '/items/{item_id}', 200)] == 3
+    assert metrics_utils.MetricsRegistry.from_dict(registry.to_dict()).render() == registry.render()
@@ -1,6 +1,10 @@
+import pickle
+
 import numpy as np
 import pandas as pd
 import pandas.testing as pdt
+import pytest
+import utils.explain_utils as explain_utils
 import utils.model_utils as model_utils
 
 def test_prepare_train_test_split():
@@ -61,6 +65,12 @@ def test_drop_columns_residual():
     assert all(col not in result_df.columns for col in columns_dropped)
     assert len(df) == len(result_df)
 
+    # a renamed monthly feature is an error, unless the data is known not to have them all
+    with pytest.raises(KeyError):
+        model_utils.drop_columns_residual(df.drop(columns=['Rerun Count']))
+    daily = model_utils.drop_columns_residual(df.drop(columns=['Rerun Count']), errors='ignore')
+    assert daily.columns.tolist() == result_df.columns.tolist()
+
 def test_make_lags():
     df = pd.DataFrame(
         {'Date': pd.to_datetime(['2021-11-01', '2021-11-02', '2021-11-03', '2021-11-04', '2021-11-05']),
@@ -93,3 +103,130 @@ def test_make_rolling_stats():
     pdt.assert_series_equal(result_df[f'rolling_std_{window_size}'], expected_rolling_std, check_names=False)
     pdt.assert_series_equal(df['JP'], result_df['JP'], check_names=False)
 
+def test_aggregate_daily_to_monthly():
+    dates = pd.Series(pd.date_range(start='2023-01-30', periods=5, freq='D'))
+    daily_values = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+
+    result = model_utils.aggregate_daily_to_monthly(dates, daily_values)
+
+    assert result.index.tolist() == [pd.Timestamp('2023-01-01'), pd.Timestamp('2023-02-01')]
+    assert result.tolist() == [3.0, 12.0]
+
+def test_create_XGB_features_with_story():
+    revenue = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    story = pd.DataFrame({'Volume': ['1', '1', '2'], 'Release Date': pd.to_datetime(['2022-06-05', '2022-06-20', '2023-01-10'])})
+
+    revenue_2 = model_utils.create_XGB_features(revenue)
+    with_story = model_utils.create_XGB_features(revenue, story=story)
+
+    pdt.assert_frame_equal(with_story[revenue_2.columns], revenue_2)
+    assert {'Story Release Count', 'Periods Since Story', 'Story Finale'} <= set(with_story.columns)
+    assert with_story['Story Release Count'].sum() == 3
+    assert with_story['Story Finale'].sum() == 1
+
+def _residual_features():
+    revenue = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    revenue_2 = model_utils.create_XGB_features(revenue)
+    return revenue_2.drop(columns=['JP']), revenue_2['JP']
+
+def test_fit_XGB_residual_booster_matches_sklearn_wrapper():
+    X, y = _residual_features()
+    dtrain = model_utils.make_residual_dmatrix(X, y)
+
+    booster = model_utils.fit_XGB_residual_booster(dtrain)
+    xgb_model = model_utils.fit_XGB_residual_model(X, y, save=False)
+    np.testing.assert_array_equal(booster.inplace_predict(X), xgb_model.predict(X))
+
+    # training on a fold gives the same model as refitting on it, also on the held-out rows
+    booster = model_utils.fit_XGB_residual_booster(dtrain, train_rows=np.arange(len(X) - 12))
+    xgb_model = model_utils.fit_XGB_residual_model(X.iloc[:-12], y.iloc[:-12], save=False)
+    np.testing.assert_array_equal(booster.inplace_predict(X), xgb_model.predict(X))
+
+def test_backtest_XGB_residual_model():
+    X, y = _residual_features()
+    results = model_utils.backtest_XGB_residual_model(X, y, horizon=6, n_folds=3, params={'max_depth': 3})
+
+    assert results['train_rows'].tolist() == [len(X) - 18, len(X) - 12, len(X) - 6]
+    assert (results['mae'] > 0).all()
+
+    # the same as refitting the model for each fold
+    results = model_utils.backtest_XGB_residual_model(X, y, horizon=6, n_folds=3)
+    for fold in results.itertuples():
+        xgb_model = model_utils.fit_XGB_residual_model(X.iloc[:fold.train_rows], y.iloc[:fold.train_rows], save=False)
+        test = slice(fold.train_rows, fold.train_rows + 6)
+        assert fold.mae == pytest.approx(np.mean(np.abs(xgb_model.predict(X.iloc[test]) - y.iloc[test].to_numpy())))
+
+def test_feature_matrix_gives_the_same_models_and_predictions():
+    X, y = _residual_features()
+    revenue = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    X_matrix, y_matrix = model_utils.create_XGB_features(revenue, matrix=True)
+    assert X_matrix.feature_names == X.columns.tolist()
+    assert X_matrix.values.dtype == np.float32 and X_matrix.values.flags['C_CONTIGUOUS']
+    with pytest.raises(ValueError):
+        model_utils.create_XGB_features(revenue, matrix=True, dtype='float64')
+    pdt.assert_series_equal(y_matrix, y)
+
+    xgb_model = model_utils.fit_XGB_residual_model(X.iloc[:-6], y.iloc[:-6], save=False)
+    matrix_model = model_utils.fit_XGB_residual_model(X_matrix[:-6], y_matrix.iloc[:-6], save=False)
+    assert matrix_model.get_booster().feature_names == X.columns.tolist()
+    np.testing.assert_array_equal(matrix_model.predict(X.iloc[-6:]), xgb_model.predict(X.iloc[-6:]))
+
+    # a matrix with its columns in another order is reordered for the model
+    trend_model = model_utils.fit_spline_trend_model(y.iloc[:-6], plot=False, save=False)
+    dp = model_utils.calendar_utils.get_trend_process(len(y) - 6)
+    shuffled = X_matrix[-6:].select(X_matrix.feature_names[::-1])
+    np.testing.assert_array_equal(model_utils.final_prediction(trend_model, xgb_model, shuffled, dp),
+                                  model_utils.final_prediction(trend_model, xgb_model, X.iloc[-6:], dp))
+
+    pdt.assert_frame_equal(model_utils.backtest_XGB_residual_model(X_matrix, y_matrix),
+                           model_utils.backtest_XGB_residual_model(X, y))
+
+    # and so are the explanations and the incremental update
+    assert (explain_utils.explain_forecast(trend_model, xgb_model, shuffled, dp.out_of_sample(steps=6), list(range(6)))
+            == explain_utils.explain_forecast(trend_model, xgb_model, X.iloc[-6:], dp.out_of_sample(steps=6), list(range(6))))
+    updated_model = model_utils.update_XGB_residual_model(xgb_model, X.iloc[:-3], y.iloc[:-3])
+    matrix_updated_model = model_utils.update_XGB_residual_model(xgb_model, X_matrix[:-3].select(X_matrix.feature_names[::-1]),
+                                                                 y_matrix.iloc[:-3])
+    assert matrix_updated_model.get_booster().feature_names == X.columns.tolist()
+    np.testing.assert_array_equal(matrix_updated_model.predict(X), updated_model.predict(X))
+
+def test_update_spline_trend_model_matches_refit_with_same_knots():
+    revenue = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    y = revenue['JP']
+    trend_model = model_utils.fit_spline_trend_model(y.iloc[:30], plot=False, save=False)
+    stats = model_utils.trend_sufficient_stats(trend_model, y.iloc[:30])
+
+    updated_model, updated_stats = model_utils.update_spline_trend_model(trend_model, stats, y.iloc[:36])
+    assert updated_stats['n_points'] == 36 - 6
+    np.testing.assert_allclose(updated_stats['xtx'], model_utils.trend_sufficient_stats(trend_model, y.iloc[:36])['xtx'])
+
+    # the same regression, refit on the same spline basis
+    trend = y.iloc[:36].rolling(window=7, center=True).mean().dropna()
+    basis = trend_model[0].transform(trend.index.to_numpy().reshape(-1, 1) + 1)
+    refit = model_utils.LinearRegression().fit(basis, trend)
+    time_index = np.arange(1, 43).reshape(-1, 1)
+    np.testing.assert_allclose(updated_model.predict(time_index), refit.predict(trend_model[0].transform(time_index)), rtol=1e-6)
+    assert trend_model[-1].coef_.tolist() != updated_model[-1].coef_.tolist() # the original is not modified
+
+def test_retrain_models_schedule():
+    revenue = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    y = revenue['JP']
+    revenue_2 = model_utils.create_XGB_features(revenue)
+
+    state = None
+    for n_train in range(30, 35):
+        state = model_utils.retrain_models(y.iloc[:n_train], revenue_2, state, full_refit_every=3)
+
+    assert [entry['mode'] for entry in state['history']] == ['full', 'incremental', 'incremental', 'incremental', 'full']
+    assert 'forecast_gap' in state['history'][-1]
+    assert state['updates'] == 0 and state['n_train'] == 34
+
+    state = model_utils.retrain_models(y.iloc[:35], revenue_2, state, n_rounds=5)
+    assert state['xgb_model'].get_booster().num_boosted_rounds() == model_utils.XGB_RESIDUAL_ROUNDS + 5
+
+    # the added trees use the hyperparameters of the model they continue
+    X, y2 = revenue_2.drop(columns=['JP']), revenue_2['JP']
+    xgb_model = model_utils.XGBRegressor(n_estimators=10, max_depth=2, min_child_weight=3).fit(X.iloc[:30], y2.iloc[:30])
+    updated_model = model_utils.update_XGB_residual_model(xgb_model, X.iloc[:33], y2.iloc[:33])
+    assert {key: updated_model.get_params()[key] for key in ['max_depth', 'min_child_weight', 'n_estimators']} == \
+        {'max_depth': 2, 'min_child_weight': 3, 'n_estimators': 5}
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import utils.monitoring_utils as monitoring_utils
+
+def make_features(n_rows, shift=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'lag6': rng.normal(5e6 + shift, 1e6, n_rows),
+                         'Pickup Banner Count': rng.integers(2, 8, n_rows)})
+
+def test_running_statistics_match_pandas():
+    reference = make_features(200)
+    new_rows = [make_features(50, seed=1), make_features(1, seed=2), make_features(30, seed=3)]
+
+    monitor = monitoring_utils.FeatureMonitor.from_reference(reference)
+    for rows in new_rows:
+        monitor.update(rows)
+
+    all_rows = pd.concat([reference] + new_rows)
+    summary = monitor.summary()
+    for col in all_rows.columns:
+        assert summary[col]['count'] == len(all_rows)
+        assert np.isclose(summary[col]['mean'], all_rows[col].mean())
+        assert np.isclose(summary[col]['std'], all_rows[col].std())
+        assert summary[col]['new_rows'] == 81
+
+def test_psi_flags_drift():
+    reference = make_features(500)
+
+    monitor = monitoring_utils.FeatureMonitor.from_reference(reference)
+    monitor.update(make_features(500, seed=1))
+    assert not monitor.summary()['lag6']['drift']
+
+    monitor = monitoring_utils.FeatureMonitor.from_reference(reference)
+    monitor.update(make_features(500, shift=2e6, seed=1))
+    assert monitor.summary()['lag6']['drift']
+    assert not monitor.summary()['Pickup Banner Count']['drift']
+
+def test_check_schema():
+    banners = pd.DataFrame({'id': [1, 2], 'gachaType': ['PickupGacha', 'SelectGacha']})
+
+    issues = monitoring_utils.check_schema(banners, 'banners', ['id', 'gachaType', 'startAt'],
+                                           {'gachaType': monitoring_utils.GACHA_TYPES})
+
+    assert issues == ["banners: missing columns ['startAt']", "banners: new gachaType values ['SelectGacha']"]
+
+def test_update_monitoring_only_adds_new_rows(tmp_path):
+    path = tmp_path / 'monitoring.json'
+    features = make_features(24)
+    dates = pd.Series(pd.date_range(start='2023-01-01', periods=24, freq='MS'))
+    events = pd.DataFrame({'Name (EN)': ['a'], 'Start date': [dates[0]], 'End date': [dates[0]], 'Notes': ['Original']})
+
+    report = monitoring_utils.update_monitoring(features.iloc[:20], dates.iloc[:20], events=events, path=path)
+    assert report['status'] == 'ok'
+    assert report['features']['lag6']['new_rows'] == 0
+
+    # the full history is passed in again, but only the last 4 months are new
+    report = monitoring_utils.update_monitoring(features, dates, events=events, path=path)
+    assert report['features']['lag6']['count'] == 24
+    assert report['features']['lag6']['new_rows'] == 4
+    assert report['last_date'] == '2024-12-01T00:00:00'
+
+    events.loc[0, 'Notes'] = 'Special Operation Part 6'
+    report = monitoring_utils.update_monitoring(features, dates, events=events, path=path)
+    assert report['status'] == 'schema_error'
+    assert report['features']['lag6']['count'] == 24
+
+def test_concurrent_updates_are_not_lost(tmp_path, monkeypatch):
+    path = tmp_path / 'monitoring.json'
+    features = make_features(40)
+    dates = pd.Series(pd.date_range(start='2022-01-01', periods=40, freq='MS'))
+    monitoring_utils.update_monitoring(features.iloc[:20], dates.iloc[:20], path=path)
+
+    # slow updates, so that without the lock both refreshes would read the same monitor,
+    # and the one with fewer months would save last
+    update = monitoring_utils.FeatureMonitor.update
+    def slow_update(self, features, *args, **kwargs):
+        time.sleep(0.4 if len(features) == 30 else 0.1)
+        return update(self, features, *args, **kwargs)
+    monkeypatch.setattr(monitoring_utils.FeatureMonitor, 'update', slow_update)
+
+    threads = [threading.Thread(target=monitoring_utils.update_monitoring, args=(features.iloc[:n], dates.iloc[:n]),
+                                kwargs={'path': path}) for n in [30, 40]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(path) as file:
+        assert json.load(file)['features']['lag6']['count'] == 40
@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import pickle
+import threading
+import time
+
+import pandas as pd
+import pytest
+import utils.dataloader_utils as dataloader_utils
+import utils.io_utils as io_utils
+import utils.refresh_utils as refresh_utils
+
+class SlowJob:
+    # a refresh that runs until released, and records whether runs overlapped
+    def __init__(self, fail=False):
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self.calls = 0
+        self.fail = fail
+
+    def __call__(self, requested_at):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.calls += 1
+        self.release.wait(5)
+        self.running -= 1
+        if self.fail:
+            raise RuntimeError('banner API down')
+        return self.calls
+
+def test_scheduler_never_overlaps_and_coalesces_triggers():
+    job = SlowJob()
+    results = []
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            scheduler = refresh_utils.RefreshScheduler(job, results.append, executor)
+            statuses = [scheduler.trigger() for _ in range(3)]
+            await asyncio.sleep(0.05)
+            assert scheduler.status['running']
+            job.release.set()
+            await scheduler.wait()
+            return statuses, scheduler.status
+
+    statuses, status = asyncio.run(main())
+    assert statuses == ['started', 'queued', 'queued']
+    assert job.calls == 2 and job.max_running == 1
+    assert results == [1, 2]
+    assert status['runs'] == 2 and not status['running'] and status['last_error'] is None
+
+def test_scheduler_records_errors_and_runs_on_a_schedule():
+    job = SlowJob(fail=True)
+    job.release.set()
+    results = []
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scheduler = refresh_utils.RefreshScheduler(job, results.append, executor, interval=0.01)
+            scheduler.start()
+            await asyncio.sleep(0.2)
+            await scheduler.stop()
+            return scheduler.status
+
+    status = asyncio.run(main())
+    assert job.calls >= 2
+    assert results == []
+    assert status['last_trigger'] == 'schedule'
+    assert status['last_error'] == 'RuntimeError: banner API down'
+
+def test_scheduler_runs_when_another_process_requests_it(tmp_path):
+    job = SlowJob()
+    job.release.set()
+    trigger_path, status_path = str(tmp_path / 'trigger.json'), str(tmp_path / 'status.json')
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scheduler = refresh_utils.RefreshScheduler(job, lambda result: None, executor, trigger_path=trigger_path,
+                                                       status_path=status_path, poll_interval=0.01)
+            scheduler.start()
+            assert refresh_utils.read_status(status_path)['runs'] == 0
+            refresh_utils.request_refresh('webhook', trigger_path)
+            for _ in range(500):
+                await asyncio.sleep(0.01)
+                if scheduler.status['runs']:
+                    break
+            await scheduler.stop()
+
+    asyncio.run(main())
+    assert job.calls == 1
+    status = refresh_utils.read_status(status_path)
+    assert status['runs'] == 1 and status['last_trigger'] == 'webhook' and not status['pending']
+
+def test_build_revenue_features_matches_the_notebook():
+    revenue = dataloader_utils.load_revenue()
+    banners_jp = pd.read_pickle('./data/fixtures/all_banners_jp.pkl')
+    _, event_jp = dataloader_utils.load_events()
+
+    result = refresh_utils.build_revenue_features(revenue, banners_jp, event_jp)
+    expected = pickle.load(open('./data/fixtures/integration_testing/test_model_training/revenue.pkl', 'rb'))
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+def use_tmp_refresh_files(monkeypatch, tmp_path):
+    import api
+    monkeypatch.setattr(api, 'SCHEDULER_LOCK_PATH', str(tmp_path / 'scheduler'))
+    monkeypatch.setattr(api, 'REFRESH_TRIGGER_PATH', str(tmp_path / 'refresh_trigger.json'))
+    monkeypatch.setattr(api, 'REFRESH_STATUS_PATH', str(tmp_path / 'refresh_status.json'))
+
+def test_api_refresh_swaps_the_served_state(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    import api
+
+    job = SlowJob()
+    job.release.set()
+    use_tmp_refresh_files(monkeypatch, tmp_path)
+    monkeypatch.setattr(api, 'run_refresh', job)
+    monkeypatch.setattr(api, 'ProcessPoolExecutor', lambda **kwargs: ThreadPoolExecutor(max_workers=1))
+    monkeypatch.delenv('API_REFRESH_TOKEN', raising=False)
+    old_state = api.serving
+
+    with TestClient(api.app) as client:
+        assert client.post('/refresh').status_code == 403 # no token set
+
+    monkeypatch.setenv('API_REFRESH_TOKEN', 'secret')
+
+    with TestClient(api.app) as client:
+        assert client.post('/refresh').status_code == 403
+        response = client.post('/refresh', headers={'X-Refresh-Token': 'secret'})
+        assert response.status_code == 202 and response.json() == {'status': 'started'}
+
+        deadline = time.monotonic() + 5
+        while client.get('/refresh').json()['runs'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        status = client.get('/refresh').json()
+        assert status['runs'] == 1 and status['model_version'] == old_state.version
+        assert client.get('/six_month_forecast').json() == old_state.six_month_forecast
+
+    assert api.serving is not old_state
+    assert api.scheduler is None
+    with pytest.raises(Exception):
+        TestClient(api.app).post('/refresh', headers={'X-Refresh-Token': 'secret'}).raise_for_status()
+
+def test_api_workers_without_the_scheduler(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    import api
+
+    use_tmp_refresh_files(monkeypatch, tmp_path)
+    forecast_path = tmp_path / 'six_month_forecast.json'
+    forecast_path.write_text(open(api.FORECAST_PATH).read())
+    monkeypatch.setattr(api, 'FORECAST_PATH', str(forecast_path))
+    monkeypatch.setenv('API_REFRESH_TOKEN', 'secret')
+
+    # another worker holds the scheduler lock
+    with io_utils.file_lock(api.SCHEDULER_LOCK_PATH), TestClient(api.app) as client:
+        assert api.scheduler is None
+        io_utils.write_json({'running': True, 'runs': 3, 'pending': False}, api.REFRESH_STATUS_PATH)
+        assert client.get('/refresh').json()['runs'] == 3
+
+        response = client.post('/refresh', headers={'X-Refresh-Token': 'secret'})
+        assert response.status_code == 202 and response.json() == {'status': 'requested'}
+        assert refresh_utils.read_status(api.REFRESH_TRIGGER_PATH)['reason'] == 'webhook'
+
+        # the forecast written by the other worker's refresh is served, loaded outside the event loop
+        loaded_on_loop = []
+        serving_state = api.ServingState
+        def load_serving_state():
+            try:
+                loaded_on_loop.append(asyncio.get_running_loop() is not None)
+            except RuntimeError:
+                loaded_on_loop.append(False)
+            return serving_state()
+        monkeypatch.setattr(api, 'ServingState', load_serving_state)
+        forecast = {'dates': ['2030-01'], 'predictions': [1.0]}
+        io_utils.write_json(forecast, str(forecast_path))
+        assert client.get('/six_month_forecast').json() == forecast
+        assert loaded_on_loop == [False]
+
+    # and nothing runs refreshes once that worker is gone
+    with TestClient(api.app) as client:
+        assert api.scheduler is not None
+    assert TestClient(api.app).get('/refresh').status_code == 503
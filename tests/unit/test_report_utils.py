@@ -0,0 +1,55 @@
+import os
+
+import pandas as pd
+import utils.report_utils as report_utils
+from utils.report_utils import ReportFigure
+
+def make_figures(revenue):
+    return [ReportFigure('revenue', 'Revenue', 'Revenue', report_utils.plot_lines,
+                         {'series': {'Revenue': revenue}, 'title': 'Revenue'}),
+            ReportFigure('importance', 'Importance', 'Model', report_utils.plot_feature_importance,
+                         {'importance': pd.Series([0.2, 0.8], index=['lag6', 'Pickup Banner Count'])})]
+
+def test_render_figures_skips_unchanged_figures(tmp_path):
+    revenue = pd.Series([1e6, 3e6, 2e6], index=pd.date_range('2024-01-01', periods=3, freq='MS'))
+
+    result = report_utils.render_figures(make_figures(revenue), str(tmp_path), workers=1)
+    assert result['rendered'] == ['revenue', 'importance'] and result['skipped'] == []
+    assert (tmp_path / 'revenue.png').read_bytes()[:4] == b'\x89PNG'
+
+    # only the figure whose inputs changed is rendered again, in this process
+    result = report_utils.render_figures(make_figures(revenue * 2), str(tmp_path), workers=0)
+    assert result['rendered'] == ['revenue'] and result['skipped'] == ['importance']
+
+    os.remove(tmp_path / 'importance.png')
+    result = report_utils.render_figures(make_figures(revenue * 2), str(tmp_path), workers=0)
+    assert result['rendered'] == ['importance']
+
+    assert report_utils.render_figures(make_figures(revenue * 2), str(tmp_path), workers=0, force=True)['skipped'] == []
+
+def test_failed_figures_are_reported_and_retried(tmp_path):
+    figures = [ReportFigure('broken', 'Broken', 'Model', report_utils.plot_feature_importance, {'importance': None})]
+    result = report_utils.render_figures(figures, str(tmp_path), workers=0)
+    assert result['rendered'] == [] and result['failed']['broken'].startswith('AttributeError')
+
+    path = report_utils.write_html(figures, pd.DataFrame({'MAE': {'Final prediction': 1.5}}), str(tmp_path), result)
+    page = open(path, encoding='utf-8').read()
+    assert '<h2>Model</h2>' in page and 'Failed: AttributeError' in page and 'Final prediction' in page
+
+    assert report_utils.render_figures(figures, str(tmp_path), workers=0)['failed'].keys() == {'broken'}
+
+def test_inputs_are_only_built_for_rendered_figures(tmp_path):
+    built = []
+    def inputs():
+        built.append('importance')
+        return {'importance': pd.Series([0.2, 0.8], index=['lag6', 'Pickup Banner Count'])}
+    figures = [ReportFigure('importance', 'Importance', 'Model', report_utils.plot_feature_importance, inputs, 'v1')]
+
+    assert report_utils.render_figures(figures, str(tmp_path), workers=0)['rendered'] == ['importance']
+    assert report_utils.render_figures(figures, str(tmp_path), workers=0)['skipped'] == ['importance']
+    assert built == ['importance']
+
+    # the key follows depends_on, not the function
+    figures[0].depends_on = 'v2'
+    assert report_utils.render_figures(figures, str(tmp_path), workers=1)['rendered'] == ['importance']
+    assert built == ['importance'] * 2
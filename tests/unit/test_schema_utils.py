@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+import utils.schema_utils as schema_utils
+
+def make_banners():
+    starts = pd.to_datetime(['2024-01-01', '2024-01-08', '2024-01-15'])
+    return pd.DataFrame({'id': [1, 2, 3],
+                         'gachaType': ['PickupGacha', 'FesGacha', 'LimitedGacha'],
+                         'startedAt': starts.astype('int64') // 10**6,
+                         'endedAt': (starts + pd.Timedelta(days=7)).astype('int64') // 10**6,
+                         'rateups': [['a'], ['b'], ['c', 'd']],
+                         'startAt': starts,
+                         'endAt': starts + pd.Timedelta(days=7)})
+
+def test_dtype_checks_catch_renamed_and_retyped_columns():
+    banners = make_banners()
+    assert schema_utils.validate(banners, schema_utils.BANNERS) is banners
+
+    renamed = banners.rename(columns={'startAt': 'startDate'})
+    with pytest.raises(schema_utils.SchemaError, match=r"banners does not match its schema: missing columns \['startAt'\]"):
+        schema_utils.validate(renamed, schema_utils.BANNERS)
+
+    retyped = banners.assign(endAt=banners['endAt'].astype(str))
+    with pytest.raises(schema_utils.SchemaError, match="'endAt' has dtype object, expected datetime"):
+        schema_utils.validate(retyped, schema_utils.BANNERS)
+
+    # columns selected by position pick up whatever moved into their place
+    revenue = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=3, freq='MS'), 'JP': [1.0, 2.0, 3.0], 'Global': [1, 2, 3]})
+    schema_utils.validate(revenue, schema_utils.REVENUE)
+    with pytest.raises(schema_utils.SchemaError, match=r"unexpected columns \['Korea'\]"):
+        schema_utils.validate(revenue.assign(Korea=1.0), schema_utils.REVENUE)
+
+    schema_utils.validate(renamed, schema_utils.BANNERS, level='off')
+
+def test_value_checks_are_opt_in(monkeypatch):
+    banners = make_banners()
+    banners.loc[2, 'endAt'] = pd.Timestamp('2023-12-31')
+    banners.loc[1, 'id'] = 1
+
+    monkeypatch.setattr(schema_utils, 'VALIDATION', 'dtypes')
+    schema_utils.validate(banners, schema_utils.BANNERS) # the values are not read by default
+    with pytest.raises(schema_utils.SchemaError) as error:
+        schema_utils.validate(banners, schema_utils.BANNERS, level='full')
+    assert 'id is unique fails for rows [1]' in str(error.value)
+    assert 'endAt is not before startAt fails for rows [2]' in str(error.value)
+
+    monkeypatch.setattr(schema_utils, 'VALIDATION', 'full')
+    with pytest.raises(schema_utils.SchemaError):
+        schema_utils.validate(banners, schema_utils.BANNERS)
+
+    # spreadsheet dates may be text, but must parse
+    events = pd.DataFrame({'Name (EN)': ['a', 'b'], 'Start date': [pd.Timestamp('2024-01-01'), '2024-02-01'],
+                           'End date': pd.to_datetime(['2024-01-10', '2024-02-10']), 'Notes': [None, 'Rerun']})
+    schema_utils.validate(events, schema_utils.EVENTS_EN)
+    with pytest.raises(schema_utils.SchemaError, match=r"'Start date' has values that are not dates: \['soon'\]"):
+        schema_utils.validate(events.assign(**{'Start date': [pd.Timestamp('2024-01-01'), 'soon']}), schema_utils.EVENTS_EN)
+
+def test_load_banners_only_persists_valid_banners(monkeypatch):
+    import utils.dataloader_utils as dataloader_utils
+
+    class Response:
+        def json(self):
+            # the API renamed a field
+            return {'ended': [{'id': 1, 'gachaType': 'PickupGacha', 'startedAt': 0, 'endedAt': 1, 'rateUps': []}],
+                    'current': [], 'upcoming': []}
+
+    dumped = []
+    monkeypatch.setattr(dataloader_utils.requests, 'get', lambda url: Response())
+    monkeypatch.setattr(dataloader_utils.io_utils, 'dump_pickle', lambda obj, path: dumped.append(path))
+
+    banners_en, banners_jp = dataloader_utils.load_banners()
+    assert dumped == []
+    pd.testing.assert_frame_equal(banners_jp, pd.read_pickle('./data/fixtures/all_banners_jp.pkl'))
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import utils.cleaning_utils as cleaning_utils
+import utils.global_model_utils as global_model_utils
+import utils.ingest_utils as ingest_utils
+import utils.monitoring_utils as monitoring_utils
+import utils.synthetic_utils as synthetic_utils
+
+def test_banners_match_load_banners_schema():
+    banners = synthetic_utils.generate_banners(500, seed=1)
+    real = pd.read_pickle('./data/fixtures/all_banners_jp.pkl')
+
+    assert monitoring_utils.check_schema(banners, 'banners', monitoring_utils.BANNER_COLUMNS,
+                                         {'gachaType': monitoring_utils.GACHA_TYPES}) == []
+    assert banners.columns.tolist() == real.columns.tolist()
+    assert banners['id'].is_unique
+    assert (banners['startedAt'].diff().dropna() >= 0).all()
+    assert (banners['endedAt'] > banners['startedAt']).all()
+    assert (banners['startAt'] == pd.to_datetime(banners['startedAt'], unit='ms')).all()
+    assert banners['rateups'].map(len).isin([1, 2]).all()
+
+def test_generators_are_reproducible():
+    pd.testing.assert_frame_equal(synthetic_utils.generate_banners(300, seed=3), synthetic_utils.generate_banners(300, seed=3))
+    pd.testing.assert_frame_equal(synthetic_utils.generate_events(50, seed=3), synthetic_utils.generate_events(50, seed=3))
+    pd.testing.assert_frame_equal(synthetic_utils.generate_revenue(45, seed=3), synthetic_utils.generate_revenue(45, seed=3))
+    assert not synthetic_utils.generate_revenue(45, seed=3).equals(synthetic_utils.generate_revenue(45, seed=4))
+
+def test_chunks_continue_each_other():
+    chunks = list(synthetic_utils.iter_banners(250, seed=2, chunksize=100))
+    banners = pd.concat(chunks)
+
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert banners.index.equals(pd.RangeIndex(250))
+    assert banners['id'].is_unique and banners['startedAt'].is_monotonic_increasing
+
+    events = pd.concat(synthetic_utils.iter_events(250, seed=2, chunksize=100))
+    assert events['Start date'].is_monotonic_increasing
+    # reruns only repeat events that already happened
+    originals = events.loc[events['Name (EN)'].str.startswith('Event'), 'Name (EN)']
+    reruns = events.loc[events['Name (EN)'].str.startswith('(Rerun) '), 'Name (EN)'].str.removeprefix('(Rerun) ')
+    first_seen = pd.Series(originals.index, index=originals.values)
+    assert (first_seen.loc[reruns.values].to_numpy() < reruns.index.to_numpy()).all()
+
+def test_revenue_follows_banners():
+    banners = synthetic_utils.generate_banners(600, seed=0)
+    revenue = synthetic_utils.generate_revenue(60, banners=banners, seed=0)
+    activity = synthetic_utils.banner_activity(banners, revenue['Date'])
+
+    assert revenue.columns.tolist() == ['Date', 'JP', 'Global']
+    assert (revenue[['JP', 'Global']] > 0).all().all()
+    assert (revenue['Global'] < revenue['JP']).mean() > 0.9
+    assert activity['PickupGacha'].sum() > activity['LimitedGacha'].sum() > activity['FesGacha'].sum()
+
+    # months with a fes banner earn more
+    has_fes = activity['FesGacha'] > 0
+    assert revenue.loc[has_fes, 'JP'].median() > revenue.loc[~has_fes, 'JP'].median()
+
+    # the banners can be streamed in chunks
+    chunks = list(synthetic_utils.iter_banners(600, seed=0, chunksize=64))
+    pd.testing.assert_frame_equal(synthetic_utils.generate_revenue(60, banners=iter(chunks), seed=0),
+                                  synthetic_utils.generate_revenue(60, banners=pd.concat(chunks), seed=0))
+
+    daily = synthetic_utils.generate_revenue(400, freq='D', seed=0)
+    assert len(daily) == 400 and daily['Date'].diff().dropna().eq(pd.Timedelta(days=1)).all()
+
+def test_events_and_story_match_the_sheets():
+    events = synthetic_utils.generate_events(200, seed=0)
+    assert monitoring_utils.check_schema(events, 'events', monitoring_utils.EVENT_COLUMNS) == []
+    assert (events['End date'] > events['Start date']).all()
+
+    cleaned = cleaning_utils.clean_event_data(events)
+    assert set(cleaned['Notes']) <= set(monitoring_utils.EVENT_NOTES)
+    assert (cleaned['Notes'] == 'Rerun').sum() == events['Name (EN)'].str.startswith('(Rerun) ').sum()
+
+    story = synthetic_utils.generate_story(10, seed=0)
+    assert story.columns.tolist() == ['Volume', 'Full Name', 'Chapter', 'Part', 'Release Date']
+    assert story['Release Date'].is_monotonic_increasing
+    assert story['Part'].isna().any() and story['Part'].notna().any()
+
+def test_revenue_panel_feeds_the_global_model(tmp_path):
+    panel = pd.concat(synthetic_utils.iter_revenue_panel(30, 36, seed=0, chunksize=8))
+    assert len(panel) == 30 * 36
+    assert panel['series'].nunique() == 30
+    assert (panel['revenue'] > 0).all()
+
+    features, scales = global_model_utils.create_global_features(panel)
+    assert len(scales) == 30
+    assert np.isfinite(features.drop(columns=['series', 'Date']).to_numpy(dtype=float)).all()
+
+    path = tmp_path / 'events.xlsx'
+    assert ingest_utils.write_excel_chunks(synthetic_utils.iter_events(120, chunksize=50), path) == 120
+    assert len(pd.concat(ingest_utils.iter_excel_chunks(path, chunksize=50))) == 120
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import wraps
+import copy
+import hashlib
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils import io_utils
+
+# set PIPELINE_CACHE=0 to turn memoization off, and PIPELINE_CACHE_DIR to also cache results on disk
+CACHE_ENABLED = os.environ.get('PIPELINE_CACHE', '1') != '0'
+CACHE_DIR = os.environ.get('PIPELINE_CACHE_DIR')
+
+# object columns of a single kind are hashed with pandas' vectorized hash_array,
+# mixed ones (where 1 and '1' would hash the same) are pickled
+_HASHABLE_KINDS = {'string', 'bytes', 'empty', 'boolean', 'integer', 'floating', 'date', 'datetime', 'decimal'}
+
+def fingerprint(*objs) -> str:
+    '''
+    A fast content hash of DataFrames, Series, arrays and plain Python values.
+
+    DataFrames are hashed column by column from their underlying buffers
+    (numeric and datetime columns as raw bytes, object columns with pandas'
+    vectorized hash_array), together with their column names, dtypes and
+    index, so equal inputs give the same fingerprint in any process.
+
+    Parameters
+    ----------
+    *objs
+        The values to hash together.
+
+    Returns
+    -------
+    str
+        A 32 character hex digest.
+
+    Raises
+    ------
+    TypeError
+        If a value cannot be hashed (e.g. it cannot be pickled).
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for obj in objs:
+        _update(digest, obj)
+    return digest.hexdigest()
+
+def _update(digest, obj):
+    digest.update(type(obj).__name__.encode())
+    if isinstance(obj, pd.DataFrame):
+        _update(digest, obj.index)
+        _update(digest, obj.columns)
+        for _, column in obj.items():
+            _update_values(digest, column.array)
+    elif isinstance(obj, pd.Series):
+        _update(digest, obj.name)
+        _update(digest, obj.index)
+        _update_values(digest, obj.array)
+    elif isinstance(obj, pd.RangeIndex):
+        _update(digest, (obj.start, obj.stop, obj.step, obj.name))
+    elif isinstance(obj, pd.Index):
+        _update(digest, obj.names)
+        _update_values(digest, obj.array)
+    elif isinstance(obj, np.ndarray):
+        _update_values(digest, obj)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(str(len(obj)).encode())
+        for item in obj:
+            _update(digest, item)
+    elif isinstance(obj, dict):
+        digest.update(str(len(obj)).encode())
+        for key, value in obj.items():
+            _update(digest, key)
+            _update(digest, value)
+    elif obj is None or isinstance(obj, (str, bytes, bool, int, float, np.generic)):
+        digest.update(repr(obj).encode())
+    else:
+        try:
+            digest.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            raise TypeError(f'Cannot fingerprint {type(obj).__name__}: {e}') from e
+
+def _update_values(digest, values):
+    digest.update(str(values.dtype).encode())
+    digest.update(str(values.shape).encode())
+    if isinstance(values, pd.Categorical):
+        _update_values(digest, values.codes)
+        _update(digest, values.categories)
+        return
+
+    values = np.asarray(values)
+    if values.dtype != object:
+        digest.update(np.ascontiguousarray(values).view(np.uint8).data)
+    elif pd.api.types.infer_dtype(values, skipna=True) in _HASHABLE_KINDS:
+        digest.update(pd.util.hash_array(values.ravel()).data)
+    else:
+        digest.update(pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL))
+
+class CacheStats:
+    '''
+    Hit and miss counts of a memoized function.
+    '''
+
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncacheable = 0 # calls whose arguments could not be fingerprinted
+
+    def as_dict(self) -> dict:
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'uncacheable': self.uncacheable}
+
+memoized_functions = [] # every memoized function, for cache_report
+
+def memoize(maxsize: int = 32, disk: bool = True):
+    '''
+    Caches the results of a pure function of DataFrames, keyed by the fingerprint of its arguments.
+
+    Results are kept in a bounded in-memory LRU cache and, if PIPELINE_CACHE_DIR
+    is set (and disk is True), also pickled there, so they survive restarts
+    (e.g. of the notebook kernel). Each call returns a copy of the cached
+    result, so callers can modify it.
+
+    The decorated function gets cache_info() (the hit and miss counts and the
+    cache size) and cache_clear() (empties the in-memory cache), like functools.lru_cache.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The number of results kept in memory, by default 32.
+    disk : bool, optional
+        Whether to use the on-disk cache when PIPELINE_CACHE_DIR is set, by default True.
+    '''
+    def decorator(func):
+        # the bytecode is part of the key, so editing the function invalidates its disk cache
+        # (but not editing the functions it calls: clear PIPELINE_CACHE_DIR then)
+        name = f'{func.__module__}.{func.__qualname__}'
+        code = hashlib.blake2b(func.__code__.co_code + repr(func.__code__.co_consts).encode(), digest_size=8).hexdigest()
+        cache = OrderedDict()
+        stats = CacheStats()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return func(*args, **kwargs)
+            try:
+                key = fingerprint(name, code, args, kwargs)
+            except TypeError:
+                stats.uncacheable += 1
+                return func(*args, **kwargs)
+
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    stats.hits += 1
+                    return copy.deepcopy(cache[key])
+
+            path = os.path.join(CACHE_DIR, f'{key}.pkl') if disk and CACHE_DIR else None
+            if path is not None and os.path.exists(path):
+                with open(path, 'rb') as file:
+                    result = pickle.load(file)
+                stats.disk_hits += 1
+            else:
+                result = func(*args, **kwargs)
+                stats.misses += 1
+                if path is not None:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    io_utils.dump_pickle(result, path)
+
+            with lock:
+                cache[key] = copy.deepcopy(result)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return result
+
+        def cache_info() -> dict:
+            return {**stats.as_dict(), 'maxsize': maxsize, 'currsize': len(cache)}
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        memoized_functions.append(wrapper)
+        return wrapper
+    return decorator
+
+def cache_report() -> pd.DataFrame:
+    '''
+    The cache statistics of every memoized function.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per function, with its hits, disk hits, misses and cache size.
+    '''
+    return pd.DataFrame({f'{func.__module__}.{func.__qualname__}': func.cache_info() for func in memoized_functions}).T
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.deterministic import CalendarFourier, DeterministicProcess
+
+CALENDAR_START = '2021-01-01'
+CALENDAR_END = '2035-12-31'
+
+def fourier_terms(freq: str = 'MS') -> list[CalendarFourier]:
+    '''
+    The fourier terms used for seasonality at a given data frequency.
+
+    Parameters
+    ----------
+    freq : str, optional
+        The frequency of the data, by default 'MS' (monthly).
+        Daily data ('D') also gets weekly terms.
+
+    Returns
+    -------
+    list[CalendarFourier]
+        The fourier terms.
+    '''
+    terms = [CalendarFourier(freq="YE", order=4)]
+    if freq == 'D':
+        terms.append(CalendarFourier(freq="W", order=3))
+    return terms
+
+class TrendProcess:
+    '''
+    A drop-in replacement for DeterministicProcess(index=y_train.index, order=1).
+
+    in_sample() and out_of_sample() return read-only, zero-copy slices of 
+    a cached trend array, instead of rebuilding it. Use get_trend_process 
+    to create one.
+    '''
+
+    def __init__(self, trend: np.ndarray, n_train: int):
+        self._trend = trend
+        self.n_train = n_train
+
+    def _slice(self, start: int, stop: int) -> pd.DataFrame:
+        if stop > len(self._trend):
+            raise ValueError(f'Trend terms are only cached for {len(self._trend)} periods, {stop} were requested.')
+        return pd.DataFrame(self._trend[start:stop], columns=['trend'], index=pd.RangeIndex(start, stop), copy=False)
+
+    def in_sample(self) -> pd.DataFrame:
+        '''
+        Trend terms for the training rows (1, 2, ..., n_train).
+        '''
+        return self._slice(0, self.n_train)
+
+    def out_of_sample(self, steps: int) -> pd.DataFrame:
+        '''
+        Trend terms for the steps rows after the training rows.
+        '''
+        return self._slice(self.n_train, self.n_train + steps)
+
+class CalendarFeatures:
+    '''
+    Fourier terms precomputed once over a long date range.
+
+    The terms are stored as one contiguous, read-only array, so any 
+    contiguous window of dates is a zero-copy slice. Use get_calendar 
+    to share a single instance between training, backtesting and inference.
+
+    Parameters
+    ----------
+    freq : str, optional
+        The frequency of the calendar, by default 'MS' (monthly).
+    start : str, optional
+        The first date of the calendar, by default CALENDAR_START.
+    end : str, optional
+        The last date of the calendar, by default CALENDAR_END.
+    '''
+
+    def __init__(self, freq: str = 'MS', start: str = CALENDAR_START, end: str = CALENDAR_END):
+        self.freq = freq
+        self.index = pd.date_range(start=start, end=end, freq=freq)
+
+        dp = DeterministicProcess(
+            index=self.index,
+            constant=False,
+            order=0,
+            seasonal=False,
+            additional_terms=fourier_terms(freq),
+            drop=True,
+        )
+        X = dp.in_sample()
+        if freq == 'D':
+            X = X.astype('float32') # 30x more rows than monthly, so keep the matrix small
+
+        self.columns = X.columns
+        self.values = np.ascontiguousarray(X.to_numpy())
+        self.values.flags.writeable = False
+
+    def covers(self, start, end) -> bool:
+        '''
+        Whether the calendar covers every date from start to end.
+        '''
+        return self.index[0] <= pd.Timestamp(start) and pd.Timestamp(end) <= self.index[-1]
+
+    def fourier(self, start, end) -> pd.DataFrame:
+        '''
+        Fourier terms for every calendar date from start to end (inclusive).
+
+        Parameters
+        ----------
+        start, end
+            The first and last dates of the window.
+
+        Returns
+        -------
+        pd.DataFrame
+            The fourier terms indexed by date. The values are a read-only view 
+            of the cached array, so call .copy() before modifying them.
+        '''
+        if not self.covers(start, end):
+            raise ValueError(f'Dates from {start} to {end} are outside of the calendar '
+                             f'({self.index[0].date()} to {self.index[-1].date()}).')
+        
+        first = self.index.searchsorted(pd.Timestamp(start), side='left')
+        last = self.index.searchsorted(pd.Timestamp(end), side='right')
+        return pd.DataFrame(self.values[first:last], index=self.index[first:last], columns=self.columns, copy=False)
+
+@lru_cache(maxsize=None)
+def get_calendar(freq: str = 'MS') -> CalendarFeatures:
+    '''
+    Returns the shared CalendarFeatures for a frequency, building it on first use.
+
+    Parameters
+    ----------
+    freq : str, optional
+        The frequency of the calendar, by default 'MS' (monthly).
+
+    Returns
+    -------
+    CalendarFeatures
+        The cached calendar features.
+    '''
+    return CalendarFeatures(freq)
+
+@lru_cache(maxsize=None)
+def _trend_terms() -> np.ndarray:
+    # same values as the 'trend' column of DeterministicProcess(order=1),
+    # long enough for daily data over the whole calendar
+    n_periods = len(pd.date_range(start=CALENDAR_START, end=CALENDAR_END, freq='D'))
+    trend = np.arange(1, n_periods + 1, dtype=np.float64).reshape(-1, 1)
+    trend.flags.writeable = False
+    return trend
+
+def get_trend_process(n_train: int) -> TrendProcess:
+    '''
+    Trend terms for a model trained on n_train rows, backed by a shared cached array.
+
+    Parameters
+    ----------
+    n_train : int
+        The number of training rows.
+
+    Returns
+    -------
+    TrendProcess
+        Has the same in_sample() and out_of_sample() methods as DeterministicProcess.
+    '''
+    return TrendProcess(_trend_terms(), n_train)
+
@@ -1,7 +1,17 @@
 from __future__ import annotations
 
+import re
+
+import numpy as np
 import pandas as pd
 
+from utils import cache_utils
+
+EVENT_CATEGORIES = ['Collaboration Event', 'Rerun', 'Operation', 'Other']
+
+# one group per category, in order of priority (e.g. a collab rerun is a Collaboration Event)
+_EVENT_CATEGORY_PATTERN = re.compile(r'(collab)|(rerun)|(operation)', re.IGNORECASE)
+
 def drop_global_data_from_revenue(revenue: pd.DataFrame) -> pd.DataFrame:
     '''
     Drops global revenue from the revenue dataframe.
@@ -96,10 +106,98 @@ def group_all_operation_events_together(event_jp: pd.DataFrame) -> pd.DataFrame:
     event_jp.loc[event_jp["Notes"].str.contains("Operation", case=False, na=False), "Notes"] = "Operation"
     return event_jp
 
+def classify_note(note: str) -> str:
+    '''
+    Classifies an event into one of EVENT_CATEGORIES based on its notes.
+
+    Events with notes containing 'collab', 'rerun' or 'operation' (in that order
+    of priority, ignoring case) are a 'Collaboration Event', 'Rerun' or 'Operation'.
+    All other events, including those without notes, are 'Other'.
+
+    Parameters
+    ----------
+    note : str
+        The notes of the event.
+
+    Returns
+    -------
+    str
+        The category of the event.
+    '''
+    if not isinstance(note, str):
+        return 'Other'
+    matched_groups = {match.lastindex for match in _EVENT_CATEGORY_PATTERN.finditer(note)}
+    return EVENT_CATEGORIES[min(matched_groups) - 1] if matched_groups else 'Other'
+
+def classify_notes(notes: pd.Series) -> pd.Categorical:
+    '''
+    Classifies each event like classify_note.
+
+    Each distinct note is only classified once, so this is fast for long tables.
+
+    Parameters
+    ----------
+    notes : pd.Series
+        The notes of each event.
+
+    Returns
+    -------
+    pd.Categorical
+        The category of each event, with EVENT_CATEGORIES as categories.
+    '''
+    note_codes, unique_notes = pd.factorize(notes)
+
+    # classify the distinct notes, plus 'Other' for missing notes (code -1)
+    unique_categories = [classify_note(note) for note in unique_notes] + ['Other']
+    category_codes = np.array([EVENT_CATEGORIES.index(category) for category in unique_categories])
+    return pd.Categorical.from_codes(category_codes[note_codes], categories=EVENT_CATEGORIES)
+
+@cache_utils.memoize()
+def normalize_events(event_jp: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Derives the canonical name, notes, rerun flag and category of each event in one pass.
+
+    This does the same as remove_rerun_prefix, mark_duplicates_as_rerun and 
+    group_all_operation_events_together combined, and classifies the cleaned 
+    notes like classify_note. It is memoized on the content of the events 
+    table, so it is only computed once even when used by both the plots and 
+    the features.
+
+    Parameters
+    ----------
+    event_jp : pd.DataFrame
+        Dataframe containing event information.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with the same index as event_jp, and columns 'Name (EN)' 
+        (without the rerun prefix), 'Notes' (cleaned), 'Is Rerun' and 'Category' 
+        (categorical, one of EVENT_CATEGORIES).
+    '''
+    names = event_jp['Name (EN)'].str.removeprefix('(Rerun) ')
+    is_duplicate = names.duplicated().to_numpy()
+
+    # fill missing notes with Original/Rerun, then group all operations together
+    notes = event_jp['Notes'].to_numpy(dtype=object, copy=True)
+    is_missing = pd.isna(notes)
+    notes[is_missing] = np.where(is_duplicate[is_missing], 'Rerun', 'Original')
+    notes[pd.Series(notes).str.contains('Operation', case=False, na=False).to_numpy()] = 'Operation'
+    categories = classify_notes(pd.Series(notes, index=event_jp.index))
+
+    normalized = pd.DataFrame({'Name (EN)': names,
+                               'Notes': notes,
+                               'Is Rerun': categories == 'Rerun',
+                               'Category': categories},
+                              index=event_jp.index)
+    return normalized
+
+@cache_utils.memoize()
 def clean_event_data(event_jp):
     '''
     Cleans the event data by removing rerun prefixes, marking duplicates as reruns,
-    and grouping all operation events together. (combination of above functions)
+    and grouping all operation events together. (combination of above functions,
+    done in one pass by normalize_events)
 
     Parameters
     ----------
@@ -111,7 +209,9 @@ def clean_event_data(event_jp):
     pd.DataFrame
         Cleaned event dataframe.
     '''
-    event_jp = remove_rerun_prefix(event_jp)
-    event_jp = mark_duplicates_as_rerun(event_jp)
-    event_jp = group_all_operation_events_together(event_jp)
+    normalized = normalize_events(event_jp)
+
+    event_jp = event_jp.copy()
+    event_jp['Name (EN)'] = normalized['Name (EN)']
+    event_jp['Notes'] = normalized['Notes']
     return event_jp
\ No newline at end of file
@@ -1,6 +1,17 @@
+from contextlib import contextmanager
+import io
+import numpy as np
+
 import pandas as pd
 import requests
 
+from utils import cache_utils, ingest_utils, io_utils, schema_utils
+
+BANNER_SOURCES = {'en': 'https://api.ennead.cc/buruaka/banner',
+                  'jp': 'https://api.ennead.cc/buruaka/banner?region=japan'}
+REVENUE_WORKBOOKS = {'Blue Archive': [('./data/reddit-monthly-revenue-report.xlsx', 3),
+                                      ('./data/revenue-ennead-cc-revenue-report.xlsx', None)]}
+
 def load_revenue() -> pd.DataFrame:
     '''
     Loads revenue into dataframes from excel files.
@@ -13,13 +24,14 @@ def load_revenue() -> pd.DataFrame:
     reddit_data = pd.read_excel('./data/reddit-monthly-revenue-report.xlsx', engine='openpyxl').iloc[:, :3]
     ennead_data = pd.read_excel('./data/revenue-ennead-cc-revenue-report.xlsx', engine='openpyxl')
     revenue = pd.concat([reddit_data, ennead_data], ignore_index=True)
-    return revenue
+    return schema_utils.validate(revenue, schema_utils.REVENUE)
 
 def load_banners() -> tuple[pd.DataFrame, pd.DataFrame]:
     '''
     Attempts to load fresh banner information from an API.
 
-    If unsuccessful, loads a serialized df of banner info.
+    If unsuccessful (including when the banners do not match schema_utils.BANNERS),
+    loads a serialized df of banner info. Only valid banners are serialized.
 
     Returns
     -------
@@ -29,34 +41,145 @@ def load_banners() -> tuple[pd.DataFrame, pd.DataFrame]:
 
     try:
         # raise Exception("Simulated API failure for testing purposes.")
-        banner_en = requests.get('https://api.ennead.cc/buruaka/banner').json()
-        all_banners_en = banner_en['ended'] + banner_en['current'] + banner_en['upcoming']
-        all_banners_en = pd.DataFrame(all_banners_en)
-
-        all_banners_en['startAt'] = pd.to_datetime(all_banners_en['startedAt'], unit='ms')
-        all_banners_en['endAt'] = pd.to_datetime(all_banners_en['endedAt'], unit='ms')
-        all_banners_en = all_banners_en.sort_values(by='startAt')
-
-        banner_jp = requests.get('https://api.ennead.cc/buruaka/banner?region=japan').json()
-        all_banners_jp = banner_jp['ended'] + banner_jp['current'] + banner_jp['upcoming']
-        all_banners_jp = pd.DataFrame(all_banners_jp)
-
-        all_banners_jp['startAt'] = pd.to_datetime(all_banners_jp['startedAt'], unit='ms')
-        all_banners_jp['endAt'] = pd.to_datetime(all_banners_jp['endedAt'], unit='ms')
-        all_banners_jp = all_banners_jp.sort_values(by='startAt')
+        all_banners = {}
+        for region, url in BANNER_SOURCES.items():
+            banners = requests.get(url).json()
+            banners = pd.DataFrame(banners['ended'] + banners['current'] + banners['upcoming'])
+            banners['startAt'] = pd.to_datetime(banners['startedAt'], unit='ms')
+            banners['endAt'] = pd.to_datetime(banners['endedAt'], unit='ms')
+            # checked before the fixtures are overwritten, so a broken payload falls back to the last good banners
+            all_banners[region] = schema_utils.validate(banners.sort_values(by='startAt'), schema_utils.BANNERS)
+        all_banners_en, all_banners_jp = all_banners['en'], all_banners['jp']
 
         # serialize data (in case API goes down in the future)
-        all_banners_en.to_pickle('./data/fixtures/all_banners_en.pkl')
-        all_banners_jp.to_pickle('./data/fixtures/all_banners_jp.pkl')
+        # written atomically, so other processes reading the fixtures never see a partial file
+        io_utils.dump_pickle(all_banners_en, './data/fixtures/all_banners_en.pkl')
+        io_utils.dump_pickle(all_banners_jp, './data/fixtures/all_banners_jp.pkl')
 
     except Exception as e:
         print(Exception, ": ", e)
         print("Serialized banner data will be used instead.")
-        all_banners_en = pd.read_pickle('./data/fixtures/all_banners_en.pkl')
-        all_banners_jp = pd.read_pickle('./data/fixtures/all_banners_jp.pkl')
-        
+        all_banners_en, all_banners_jp = load_banner_fixtures()
+
     return all_banners_en, all_banners_jp
 
+def load_banner_fixtures() -> tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    Loads the banners last serialized by load_banners, without going to the API.
+
+    Returns
+    -------
+    pd.DataFrame, pd.DataFrame
+        The banner dataframes for EN and JP regions respectively.
+    '''
+    all_banners_en = schema_utils.validate(pd.read_pickle('./data/fixtures/all_banners_en.pkl'), schema_utils.BANNERS)
+    all_banners_jp = schema_utils.validate(pd.read_pickle('./data/fixtures/all_banners_jp.pkl'), schema_utils.BANNERS)
+    return all_banners_en, all_banners_jp
+
+def ingest_banners(dataset_path: str = './data/datasets/banners', sources: dict = None, 
+                   chunksize: int = 10000) -> ingest_utils.PartitionedDatasetWriter:
+    '''
+    Streams banner information into a Parquet dataset partitioned by region.
+
+    Unlike load_banners, the JSON payloads are never fully loaded: banners are 
+    parsed one at a time and written in chunks, so memory stays bounded 
+    however long the banner history is. Requires pyarrow.
+
+    Parameters
+    ----------
+    dataset_path : str, optional
+        The directory of the dataset, by default './data/datasets/banners'.
+    sources : dict, optional
+        Maps each region to the URL or file of its banner JSON, by default BANNER_SOURCES.
+    chunksize : int, optional
+        The number of banners per written chunk, by default 10000.
+
+    Returns
+    -------
+    ingest_utils.PartitionedDatasetWriter
+        The writer, with the written files and the number of banners.
+    '''
+    writer = ingest_utils.PartitionedDatasetWriter(dataset_path, partition_cols=['region'])
+    for region, source in (sources or BANNER_SOURCES).items():
+        with _open_text(source) as file:
+            banners = (banner for _, banner in ingest_utils.iter_json_array_items(file, keys=['ended', 'current', 'upcoming']))
+            for chunk in ingest_utils.iter_batches(banners, chunksize):
+                chunk = pd.DataFrame(chunk)
+                chunk['startAt'] = pd.to_datetime(chunk['startedAt'], unit='ms')
+                chunk['endAt'] = pd.to_datetime(chunk['endedAt'], unit='ms')
+                chunk['region'] = region
+                writer.write(chunk)
+    return writer
+
+def ingest_revenue(dataset_path: str = './data/datasets/revenue', workbooks: dict = None, 
+                   chunksize: int = 10000) -> ingest_utils.PartitionedDatasetWriter:
+    '''
+    Reads revenue workbooks in row chunks into a Parquet dataset partitioned by title.
+
+    Unlike load_revenue, the workbooks are streamed rather than loaded and 
+    concatenated, so many titles (or daily revenue) can be ingested with 
+    bounded memory. Requires pyarrow.
+
+    Parameters
+    ----------
+    dataset_path : str, optional
+        The directory of the dataset, by default './data/datasets/revenue'.
+    workbooks : dict, optional
+        Maps each title to a list of (path, number of columns to read or None), 
+        by default REVENUE_WORKBOOKS.
+    chunksize : int, optional
+        The number of rows per written chunk, by default 10000.
+
+    Returns
+    -------
+    ingest_utils.PartitionedDatasetWriter
+        The writer, with the written files and the number of rows.
+    '''
+    writer = ingest_utils.PartitionedDatasetWriter(dataset_path, partition_cols=['title'])
+    for title, title_workbooks in (workbooks or REVENUE_WORKBOOKS).items():
+        for path, usecols in title_workbooks:
+            for chunk in ingest_utils.iter_excel_chunks(path, chunksize=chunksize, usecols=usecols):
+                # the same types in every file, so the dataset has one schema
+                chunk['Date'] = pd.to_datetime(chunk['Date'])
+                regions = chunk.columns.drop('Date')
+                chunk[regions] = chunk[regions].apply(pd.to_numeric, errors='coerce').astype('float64')
+                chunk['title'] = title
+                writer.write(chunk)
+    return writer
+
+def load_revenue_dataset(dataset_path: str = './data/datasets/revenue', title: str = 'Blue Archive') -> pd.DataFrame:
+    '''
+    Loads the revenue of one title from a dataset written by ingest_revenue.
+
+    Only the files of that title are read.
+
+    Parameters
+    ----------
+    dataset_path : str, optional
+        The directory of the dataset, by default './data/datasets/revenue'.
+    title : str, optional
+        The title, by default 'Blue Archive'.
+
+    Returns
+    -------
+    pd.DataFrame
+        The revenue dataframe, like load_revenue.
+    '''
+    revenue = ingest_utils.read_dataset(dataset_path, filters=[('title', '==', title)])
+    revenue = revenue.drop(columns=['title']).sort_values('Date', kind='stable').reset_index(drop=True)
+    return schema_utils.validate(revenue, schema_utils.REVENUE)
+
+@contextmanager
+def _open_text(source: str):
+    if source.startswith(('http://', 'https://')):
+        with requests.get(source, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True # undo gzip etc.
+            yield io.TextIOWrapper(response.raw, encoding='utf-8')
+    else:
+        with open(source, 'r', encoding='utf-8') as file:
+            yield file
+
 def load_story_jp() -> pd.DataFrame:
     '''
     Loads story data for the JP region.
@@ -67,7 +190,7 @@ def load_story_jp() -> pd.DataFrame:
         The story dataframe for the JP region.
     '''
     story_jp = pd.read_excel('./data/story-jp.xlsx').iloc[:, :5]
-    return story_jp
+    return schema_utils.validate(story_jp, schema_utils.STORY_JP)
 
 def load_events() -> tuple[pd.DataFrame, pd.DataFrame]:
     '''
@@ -80,8 +203,9 @@ def load_events() -> tuple[pd.DataFrame, pd.DataFrame]:
     '''
     event_en = pd.read_excel('./data/event-en.xlsx')
     event_jp = pd.read_excel('./data/event-jp.xlsx').iloc[:, :5]
-    return event_en, event_jp
+    return schema_utils.validate(event_en, schema_utils.EVENTS_EN), schema_utils.validate(event_jp, schema_utils.EVENTS_JP)
 
+@cache_utils.memoize()
 def categorize_banners(banners_df: pd.DataFrame) -> dict[str, pd.DataFrame]:
     '''
     Categorizes banners by gacha type.
@@ -99,11 +223,10 @@ def categorize_banners(banners_df: pd.DataFrame) -> dict[str, pd.DataFrame]:
     dict[str, pd.DataFrame]
         A dictionary categorizing banners by gacha type, with keys 'fes', 'pickup', and 'limited'.
     '''
-    
-    fes_banners_jp = banners_df[banners_df['gachaType'] == 'FesGacha']
-    pickup_banners_jp = banners_df[banners_df['gachaType'] == 'PickupGacha']
-    limited_banners_jp = banners_df[banners_df['gachaType'] == 'LimitedGacha']
+    # one grouping pass instead of a boolean mask per gacha type
+    rows = banners_df.groupby('gachaType', sort=False).indices
+    no_rows = np.array([], dtype=np.intp)
 
-    return {'fes': fes_banners_jp, 
-            'pickup': pickup_banners_jp, 
-            'limited': limited_banners_jp}
\ No newline at end of file
+    return {'fes': banners_df.iloc[rows.get('FesGacha', no_rows)], 
+            'pickup': banners_df.iloc[rows.get('PickupGacha', no_rows)], 
+            'limited': banners_df.iloc[rows.get('LimitedGacha', no_rows)]}
\ No newline at end of file
@@ -1,7 +1,11 @@
+import numpy as np
 import pandas as pd
-from statsmodels.tsa.deterministic import CalendarFourier, DeterministicProcess
+from statsmodels.tsa.deterministic import DeterministicProcess
 
-def create_fourier_features(revenue):
+from utils import cache_utils, calendar_utils, cleaning_utils
+
+@cache_utils.memoize()
+def create_fourier_features(revenue, freq='MS'):
     '''
     Creates fourier features for seasonality, and merges them into the revenue DataFrame.
 
@@ -9,26 +13,39 @@ def create_fourier_features(revenue):
     ----------
     revenue : pd.DataFrame
         The revenue DataFrame.
+    freq : str, optional
+        The frequency of the revenue data, by default 'MS' (monthly).
+        Use 'D' for daily data, which also adds weekly fourier terms 
+        and returns the terms as float32.
+
+        Dates within the shared calendar (see calendar_utils) reuse its 
+        precomputed terms; other dates are computed on the fly.
 
     Returns
     -------
     pd.DataFrame
         The revenue DataFrame with added fourier features.
     '''
-    fourier = CalendarFourier(freq="YE", order=4)
+    calendar = calendar_utils.get_calendar(freq)
+    start, end = revenue['Date'].min(), revenue['Date'].max()
 
-    revenue_copy = revenue.copy()
-    revenue_copy = revenue_copy.set_index('Date').asfreq('MS')
+    if calendar.covers(start, end):
+        X = calendar.fourier(start, end)
+    else:
+        revenue_copy = revenue.copy()
+        revenue_copy = revenue_copy.set_index('Date').asfreq(freq)
 
-    dp = DeterministicProcess(
-        index=revenue_copy.index,
-        constant=False,
-        order=0,
-        seasonal=False,
-        additional_terms=[fourier],
-        drop=True,
-    )
-    X = dp.in_sample()
+        dp = DeterministicProcess(
+            index=revenue_copy.index,
+            constant=False,
+            order=0,
+            seasonal=False,
+            additional_terms=calendar_utils.fourier_terms(freq),
+            drop=True,
+        )
+        X = dp.in_sample()
+        if freq == 'D':
+            X = X.astype('float32') # 30x more rows than monthly, so keep the matrix small
     
     revenue = revenue.merge(X, left_on='Date', right_index=True) # similar to SQL inner join
 
@@ -55,22 +72,57 @@ def group_into_monthly_count(banners: pd.DataFrame, revenue: pd.DataFrame) -> pd
         A DataFrame with monthly counts of banner events.
     '''
     
+    counts, _ = _group_intervals_into_months(banners['startAt'], banners['endAt'],
+                                             np.zeros(len(banners), dtype=np.intp), 1, revenue['Date'])
     monthly_count = pd.DataFrame(revenue['Date'])
-    monthly_count['Banner Count'] = 0
-    for banner in banners.iterrows():
-        start_month = banner[1]['startAt'].to_period('M').to_timestamp()
-        end_month = banner[1]['endAt'].to_period('M').to_timestamp()
-        if start_month == end_month:
-            if start_month in monthly_count['Date'].values:
-                monthly_count.loc[monthly_count['Date'] == start_month, 'Banner Count'] += 1
-        else:
-            if start_month in monthly_count['Date'].values:
-                monthly_count.loc[monthly_count['Date'] == start_month, 'Banner Count'] += 1
-            if end_month in monthly_count['Date'].values:
-                monthly_count.loc[monthly_count['Date'] == end_month, 'Banner Count'] += 1
-
+    monthly_count['Banner Count'] = counts[:, 0]
     return monthly_count
 
+def _group_intervals_into_months(starts: pd.Series, ends: pd.Series, groups: np.ndarray, n_groups: int,
+                                 dates: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    # the monthly counts and coverage of each group of intervals, both (n_months, n_groups),
+    # for months that are in dates. Intervals with a negative group are skipped.
+    months = pd.Index(dates)
+    starts = starts.to_numpy(dtype='datetime64[s]')
+    ends = ends.to_numpy(dtype='datetime64[s]')
+    keep = (groups >= 0) & ~np.isnat(starts) & ~np.isnat(ends)
+    starts, ends, groups = starts[keep], ends[keep], groups[keep]
+
+    # counted in the start month and, if different, in the end month
+    start_rows = months.get_indexer(starts.astype('datetime64[M]').astype('datetime64[ns]'))
+    end_rows = months.get_indexer(ends.astype('datetime64[M]').astype('datetime64[ns]'))
+    end_rows[end_rows == start_rows] = -1
+    counts = np.zeros(len(months) * n_groups, dtype=np.int64)
+    for rows in [start_rows, end_rows]:
+        is_counted = rows >= 0
+        counts += np.bincount(rows[is_counted] * n_groups + groups[is_counted], minlength=len(counts))
+
+    # the active time of a group up to t is sum(clip(t - start, 0, end - start)) 
+    # = sum over starts before t of (t - start) - sum over ends before t of (t - end).
+    # All groups are sorted together, with each group's times offset by a span 
+    # longer than all of them, so one searchsorted answers every month and group.
+    month_starts = months.to_numpy(dtype='datetime64[M]')
+    bounds = np.stack([month_starts, month_starts + 1]).astype('datetime64[s]').astype(np.int64)
+    month_seconds = (bounds[1] - bounds[0]).astype(np.float64)
+    coverage = np.zeros((len(months), n_groups))
+    if len(starts):
+        origin = starts.astype(np.int64).min()
+        span = ends.astype(np.int64).max() - origin + 1
+        bounds = np.clip(bounds - origin, 0, span - 1)
+        offsets = np.arange(n_groups, dtype=np.int64) * span
+        queries = bounds[:, :, None] + offsets # (2, n_months, n_groups)
+
+        active = np.zeros(queries.shape, dtype=np.float64)
+        for times, sign in [(starts, 1), (ends, -1)]:
+            times = times.astype(np.int64) - origin
+            keys = np.sort(groups * span + times)
+            cumsum = np.concatenate([[0], np.cumsum(keys - np.repeat(offsets, np.bincount(groups, minlength=n_groups)))])
+            n_before = np.searchsorted(keys, queries, side='right')
+            n_group = np.searchsorted(keys, offsets, side='left')
+            active += sign * ((n_before - n_group) * (queries - offsets) - (cumsum[n_before] - cumsum[n_group]))
+        coverage = (active[1] - active[0]) / month_seconds[:, None]
+    return counts.reshape(len(months), n_groups), coverage
+
 def group_event_into_monthly_count(events: pd.DataFrame, revenue: pd.DataFrame) -> pd.DataFrame:
     '''
     Group events into monthly counts.
@@ -106,4 +158,258 @@ def group_event_into_monthly_count(events: pd.DataFrame, revenue: pd.DataFrame)
             if end_month in monthly_count['Date'].values:
                 monthly_count.loc[monthly_count['Date'] == end_month, 'Event Count'] += 1
 
-    return monthly_count
\ No newline at end of file
+    return monthly_count
+
+def group_event_types_into_monthly_count(events: pd.DataFrame, revenue: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Group events into monthly counts per event type, and add them to revenue.
+
+    Events are counted like group_event_into_monthly_count, in their start 
+    and end months. The event types are the cleaned notes from 
+    cleaning_utils.normalize_events (e.g. 'Original', 'Rerun', 'Operation'), 
+    which is cached per events table. 
+
+    Parameters
+    ----------
+    events : pd.DataFrame
+        The input DataFrame containing event data.
+
+    revenue : pd.DataFrame
+        The revenue DataFrame.
+
+    Returns
+    -------
+    pd.DataFrame
+        The revenue DataFrame with a '{event type} Count' column per event type.
+    '''
+    notes = cleaning_utils.normalize_events(events)['Notes']
+    note_codes, event_types = pd.factorize(notes)
+
+    months = pd.Index(revenue['Date'])
+    start_rows = months.get_indexer(events['Start date'].dt.to_period('M').dt.to_timestamp())
+    end_rows = months.get_indexer(events['End date'].dt.to_period('M').dt.to_timestamp())
+    end_rows[end_rows == start_rows] = -1 # events within one month are counted once
+
+    counts = np.zeros((len(months), len(event_types)), dtype=np.int64)
+    for rows in [start_rows, end_rows]:
+        is_counted = rows >= 0
+        np.add.at(counts, (rows[is_counted], note_codes[is_counted]), 1)
+
+    revenue = revenue.copy()
+    for i, event_type in enumerate(event_types):
+        revenue[f'{event_type} Count'] = counts[:, i]
+    return revenue
+
+# the gacha types counted by group_banner_types_into_monthly_count, and their feature names
+BANNER_TYPES = {'PickupGacha': 'Pickup', 'LimitedGacha': 'Limited', 'FesGacha': 'Fes'}
+
+def group_banners_into_monthly_tensor(banners: dict[str, pd.DataFrame], revenue: pd.DataFrame, 
+                                      gacha_types: list = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Group the banners of every gacha type and region into monthly counts and coverage, in one pass.
+
+    Banners are counted like group_into_monthly_count, in their start and 
+    end months. The coverage is the number of banner-days in the month 
+    divided by the days of the month, e.g. 1.5 if on average 1.5 banners 
+    of that type were running.
+
+    Parameters
+    ----------
+    banners : dict[str, pd.DataFrame]
+        The banners of each region (from dataloader_utils.load_banners), e.g. {'jp': all_banners_jp}.
+    revenue : pd.DataFrame
+        The monthly revenue DataFrame.
+    gacha_types : list, optional
+        The gacha types, by default those of BANNER_TYPES. Banners of other types are not counted.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The int64 counts and float64 coverage, both of shape (month, gacha type, region).
+    '''
+    gacha_types = list(BANNER_TYPES) if gacha_types is None else gacha_types
+    table = pd.concat([region_banners[['gachaType', 'startAt', 'endAt']] for region_banners in banners.values()],
+                      ignore_index=True)
+    regions = np.repeat(np.arange(len(banners)), [len(region_banners) for region_banners in banners.values()])
+    types = pd.Index(gacha_types).get_indexer(table['gachaType'])
+    groups = np.where(types >= 0, regions * len(gacha_types) + types, -1)
+
+    counts, coverage = _group_intervals_into_months(table['startAt'], table['endAt'], groups, 
+                                                    len(banners) * len(gacha_types), revenue['Date'])
+    shape = (len(revenue), len(banners), len(gacha_types))
+    return counts.reshape(shape).transpose(0, 2, 1), coverage.reshape(shape).transpose(0, 2, 1)
+
+def group_banner_types_into_monthly_count(banners: dict[str, pd.DataFrame], revenue: pd.DataFrame, 
+                                          coverage: bool = False, tidy: bool = False) -> pd.DataFrame:
+    '''
+    Group the banners into monthly counts per gacha type and region, and add them to revenue.
+
+    This replaces calling group_into_monthly_count once per category of 
+    dataloader_utils.categorize_banners: the counts are the same, but all 
+    of them come from one pass over the banners (see group_banners_into_monthly_tensor).
+
+    Parameters
+    ----------
+    banners : dict[str, pd.DataFrame]
+        The banners of each region, e.g. {'jp': all_banners_jp}.
+    revenue : pd.DataFrame
+        The monthly revenue DataFrame.
+    coverage : bool, optional
+        Whether to also add the coverage of each gacha type, by default False.
+    tidy : bool, optional
+        Whether to return one row per month, region and gacha type 
+        (with 'Date', 'region', 'gachaType', 'Banner Count' and 
+        'Banner Coverage' columns) instead, by default False.
+
+    Returns
+    -------
+    pd.DataFrame
+        The revenue DataFrame with a '{type} Banner Count' column per gacha 
+        type of BANNER_TYPES (e.g. 'Pickup Banner Count') and, if coverage, 
+        a '{type} Banner Coverage' column. With several regions, the region 
+        is added to the names, e.g. 'Pickup Banner Count (JP)'.
+    '''
+    counts, coverages = group_banners_into_monthly_tensor(banners, revenue)
+
+    if tidy:
+        index = pd.MultiIndex.from_product([revenue['Date'], list(BANNER_TYPES), list(banners)],
+                                           names=['Date', 'gachaType', 'region'])
+        tidy_count = pd.DataFrame({'Banner Count': counts.ravel(), 'Banner Coverage': coverages.ravel()}, index=index)
+        return tidy_count.reset_index()[['Date', 'region', 'gachaType', 'Banner Count', 'Banner Coverage']]
+
+    revenue = revenue.copy()
+    for j, region in enumerate(banners):
+        suffix = f' ({region.upper()})' if len(banners) > 1 else ''
+        for i, name in enumerate(BANNER_TYPES.values()):
+            revenue[f'{name} Banner Count{suffix}'] = counts[:, i, j]
+        if coverage:
+            for i, name in enumerate(BANNER_TYPES.values()):
+                revenue[f'{name} Banner Coverage{suffix}'] = coverages[:, i, j]
+    return revenue
+
+def group_into_daily_activity(intervals: pd.DataFrame, revenue: pd.DataFrame, by: str = None, 
+                              start_col: str = 'startAt', end_col: str = 'endAt', 
+                              count_name: str = 'Banner Count') -> pd.DataFrame:
+    '''
+    Group banners or events into daily activity counts.
+
+    Unlike the monthly grouping functions, an interval is counted on every 
+    day it is active, from its start day up to and including its end day. 
+    For example, if 2 banners are running on 3 March 2023, the result will 
+    have a row for 3 March 2023 with a count of 2.
+
+    The counts are built with a difference array instead of iterating over 
+    rows, so this stays fast at daily resolution.
+
+    Parameters
+    ----------
+    intervals : pd.DataFrame
+        The input DataFrame containing banner or event data.
+    revenue : pd.DataFrame
+        The daily revenue DataFrame. 'Date' must be sorted.
+    by : str, optional
+        Column to split the counts by (e.g. 'gachaType' or 'Notes'). One column 
+        named '{category} Count' is created per category. By default None, 
+        which creates a single column named count_name.
+    start_col : str, optional
+        Column containing the start of each interval, by default 'startAt'.
+    end_col : str, optional
+        Column containing the end of each interval, by default 'endAt'.
+    count_name : str, optional
+        Name of the count column when by is None, by default 'Banner Count'.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame with daily float32 activity counts.
+    '''
+    days = revenue['Date'].to_numpy(dtype='datetime64[D]')
+    starts = intervals[start_col].to_numpy(dtype='datetime64[D]')
+    ends = intervals[end_col].to_numpy(dtype='datetime64[D]')
+
+    # +1 on the first active day, -1 on the day after the last active day
+    first = np.searchsorted(days, starts, side='left')
+    after_last = np.searchsorted(days, ends, side='right')
+
+    if by is None:
+        codes = np.zeros(len(intervals), dtype=np.intp)
+        names = [count_name]
+    else:
+        codes, categories = pd.factorize(intervals[by], sort=True)
+        names = [f'{category} Count' for category in categories]
+        # intervals without a category (code -1) are not counted
+        first, after_last, codes = first[codes >= 0], after_last[codes >= 0], codes[codes >= 0]
+
+    width = len(days) + 1
+    delta = (np.bincount(codes * width + first, minlength=len(names) * width)
+             - np.bincount(codes * width + after_last, minlength=len(names) * width))
+    counts = np.cumsum(delta.reshape(len(names), width)[:, :-1], axis=1).T.astype(np.float32)
+
+    daily_count = pd.DataFrame(counts, columns=names, index=revenue.index)
+    daily_count.insert(0, 'Date', revenue['Date'])
+    return daily_count
+
+
+def create_story_features(story: pd.DataFrame, revenue: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Creates main story features for each period of revenue.
+
+    The features are:
+    - 'Story Release Count': the number of story parts released in the period.
+    - 'Periods Since Story': the number of periods since the period of the latest 
+      release (0 if a part was released in this period). Releases before 
+      the first period count as one period before it.
+    - 'Story Finale': 1 if a volume's last release falls in the period. 
+      A volume counts as finished once a later release belongs to another 
+      volume, so the latest release of an ongoing volume is not flagged.
+
+    Releases are matched to periods with a sorted searchsorted/merge_asof 
+    join instead of iterating over rows, so this works for monthly and 
+    daily revenue.
+
+    Parameters
+    ----------
+    story : pd.DataFrame
+        The story DataFrame (from dataloader_utils.load_story_jp), with 
+        'Volume' and 'Release Date' columns.
+    revenue : pd.DataFrame
+        The revenue DataFrame. 'Date' must be sorted, one row per period.
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame with the 'Date' and story features of each period.
+    '''
+    # some release dates are strings, e.g. '05/27/2021'
+    releases = pd.DataFrame({'Volume': story['Volume'].astype(str).to_numpy(),
+                             'Release Date': pd.to_datetime(story['Release Date'], format='mixed').to_numpy()})
+    releases = releases.dropna(subset=['Release Date']).sort_values('Release Date', kind='stable')
+
+    # the period containing each release (-1 if before the first period), 
+    # without the releases after the last period
+    dates = revenue['Date'].to_numpy(dtype='datetime64[ns]')
+    n = len(dates)
+    freq = pd.infer_freq(dates) if n >= 3 else None
+    end = dates[-1] + (pd.tseries.frequencies.to_offset(freq) if freq else dates[-1] - dates[max(n - 2, 0)])
+    releases = releases[releases['Release Date'] < pd.Timestamp(end)]
+    releases = releases.assign(period=np.searchsorted(dates, releases['Release Date'].to_numpy(), side='right') - 1)
+
+    release_count = np.bincount(releases.loc[releases['period'] >= 0, 'period'], minlength=n)
+
+    # the latest release period at or before each period
+    periods = pd.DataFrame({'period': np.arange(n)})
+    release_periods = releases[['period']].drop_duplicates().rename(columns={'period': 'release_period'})
+    latest = pd.merge_asof(periods, release_periods, left_on='period', right_on='release_period', direction='backward')
+    since = (latest['period'] - latest['release_period'].fillna(-1)).to_numpy()
+
+    # a volume's last release, if another volume is released after it
+    is_last = ~releases.duplicated(subset='Volume', keep='last').to_numpy()
+    is_followed = releases['Volume'].to_numpy() != releases['Volume'].iloc[-1] if len(releases) else is_last
+    finale_periods = releases['period'].to_numpy()[is_last & is_followed]
+    finale = np.bincount(finale_periods[finale_periods >= 0], minlength=n) > 0
+
+    story_features = pd.DataFrame({'Story Release Count': release_count,
+                                   'Periods Since Story': since.astype(np.int64),
+                                   'Story Finale': finale.astype(np.int64)}, index=revenue.index)
+    story_features.insert(0, 'Date', revenue['Date'])
+    return story_features
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from importlib.util import find_spec
+import gzip
+import hashlib
+import json
+import threading
+
+# The API's response formats, chosen from the Accept and Accept-Encoding headers.
+# MessagePack needs msgpack, Arrow needs pyarrow and Brotli needs brotli; formats
+# whose package is not installed are not offered.
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+MEDIA_TYPES = [JSON] + [MSGPACK] * (find_spec('msgpack') is not None) + [ARROW] * (find_spec('pyarrow') is not None)
+ENCODINGS = ['br'] * (find_spec('brotli') is not None) + ['gzip', 'identity'] # preferred first
+
+MEDIA_TYPE_ALIASES = {'application/x-msgpack': MSGPACK, 'application/vnd.msgpack': MSGPACK,
+                      'application/vnd.apache.arrow.file': ARROW}
+
+# bodies smaller than this are not compressed, the headers would cost more than they save
+MINIMUM_COMPRESS_SIZE = 500
+
+def _parse_header(header: str) -> dict:
+    # 'a/b;q=0.5, c/d' -> {'a/b': 0.5, 'c/d': 1.0}
+    weights = {}
+    for item in header.split(','):
+        value, *params = [part.strip() for part in item.split(';')]
+        if not value:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(number)
+                except ValueError:
+                    weight = 0.0
+        weights[value.lower()] = weight
+    return weights
+
+def negotiate_media_type(accept: str, media_types: list = None) -> str | None:
+    '''
+    Picks the response format from an Accept header.
+
+    Parameters
+    ----------
+    accept : str
+        The Accept header, e.g. 'application/msgpack, application/json;q=0.5'.
+        Empty means anything.
+    media_types : list, optional
+        The formats offered, preferred first, by default MEDIA_TYPES.
+
+    Returns
+    -------
+    str or None
+        The accepted format with the highest weight (the preferred one if
+        several have the same weight), or None if none is acceptable.
+    '''
+    media_types = MEDIA_TYPES if media_types is None else media_types
+    weights = {MEDIA_TYPE_ALIASES.get(value, value): weight for value, weight in _parse_header(accept or '*/*').items()}
+
+    def weight(media_type):
+        # the most specific match counts, e.g. 'application/json' over '*/*'
+        for pattern in [media_type, media_type.split('/')[0] + '/*', '*/*']:
+            if pattern in weights:
+                return weights[pattern]
+        return 0.0
+
+    best = max(media_types, key=weight)
+    return best if weight(best) > 0 else None
+
+def negotiate_encoding(accept_encoding: str, encodings: list = None) -> str:
+    '''
+    Picks the content encoding from an Accept-Encoding header.
+
+    Parameters
+    ----------
+    accept_encoding : str
+        The Accept-Encoding header, e.g. 'gzip, br'. Empty means no compression.
+    encodings : list, optional
+        The encodings offered, preferred first, by default ENCODINGS.
+
+    Returns
+    -------
+    str
+        'br', 'gzip' or 'identity'.
+    '''
+    encodings = ENCODINGS if encodings is None else encodings
+    weights = _parse_header(accept_encoding or '')
+
+    def weight(encoding):
+        default = 1.0 if encoding == 'identity' else 0.0 # identity is acceptable unless refused
+        return weights.get(encoding, weights.get('*', default))
+
+    best = max(encodings, key=weight)
+    return best if weight(best) > 0 else 'identity'
+
+def encode(payload: dict, media_type: str) -> bytes:
+    '''
+    Serializes a response payload.
+
+    Parameters
+    ----------
+    payload : dict
+        The payload. For Arrow, it must be a table: lists of the same
+        length (e.g. {'dates': [...], 'predictions': [...]}).
+    media_type : str
+        JSON, MSGPACK or ARROW.
+
+    Returns
+    -------
+    bytes
+        The body. JSON is encoded like FastAPI's JSONResponse, floats are
+        float64 in MessagePack and Arrow, so no precision is lost.
+    '''
+    if media_type == JSON:
+        return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+    if media_type == MSGPACK:
+        import msgpack
+        return msgpack.packb(payload)
+    if media_type == ARROW:
+        import pyarrow as pa
+        table = pa.table(payload)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f'Unknown media type: {media_type}')
+
+def compress(body: bytes, encoding: str, best: bool = False) -> tuple[bytes, str]:
+    '''
+    Compresses a body.
+
+    Parameters
+    ----------
+    body : bytes
+        The body.
+    encoding : str
+        'br', 'gzip' or 'identity'.
+    best : bool, optional
+        Whether to use the highest (slowest) compression level, e.g. for
+        bodies that are compressed once and cached, by default False.
+
+    Returns
+    -------
+    tuple[bytes, str]
+        The compressed body and its encoding, which is 'identity' if the
+        body is shorter than MINIMUM_COMPRESS_SIZE.
+    '''
+    if encoding == 'identity' or len(body) < MINIMUM_COMPRESS_SIZE:
+        return body, 'identity'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9 if best else 6, mtime=0), encoding
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(body, quality=11 if best else 5), encoding
+    raise ValueError(f'Unknown encoding: {encoding}')
+
+class EncodedBodies:
+    '''
+    The response bodies of one payload, in every requested format and
+    encoding, each encoded and compressed once (at the highest level).
+
+    Keep one per payload version (e.g. on the API's ServingState), so a
+    new forecast starts with an empty cache.
+
+    Parameters
+    ----------
+    payload : dict
+        The payload, e.g. the forecast.
+
+    Attributes
+    ----------
+    version : str
+        A hash of the payload (12 hex characters), e.g. for ETags. It changes
+        whenever the payload does, whatever produced it.
+    '''
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.version = hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()[:12]
+        self._bodies = {} # (media_type, encoding) -> (body, encoding)
+        self._lock = threading.Lock()
+
+    def get(self, media_type: str, encoding: str) -> tuple[bytes, str, bool]:
+        '''
+        The body of the payload in a format and encoding.
+
+        Returns
+        -------
+        tuple[bytes, str, bool]
+            The body, its encoding (see compress) and whether it was cached.
+        '''
+        key = (media_type, encoding)
+        with self._lock:
+            if key in self._bodies:
+                return (*self._bodies[key], True)
+            uncompressed = self._bodies.get((media_type, 'identity'))
+            body = uncompressed[0] if uncompressed else encode(self.payload, media_type)
+            self._bodies[(media_type, 'identity')] = (body, 'identity')
+            self._bodies[key] = compress(body, encoding, best=True)
+            return (*self._bodies[key], False)
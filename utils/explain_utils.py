@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import inference_utils, io_utils
+from utils.inference_utils import model_version
+from utils.matrix_utils import FeatureMatrix
+
+EXPLANATIONS_PATH = 'data/results/explanations.json'
+
+MAX_CACHED_VERSIONS = 5 # older model versions are dropped from the cache
+
+def explain_forecast(trend_model, residual_model, X: pd.DataFrame, time_index, months: list) -> dict:
+    '''
+    Explains each forecast month as the trend plus the SHAP contribution of each residual feature.
+
+    The contributions are exact TreeSHAP values from XGBoost (pred_contribs),
+    computed for all months in one call. For each month, the trend, the base
+    value and the contributions add up to the prediction.
+
+    Parameters
+    ----------
+    trend_model
+        The trend model, e.g. from model_utils.fit_spline_trend_model.
+    residual_model : xgboost.XGBRegressor
+        The residual model, e.g. from model_utils.fit_XGB_residual_model.
+    X : pd.DataFrame or FeatureMatrix
+        The residual model features of the forecast months.
+    time_index : array-like
+        The trend index of the forecast months, e.g. dp.out_of_sample(steps=len(X)).
+    months : list
+        The label of each forecast month, e.g. '2025-08'.
+
+    Returns
+    -------
+    dict
+        Maps each month to its 'prediction', 'trend', 'base_value' (the
+        residual model's expected output) and feature 'contributions'.
+    '''
+    import xgboost # only needed here, so the API can load this module without it
+
+    booster = residual_model.get_booster()
+    if isinstance(X, FeatureMatrix):
+        # its float32 block, in the order the model was fit with
+        X = X if booster.feature_names is None else X.select(booster.feature_names)
+        dmatrix, columns = xgboost.DMatrix(X.values, feature_names=X.feature_names), X.feature_names
+    else:
+        dmatrix, columns = xgboost.DMatrix(X), X.columns
+
+    # the last column is the base value, shared by all rows
+    contributions = booster.predict(dmatrix, pred_contribs=True)
+    trend = trend_model.predict(np.asarray(time_index).reshape(len(X), -1))
+
+    explanations = {}
+    for month, trend_value, row in zip(months, trend, contributions.astype(np.float64)):
+        explanations[month] = {'prediction': float(trend_value + row.sum()),
+                               'trend': float(trend_value),
+                               'base_value': float(row[-1]),
+                               'contributions': dict(zip(columns, row[:-1].tolist()))}
+    return explanations
+
+def feature_importance(explanations: dict) -> dict:
+    '''
+    The mean absolute SHAP contribution of each feature over the explained months.
+
+    Parameters
+    ----------
+    explanations : dict
+        Explanations from explain_forecast.
+
+    Returns
+    -------
+    dict
+        Maps each feature to its importance, most important first.
+    '''
+    if not explanations:
+        return {}
+    contributions = pd.DataFrame([explanation['contributions'] for explanation in explanations.values()])
+    return contributions.abs().mean().sort_values(ascending=False).to_dict()
+
+def update_explanations(trend_model, residual_model, X: pd.DataFrame, time_index, months: list,
+                        path: str = EXPLANATIONS_PATH) -> dict:
+    '''
+    Explains the forecast and adds it to the explanations cache, which is served by the API.
+
+    The cache is keyed by model version and forecast month, so months that
+    were already explained with the same models are not recomputed.
+
+    Parameters
+    ----------
+    trend_model, residual_model, X, time_index, months
+        See explain_forecast.
+    path : str, optional
+        The cache file, by default EXPLANATIONS_PATH.
+
+    Returns
+    -------
+    dict
+        The cache entry of the current model version, with its 'feature_importance'
+        and the explanation of each month in 'months'.
+    '''
+    version = model_version(inference_utils.export_trend_model(trend_model, path=None),
+                            inference_utils.export_residual_model(residual_model, path=None))
+
+    cache = {'latest': None, 'versions': {}}
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            cache = json.load(file)
+
+    entry = cache['versions'].pop(version, {'months': {}})
+    months = list(months)
+    is_new = np.array([month not in entry['months'] for month in months], dtype=bool)
+    if is_new.any():
+        new_months = [month for month, new in zip(months, is_new) if new]
+        entry['months'].update(explain_forecast(trend_model, residual_model, X[is_new],
+                                                np.asarray(time_index).reshape(len(X), -1)[is_new], new_months))
+        entry['months'] = dict(sorted(entry['months'].items()))
+    entry['feature_importance'] = feature_importance(entry['months'])
+
+    # the current version goes last, so the oldest versions are dropped first
+    cache['versions'][version] = entry
+    for old_version in list(cache['versions'])[:-MAX_CACHED_VERSIONS]:
+        del cache['versions'][old_version]
+    cache['latest'] = version
+
+    io_utils.write_json(cache, path)
+    return entry
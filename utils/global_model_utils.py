@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from numpy.lib.stride_tricks import sliding_window_view
+from xgboost import XGBRegressor
+from utils import model_utils
+
+import numpy as np
+import pandas as pd
+
+def revenue_to_panel(revenue: pd.DataFrame, series_cols: list = None) -> pd.DataFrame:
+    '''
+    Stacks the revenue columns of a wide revenue DataFrame into one long panel.
+
+    For example, the 'JP' and 'Global' revenue become two series. The other
+    columns (e.g. banner counts and Fourier terms) are shared by all series.
+
+    Parameters
+    ----------
+    revenue : pd.DataFrame
+        The revenue DataFrame, with a 'Date' column.
+    series_cols : list, optional
+        The revenue columns, by default ['JP', 'Global'] (those present).
+
+    Returns
+    -------
+    pd.DataFrame
+        The panel, with 'series', 'Date' and 'revenue' columns plus the shared features.
+    '''
+    if series_cols is None:
+        series_cols = [col for col in ['JP', 'Global'] if col in revenue.columns]
+    shared = revenue.drop(columns=series_cols)
+
+    panel = pd.concat([shared.assign(series=col, revenue=revenue[col]) for col in series_cols], ignore_index=True)
+    return panel[['series', 'Date', 'revenue'] + shared.columns.drop('Date').tolist()]
+
+def create_global_features(panel: pd.DataFrame, target: str = 'revenue', lags: list = None, window_size: int = 4,
+                           train_end=None) -> tuple[pd.DataFrame, pd.Series]:
+    '''
+    Builds the features of all series at once, for a single global model.
+
+    The panel is pivoted into a (series x month) array, so the lags and rolling
+    statistics of every series are computed with a few array operations instead
+    of per series. Each series is divided by its mean revenue (its scale), so
+    series of different sizes share the same trees.
+
+    The features are the same as create_XGB_features: lags and the rolling std
+    (shifted by 1) of the normalized revenue, and the shared features of the panel
+    except those drop_columns_residual drops (model_utils.RESIDUAL_DROPPED_COLUMNS),
+    plus the 'series' id as a categorical feature.
+
+    Parameters
+    ----------
+    panel : pd.DataFrame
+        Long data with 'series', 'Date' and target columns, plus numeric
+        features, e.g. from revenue_to_panel. One row per series and month.
+    target : str, optional
+        The revenue column, by default 'revenue'.
+    lags : list, optional
+        The lag periods to add, by default None, which means [6].
+    window_size : int, optional
+        The window size of the rolling statistics, by default 4.
+    train_end : optional
+        If given, the scales only use revenue up to this date, so the test
+        months do not leak into the features.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.Series]
+        The features, with 'Date' and the normalized target, for all rows
+        where the lags are available, and the scale of each series.
+    '''
+    if lags is None:
+        lags = [6]
+
+    series_codes, series_ids = pd.factorize(panel['series'], sort=True)
+    date_codes, dates = pd.factorize(pd.to_datetime(panel['Date']), sort=True)
+    if pd.Series(series_codes * len(dates) + date_codes).duplicated().any():
+        raise ValueError('The panel has more than one row for some series and month.')
+
+    values = np.full((len(series_ids), len(dates)), np.nan)
+    values[series_codes, date_codes] = panel[target].to_numpy(dtype=np.float64)
+
+    # per-series normalization
+    in_train = np.ones(len(dates), dtype=bool) if train_end is None else dates <= pd.Timestamp(train_end)
+    with np.errstate(invalid='ignore'):
+        scales = np.nanmean(np.where(in_train, values, np.nan), axis=1)
+    scales = np.where(np.isfinite(scales) & (scales != 0), scales, 1.0)
+    values = values / scales[:, None]
+
+    columns = {}
+    for lag in lags:
+        columns[f'lag{lag}'] = _shift(values, lag)
+
+    # rolling std of the previous window_size months, like make_rolling_stats
+    shifted = _shift(values, 1)
+    rolling_std = np.full_like(values, np.nan)
+    if len(dates) >= window_size:
+        rolling_std[:, window_size - 1:] = sliding_window_view(shifted, window_size, axis=1).std(axis=-1, ddof=1)
+    columns[f'rolling_std_{window_size}'] = rolling_std
+
+    # back to one row per series and month, in the order of the panel
+    features = pd.DataFrame({
+        'series': pd.Categorical.from_codes(series_codes, categories=series_ids),
+        'Date': dates[date_codes],
+        target: values[series_codes, date_codes],
+    }, index=panel.index)
+    for name, array in columns.items():
+        features[name] = array[series_codes, date_codes]
+    # a panel of synthetic or other titles may not have every feature of the JP revenue
+    for col in panel.columns.drop(['series', 'Date', target]).difference(model_utils.RESIDUAL_DROPPED_COLUMNS, sort=False):
+        features[col] = panel[col]
+
+    features = features.dropna(subset=[target] + list(columns))
+    return features.sort_values(['Date', 'series'], kind='stable'), pd.Series(scales, index=series_ids, name='scale')
+
+def _shift(values: np.ndarray, periods: int) -> np.ndarray:
+    shifted = np.full_like(values, np.nan)
+    if periods < values.shape[1]:
+        shifted[:, periods:] = values[:, :values.shape[1] - periods]
+    return shifted
+
+def fit_global_model(features: pd.DataFrame, target: str = 'revenue', **params) -> XGBRegressor:
+    '''
+    Fits one XGB model on the normalized revenue of all series.
+
+    The model uses the 'hist' tree method with native categorical support
+    for the 'series' id, so the cost of training grows with the number of
+    rows rather than with one model per series.
+
+    Parameters
+    ----------
+    features : pd.DataFrame
+        The training rows from create_global_features.
+    target : str, optional
+        The target column, by default 'revenue'.
+    **params
+        Overrides the XGBRegressor parameters.
+
+    Returns
+    -------
+    XGBRegressor
+        The fit global model.
+    '''
+    params = {'n_estimators': 40, 'learning_rate': 0.1, 'tree_method': 'hist', 'enable_categorical': True, **params}
+    global_model = XGBRegressor(**params)
+    global_model.fit(features.drop(columns=['Date', target]), features[target])
+    return global_model
+
+def predict_global_model(global_model: XGBRegressor, features: pd.DataFrame, scales: pd.Series,
+                         target: str = 'revenue') -> pd.Series:
+    '''
+    Predicts the revenue of each row, undoing the per-series normalization.
+
+    Parameters
+    ----------
+    global_model : XGBRegressor
+        The model from fit_global_model.
+    features : pd.DataFrame
+        Rows from create_global_features.
+    scales : pd.Series
+        The scale of each series, from create_global_features.
+    target : str, optional
+        The target column, dropped if present, by default 'revenue'.
+
+    Returns
+    -------
+    pd.Series
+        The predicted revenue, with the index of features.
+    '''
+    X = features.drop(columns=['Date', target], errors='ignore')
+    predictions = global_model.predict(X) * scales.reindex(features['series'].astype(object)).to_numpy()
+    return pd.Series(predictions, index=features.index, name=target)
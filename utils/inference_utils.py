@@ -0,0 +1,411 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from utils import io_utils
+from utils.matrix_utils import FeatureMatrix
+
+# Only numpy (and io_utils) is imported here, so the API can serve predictions without xgboost or sklearn.
+# export_trend_model and export_residual_model convert the fitted models into plain arrays.
+TREND_MODEL_PATH = 'data/saved_models/trend_model.json'
+RESIDUAL_MODEL_PATH = 'data/saved_models/xgb_residual_model.npz'
+
+# The pair of models the API serves. publish_models saves both into their own
+# directory under 'versions', then points the manifest at it, so a reader never
+# sees a new trend with an old residual model.
+MODEL_MANIFEST_PATH = 'data/saved_models/manifest.json'
+KEPT_MODEL_VERSIONS = 3 # older version directories are deleted
+
+class PiecewiseLinearTrend:
+    '''
+    The spline trend model as a closed-form piecewise-linear function.
+
+    A degree-1 spline is a line between each pair of knots, so it is fully
+    described by its knots, its value at the first knot, and the slope of
+    each segment. Outside of the knots, the first and last segments are
+    continued (the same as extrapolation='continue' in SplineTransformer).
+
+    Parameters
+    ----------
+    knots : array-like
+        The (increasing) knot positions, in units of the trend index.
+    intercept : float
+        The trend value at the first knot.
+    slopes : array-like
+        The slope of each segment between consecutive knots.
+    '''
+
+    def __init__(self, knots, intercept, slopes):
+        self.knots = np.asarray(knots, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.slopes = np.asarray(slopes, dtype=np.float64)
+        if len(self.slopes) != len(self.knots) - 1:
+            raise ValueError(f'Expected {len(self.knots) - 1} slopes for {len(self.knots)} knots, got {len(self.slopes)}.')
+
+        # the value at the start of each segment
+        self.values = self.intercept + np.concatenate([[0.0], np.cumsum(self.slopes * np.diff(self.knots))])
+
+    def evaluate(self, x) -> np.ndarray:
+        '''
+        Evaluate the trend at any number of points, e.g. a (scenarios, horizons) grid.
+
+        Parameters
+        ----------
+        x : array-like
+            The trend index, of any shape.
+
+        Returns
+        -------
+        np.ndarray
+            The trend, with the same shape as x.
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        # points before the first (after the last) knot use the first (last) segment
+        segment = np.clip(np.searchsorted(self.knots, x, side='right') - 1, 0, len(self.slopes) - 1)
+        return self.values[segment] + self.slopes[segment] * (x - self.knots[segment])
+
+    def predict(self, time_index) -> np.ndarray:
+        '''
+        Evaluate the trend, like trend_model.predict.
+
+        Parameters
+        ----------
+        time_index : array-like
+            The trend index (e.g. dp.in_sample()), of shape (n,) or (n, 1).
+
+        Returns
+        -------
+        np.ndarray
+            The trend, of shape (n,).
+        '''
+        return self.evaluate(np.asarray(time_index, dtype=np.float64).reshape(-1))
+
+    def to_bytes(self) -> bytes:
+        '''
+        Serialize the trend as the knots, followed by the intercept and the slopes (float64).
+        '''
+        return np.concatenate([self.knots, [self.intercept], self.slopes]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> PiecewiseLinearTrend:
+        '''
+        Load a trend serialized with to_bytes().
+        '''
+        params = np.frombuffer(data, dtype=np.float64)
+        n_knots = (len(params) + 1) // 2
+        return cls(params[:n_knots], params[n_knots], params[n_knots + 1:])
+
+    def save(self, path: str = TREND_MODEL_PATH):
+        '''
+        Save the trend to a JSON file.
+        '''
+        with io_utils.atomic_write(path, mode='w') as file:
+            json.dump({'knots': self.knots.tolist(), 'intercept': self.intercept, 'slopes': self.slopes.tolist()}, file)
+
+    @classmethod
+    def load(cls, path: str = TREND_MODEL_PATH) -> PiecewiseLinearTrend:
+        '''
+        Load a trend saved with save().
+        '''
+        with open(path, 'r') as file:
+            trend = json.load(file)
+        return cls(trend['knots'], trend['intercept'], trend['slopes'])
+
+class CompiledResidualModel:
+    '''
+    The XGB residual model flattened into arrays, evaluated with numpy.
+
+    All trees are stored in one set of node arrays. Every row walks down
+    every tree at the same time, one level per step, so prediction is
+    vectorized over both rows and trees.
+
+    Parameters
+    ----------
+    feature_names : list[str]
+        The feature names, in the order the model expects.
+    base_score : float
+        The starting prediction before adding the trees.
+    roots : np.ndarray
+        The index of the root node of each tree.
+    feature, threshold, left, right, default_left, leaf_value : np.ndarray
+        Per-node arrays. Rows go to the left child if x < threshold, and
+        to the default child if x is missing. Leaves are their own children.
+    max_depth : int
+        The depth of the deepest tree.
+    '''
+
+    def __init__(self, feature_names, base_score, roots, feature, threshold, left, right,
+                 default_left, leaf_value, max_depth):
+        self.feature_names = list(feature_names)
+        self.base_score = np.float32(base_score)
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.max_depth = int(max_depth)
+
+    def predict(self, X) -> np.ndarray:
+        '''
+        Predict the residuals.
+
+        Parameters
+        ----------
+        X : array-like
+            The features, of shape (n, n_features), with columns in the
+            order of feature_names. A DataFrame or a FeatureMatrix is 
+            reordered by name (a FeatureMatrix in that order is used as is).
+
+        Returns
+        -------
+        np.ndarray
+            The predicted residuals, of shape (n,).
+        '''
+        if isinstance(X, FeatureMatrix):
+            X = X.select(self.feature_names).values
+        elif hasattr(X, 'columns'):
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32) # xgboost also predicts in float32
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f'Expected {len(self.feature_names)} features, got an array of shape {X.shape}.')
+
+        # every (row, tree) pair walks down its tree one level per step;
+        # leaves point to themselves, so finished pairs stay where they are
+        n_rows, n_trees = len(X), len(self.roots)
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows) * X.shape[1], n_trees)
+        X_flat = np.ascontiguousarray(X).ravel()
+        has_missing = np.isnan(X_flat).any()
+        for _ in range(self.max_depth):
+            x = X_flat.take(row_offset + self.feature.take(node))
+            go_left = x < self.threshold.take(node)
+            if has_missing:
+                go_left |= np.isnan(x) & self.default_left.take(node)
+            node = np.where(go_left, self.left.take(node), self.right.take(node))
+
+        # add the trees one by one like xgboost does, so the float32 rounding matches
+        prediction = np.full(n_rows, self.base_score, dtype=np.float32)
+        for tree_value in self.leaf_value.take(node).reshape(n_rows, n_trees).T:
+            prediction += tree_value
+        return prediction
+
+    def save(self, path: str = RESIDUAL_MODEL_PATH):
+        '''
+        Save the model to a .npz file.
+        '''
+        with io_utils.atomic_write(path) as file:
+            np.savez(file, feature_names=np.array(self.feature_names), base_score=self.base_score,
+                     roots=self.roots, feature=self.feature, threshold=self.threshold, left=self.left,
+                     right=self.right, default_left=self.default_left, leaf_value=self.leaf_value,
+                     max_depth=self.max_depth)
+
+    @classmethod
+    def load(cls, path: str = RESIDUAL_MODEL_PATH) -> CompiledResidualModel:
+        '''
+        Load a model saved with save().
+        '''
+        with np.load(path) as arrays:
+            arrays = dict(arrays)
+        arrays['feature_names'] = arrays['feature_names'].tolist()
+        return cls(**arrays)
+
+def export_trend_model(trend_model, path: str = TREND_MODEL_PATH) -> PiecewiseLinearTrend:
+    '''
+    Export the spline trend model from fit_spline_trend_model.
+
+    Parameters
+    ----------
+    trend_model : sklearn.pipeline.Pipeline
+        The fitted degree-1 SplineTransformer + LinearRegression pipeline.
+    path : str, optional
+        Where to save the trend. If None, it is not saved.
+
+    Returns
+    -------
+    PiecewiseLinearTrend
+        The equivalent piecewise-linear trend.
+    '''
+    spline_transformer = trend_model[0]
+    if spline_transformer.degree != 1:
+        raise ValueError(f'Only degree-1 splines are piecewise-linear, got degree {spline_transformer.degree}.')
+
+    if spline_transformer.include_bias:
+        raise ValueError('Only splines fit with include_bias=False are supported.')
+    
+    # each degree-1 basis function is a "hat" that is 1 at its own knot and 0 at the others,
+    # so the value at each knot is the intercept plus that knot's coefficient
+    # (include_bias=False drops the basis function of the last knot)
+    linear_regressor = trend_model[-1]
+    knots = spline_transformer.bsplines_[0].t[1:-1] # drop the knots added for extrapolation
+    values = linear_regressor.intercept_ + np.append(linear_regressor.coef_, 0.0)
+
+    trend = PiecewiseLinearTrend(knots, values[0], np.diff(values) / np.diff(knots))
+    if path is not None:
+        trend.save(path)
+    return trend
+
+def export_residual_model(residual_model, path: str = RESIDUAL_MODEL_PATH) -> CompiledResidualModel:
+    '''
+    Export the XGB residual model from fit_XGB_residual_model.
+
+    Parameters
+    ----------
+    residual_model : xgboost.XGBRegressor
+        The fitted residual model.
+    path : str, optional
+        Where to save the model. If None, it is not saved.
+
+    Returns
+    -------
+    CompiledResidualModel
+        The equivalent compiled model.
+    '''
+    learner = json.loads(residual_model.get_booster().save_raw('json'))['learner']
+    trees = learner['gradient_booster']['model']['trees']
+
+    roots, feature, threshold, left, right, default_left, leaf_value = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for tree in trees:
+        tree_left = np.array(tree['left_children'], dtype=np.int32)
+        tree_right = np.array(tree['right_children'], dtype=np.int32)
+        tree_is_leaf = tree_left == -1
+
+        # split_conditions holds the threshold for splits and the value for leaves
+        conditions = np.array(tree['split_conditions'], dtype=np.float32)
+
+        roots.append(offset)
+        feature.append(np.array(tree['split_indices'], dtype=np.int32))
+        threshold.append(np.where(tree_is_leaf, 0, conditions).astype(np.float32))
+        nodes = np.arange(offset, offset + len(tree_left), dtype=np.int32)
+        left.append(np.where(tree_is_leaf, nodes, tree_left + offset))
+        right.append(np.where(tree_is_leaf, nodes, tree_right + offset))
+        default_left.append(np.array(tree['default_left'], dtype=bool))
+        leaf_value.append(np.where(tree_is_leaf, conditions, 0).astype(np.float32))
+
+        max_depth = max(max_depth, _tree_depth(tree_left, tree_right))
+        offset += len(tree_left)
+
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+
+    model = CompiledResidualModel(
+        feature_names=learner['feature_names'],
+        base_score=base_score,
+        roots=np.array(roots, dtype=np.int32),
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        default_left=np.concatenate(default_left),
+        leaf_value=np.concatenate(leaf_value),
+        max_depth=max_depth,
+    )
+    if path is not None:
+        model.save(path)
+    return model
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth, level = 0, [0]
+    while True:
+        level = [child for node in level for child in (left[node], right[node]) if child != -1]
+        if not level:
+            return depth
+        depth += 1
+
+def model_version(trend_model: PiecewiseLinearTrend, residual_model: CompiledResidualModel) -> str:
+    '''
+    A short hash identifying a pair of exported models.
+
+    The hash only depends on the model parameters, so the training code
+    and the API (which loads the exported models) get the same version.
+
+    Parameters
+    ----------
+    trend_model : PiecewiseLinearTrend
+        The exported trend model.
+    residual_model : CompiledResidualModel
+        The exported residual model.
+
+    Returns
+    -------
+    str
+        The model version, 12 hex characters.
+    '''
+    digest = hashlib.sha256(trend_model.to_bytes())
+    digest.update(json.dumps(residual_model.feature_names).encode())
+    digest.update(np.float64(residual_model.base_score).tobytes())
+    for array in [residual_model.roots, residual_model.feature, residual_model.threshold, residual_model.left,
+                  residual_model.right, residual_model.default_left, residual_model.leaf_value]:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:12]
+
+def publish_models(trend_model: PiecewiseLinearTrend, residual_model: CompiledResidualModel,
+                   manifest_path: str = MODEL_MANIFEST_PATH) -> str:
+    '''
+    Saves a pair of exported models as the pair to serve.
+
+    Both models are saved into a directory named after their version,
+    and the manifest is (atomically) rewritten last to point at it, so
+    load_models always gets two models that were published together.
+
+    Parameters
+    ----------
+    trend_model : PiecewiseLinearTrend
+        The exported trend model.
+    residual_model : CompiledResidualModel
+        The exported residual model.
+    manifest_path : str, optional
+        The manifest, by default MODEL_MANIFEST_PATH. The versions are saved next to it.
+
+    Returns
+    -------
+    str
+        The model version.
+    '''
+    version = model_version(trend_model, residual_model)
+    versions_dir = os.path.join(os.path.dirname(manifest_path), 'versions')
+    version_dir = os.path.join(versions_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+    trend_model.save(os.path.join(version_dir, 'trend_model.json'))
+    residual_model.save(os.path.join(version_dir, 'xgb_residual_model.npz'))
+    os.utime(version_dir) # the newest versions are kept
+
+    io_utils.write_json({'version': version,
+                         'trend_model': os.path.join('versions', version, 'trend_model.json'),
+                         'residual_model': os.path.join('versions', version, 'xgb_residual_model.npz')},
+                        manifest_path)
+
+    # keep a few older versions, for readers that loaded the previous manifest
+    older = sorted((entry for entry in os.scandir(versions_dir) if entry.is_dir() and entry.name != version),
+                   key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in older[KEPT_MODEL_VERSIONS - 1:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return version
+
+def load_models(manifest_path: str = MODEL_MANIFEST_PATH) -> tuple[PiecewiseLinearTrend, CompiledResidualModel]:
+    '''
+    Loads the pair of models published by publish_models.
+
+    If nothing was published yet, the models exported to TREND_MODEL_PATH
+    and RESIDUAL_MODEL_PATH (next to the manifest) are loaded instead.
+
+    Returns
+    -------
+    tuple[PiecewiseLinearTrend, CompiledResidualModel]
+        The trend and residual models.
+    '''
+    directory = os.path.dirname(manifest_path)
+    if not os.path.exists(manifest_path):
+        return (PiecewiseLinearTrend.load(os.path.join(directory, os.path.basename(TREND_MODEL_PATH))),
+                CompiledResidualModel.load(os.path.join(directory, os.path.basename(RESIDUAL_MODEL_PATH))))
+
+    with open(manifest_path, 'r') as file:
+        manifest = json.load(file)
+    return (PiecewiseLinearTrend.load(os.path.join(directory, manifest['trend_model'])),
+            CompiledResidualModel.load(os.path.join(directory, manifest['residual_model'])))
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+from datetime import datetime
+from itertools import islice
+import json
+import os
+import re
+import uuid
+
+import pandas as pd
+
+_NON_WHITESPACE = re.compile(r'[^ \t\n\r]')
+_decoder = json.JSONDecoder()
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+def iter_json_array_items(file, keys: list = None, chunk_size: int = 65536):
+    '''
+    Parses the arrays in a JSON object incrementally, yielding one item at a time.
+
+    Only the item being parsed (plus one chunk of text) is held in memory,
+    so this works for payloads that are much larger than memory, like
+    ijson. For example, for {"ended": [...], "current": [...]}, the items
+    of "ended" are yielded, then those of "current".
+
+    Parameters
+    ----------
+    file
+        A text file (or stream) containing a JSON object.
+    keys : list, optional
+        The keys of the arrays to yield items from, by default all arrays.
+        Other values are parsed and skipped.
+    chunk_size : int, optional
+        The number of characters read at a time, by default 65536.
+
+    Yields
+    ------
+    tuple[str, object]
+        The key of the array and the item.
+    '''
+    reader = _JSONReader(file, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.decode_value()
+        reader.expect(':')
+        if reader.peek() == '[' and (keys is None or key in keys):
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield key, reader.decode_value()
+                    if reader.expect(',', ']') == ']':
+                        break
+        else:
+            reader.decode_value()
+
+        if reader.expect(',', '}') == '}':
+            return
+
+class _JSONReader:
+    # a window over the text of a file, decoding one value at a time with json.JSONDecoder.raw_decode
+
+    def __init__(self, file, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # drop the text that has been parsed, so the buffer stays small
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            match = _NON_WHITESPACE.search(self.buffer, self.pos)
+            if match is not None:
+                self.pos = match.start()
+                return self.buffer[self.pos]
+            self.pos = len(self.buffer)
+            if not self._read():
+                raise ValueError('Unexpected end of JSON')
+
+    def expect(self, *chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f'Expected {" or ".join(map(repr, chars))} at {self.pos}, got {char!r}')
+        self.pos += 1
+        return char
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value continues past the buffer
+                if not self._read():
+                    raise
+                continue
+            # a number may continue in the next chunk (e.g. '1' + '.25', or '3' + 'e10'),
+            # so it is only complete once something else than a digit, '.', 'e' or a sign follows it
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                match = _NON_WHITESPACE.search(self.buffer, end)
+                if (match is None or self.buffer[match.start()] in _NUMBER_CHARS) and self._read():
+                    continue
+            self.pos = end
+            return value
+
+def iter_batches(items, size: int):
+    '''
+    Groups an iterable into lists of up to size items.
+    '''
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+def iter_excel_chunks(path: str, chunksize: int = 10000, usecols: int = None):
+    '''
+    Reads a spreadsheet in chunks of rows, without loading the whole workbook.
+
+    The workbook is opened in openpyxl's read-only mode, which streams the
+    rows from the file. The first row is the header.
+
+    Parameters
+    ----------
+    path : str
+        The .xlsx file. Only the first sheet is read.
+    chunksize : int, optional
+        The number of rows per chunk, by default 10000.
+    usecols : int, optional
+        If given, only the first usecols columns are read (like .iloc[:, :usecols]).
+
+    Yields
+    ------
+    pd.DataFrame
+        The next rows of the sheet, with a continuing index.
+    '''
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True, max_col=usecols)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f'Unnamed: {i}' if name is None else name for i, name in enumerate(header)]
+
+        start = 0
+        while True:
+            chunk = list(islice(rows, chunksize))
+            if not chunk:
+                return
+            yield pd.DataFrame(chunk, columns=columns, index=pd.RangeIndex(start, start + len(chunk)))
+            start += len(chunk)
+    finally:
+        workbook.close()
+
+def write_excel_chunks(chunks, path: str) -> int:
+    '''
+    Writes chunks of rows into a spreadsheet, without holding the whole sheet in memory.
+
+    The workbook is written in openpyxl's write-only mode, which streams
+    the rows to the file. The columns of the first chunk are the header.
+    The inverse of iter_excel_chunks.
+
+    Parameters
+    ----------
+    chunks
+        An iterable of DataFrames with the same columns.
+    path : str
+        The .xlsx file.
+
+    Returns
+    -------
+    int
+        The number of rows written.
+    '''
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    n_rows = 0
+    for chunk in chunks:
+        if n_rows == 0:
+            sheet.append(list(chunk.columns))
+        # missing values as empty cells
+        for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None):
+            sheet.append(row)
+        n_rows += len(chunk)
+    workbook.save(path)
+    return n_rows
+
+class PartitionedDatasetWriter:
+    '''
+    Writes chunks of rows into a partitioned Parquet dataset.
+
+    Each chunk is split by the values of the partition columns and written
+    as a new file in a Hive-style directory, e.g. 'root/region=jp/year=2024/'.
+    Chunks are written as soon as they are added, so memory only depends
+    on the chunk size. Read the dataset back with read_dataset.
+
+    Requires pyarrow.
+
+    Parameters
+    ----------
+    root : str
+        The directory of the dataset.
+    partition_cols : list
+        The columns to partition by. They are not stored in the files.
+    '''
+
+    def __init__(self, root: str, partition_cols: list):
+        self.root = os.fspath(root)
+        self.partition_cols = list(partition_cols)
+        self.files = []
+        self.n_rows = 0
+        # files from separate runs never share a name
+        self._prefix = f'part-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+
+    def write(self, chunk: pd.DataFrame):
+        '''
+        Writes a chunk of rows to the dataset.
+        '''
+        if chunk.empty:
+            return
+        groups = chunk.groupby(self.partition_cols, sort=False, dropna=False) if self.partition_cols else [((), chunk)]
+        for values, rows in groups:
+            values = values if isinstance(values, tuple) else (values,)
+            directory = os.path.join(self.root, *[f'{col}={value}' for col, value in zip(self.partition_cols, values)])
+            os.makedirs(directory, exist_ok=True)
+
+            path = os.path.join(directory, f'{self._prefix}-{len(self.files):05d}.parquet')
+            rows.drop(columns=self.partition_cols).to_parquet(path, engine='pyarrow', index=False)
+            self.files.append(path)
+        self.n_rows += len(chunk)
+
+def write_dataset(chunks, root: str, partition_cols: list) -> PartitionedDatasetWriter:
+    '''
+    Writes an iterable of DataFrame chunks into a partitioned Parquet dataset.
+
+    Parameters
+    ----------
+    chunks
+        The chunks, e.g. from iter_excel_chunks.
+    root : str
+        The directory of the dataset.
+    partition_cols : list
+        The columns to partition by.
+
+    Returns
+    -------
+    PartitionedDatasetWriter
+        The writer, with the written files and the number of rows.
+    '''
+    writer = PartitionedDatasetWriter(root, partition_cols)
+    for chunk in chunks:
+        writer.write(chunk)
+    return writer
+
+def read_dataset(root: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+    '''
+    Reads a dataset written by PartitionedDatasetWriter.
+
+    Parameters
+    ----------
+    root : str
+        The directory of the dataset.
+    columns : list, optional
+        The columns to read, by default all.
+    filters : list, optional
+        Row filters, e.g. [('region', '==', 'jp')]. Filters on partition
+        columns skip whole files.
+
+    Returns
+    -------
+    pd.DataFrame
+        The matching rows, with the partition columns as categoricals.
+    '''
+    return pd.read_parquet(root, engine='pyarrow', columns=columns, filters=filters)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import json
+import os
+import pickle
+import tempfile
+
+import joblib
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    '''
+    Holds an exclusive lock for writing to path, waiting until it is free.
+
+    The lock is taken on a separate '{path}.lock' file, so readers of path
+    are never blocked. Works across processes (and containers sharing the
+    data/ volume), but only between writers that also use file_lock.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file to be written.
+    blocking : bool, optional
+        Whether to wait for the lock, by default True. If False and another
+        process holds it, the block runs without the lock.
+
+    Yields
+    ------
+    bool
+        Whether the lock is held (always True when blocking).
+    '''
+    with open(f'{path}.lock', 'a+b') as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'wb', lock: bool = True):
+    '''
+    Opens a temporary file to write to, which replaces path once writing succeeds.
+
+    The temporary file is in the same directory as path, so the final
+    os.replace is atomic: readers see either the old file or the new
+    one, never a partially written one. If writing fails, path is left
+    untouched.
+
+    Parameters
+    ----------
+    path : str
+        The file to write.
+    mode : str, optional
+        'wb' for binary files or 'w' for text files, by default 'wb'.
+    lock : bool, optional
+        Whether to hold file_lock(path) while writing, by default True.
+        This stops concurrent writers from replacing each other's files
+        halfway, e.g. parallel training jobs saving the same model.
+
+    Yields
+    ------
+    file
+        The temporary file.
+    '''
+    path = os.fspath(path)
+    directory, name = os.path.split(os.path.abspath(path))
+
+    with file_lock(path) if lock else _no_lock():
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as file:
+                yield file
+                file.flush()
+                os.fsync(file.fileno())
+            os.chmod(tmp_path, 0o644) # mkstemp only gives the owner access
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+@contextmanager
+def _no_lock():
+    yield
+
+def dump_joblib(obj, path: str):
+    '''
+    Atomically saves obj with joblib (e.g. a trained model).
+    '''
+    with atomic_write(path) as file:
+        joblib.dump(obj, file)
+
+def dump_pickle(obj, path: str):
+    '''
+    Atomically saves obj with pickle (e.g. a DataFrame fixture).
+    '''
+    with atomic_write(path) as file:
+        pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+def write_json(obj, path: str):
+    '''
+    Atomically saves obj as JSON (e.g. a forecast).
+    '''
+    with atomic_write(path, mode='w') as file:
+        json.dump(obj, file)
@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from itertools import count
+from time import perf_counter, time_ns
+import glob
+import json
+import os
+
+# Prometheus' default latency buckets (seconds), and powers of 4 for payload sizes (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# With several worker processes (e.g. gunicorn), set API_METRICS_DIR to a directory shared
+# by the workers: each one saves its metrics there, and /metrics adds them all up.
+METRICS_DIR = os.environ.get('API_METRICS_DIR')
+METRICS_SAVE_INTERVAL = 1.0 # seconds between saves, so other workers' metrics lag by up to this much
+
+# trace IDs are a random per-process prefix plus a counter, which is much cheaper than uuid4
+_TRACE_PREFIX = os.urandom(6).hex()
+_trace_counter = count()
+
+class Histogram:
+    '''
+    A histogram with fixed bucket upper bounds, like a Prometheus histogram.
+
+    Parameters
+    ----------
+    buckets : tuple
+        The (increasing) upper bounds of the buckets. A +Inf bucket is added.
+    '''
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # not cumulative, that is done in render
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        '''
+        Adds a value to the histogram.
+        '''
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other: Histogram):
+        '''
+        Adds the counts of another histogram with the same buckets.
+        '''
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+class MetricsRegistry:
+    '''
+    Request metrics for the API, rendered in the Prometheus text format.
+
+    The metrics are plain ints and lists without locks. They must only be
+    updated from the event loop thread (MetricsMiddleware and async
+    endpoints), so updates never happen concurrently.
+    '''
+
+    def __init__(self):
+        self.requests = {} # (method, path, status) -> count
+        self.latency = {} # path -> Histogram
+        self.response_size = {} # path -> Histogram
+        self.cache = {} # (cache, 'hit' or 'miss') -> count
+
+    def observe_request(self, method: str, path: str, status: int, seconds: float, size: int):
+        '''
+        Records one request.
+        '''
+        key = (method, path, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+        latency = self.latency.get(path)
+        if latency is None:
+            latency = self.latency[path] = Histogram(LATENCY_BUCKETS)
+            self.response_size[path] = Histogram(SIZE_BUCKETS)
+        latency.observe(seconds)
+        self.response_size[path].observe(size)
+
+    def observe_cache(self, cache: str, hit: bool):
+        '''
+        Records one lookup in a cache, e.g. a cached response body.
+        '''
+        key = (cache, 'hit' if hit else 'miss')
+        self.cache[key] = self.cache.get(key, 0) + 1
+
+    def merge(self, other: MetricsRegistry):
+        '''
+        Adds the metrics of another registry (e.g. of another worker) to this one.
+        '''
+        for key, n in other.requests.items():
+            self.requests[key] = self.requests.get(key, 0) + n
+        for key, n in other.cache.items():
+            self.cache[key] = self.cache.get(key, 0) + n
+        for histograms, other_histograms, buckets in [(self.latency, other.latency, LATENCY_BUCKETS),
+                                                      (self.response_size, other.response_size, SIZE_BUCKETS)]:
+            for path, histogram in other_histograms.items():
+                histograms.setdefault(path, Histogram(buckets)).merge(histogram)
+
+    def to_dict(self) -> dict:
+        '''
+        The metrics as JSON-serializable lists, for from_dict.
+        '''
+        def histograms(values):
+            return {path: {'counts': histogram.counts, 'sum': histogram.sum} for path, histogram in values.items()}
+
+        return {'requests': [[*key, n] for key, n in self.requests.items()],
+                'cache': [[*key, n] for key, n in self.cache.items()],
+                'latency': histograms(self.latency),
+                'response_size': histograms(self.response_size)}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> MetricsRegistry:
+        '''
+        Loads metrics saved with to_dict.
+        '''
+        registry = cls()
+        registry.requests = {(method, path, status): n for method, path, status, n in state['requests']}
+        registry.cache = {(cache, result): n for cache, result, n in state['cache']}
+        for histograms, values, buckets in [(registry.latency, state['latency'], LATENCY_BUCKETS),
+                                            (registry.response_size, state['response_size'], SIZE_BUCKETS)]:
+            for path, value in values.items():
+                histogram = histograms[path] = Histogram(buckets)
+                histogram.counts, histogram.sum = list(value['counts']), value['sum']
+        return registry
+
+    def render(self) -> str:
+        '''
+        The metrics in the Prometheus text exposition format.
+        '''
+        lines = ['# HELP http_requests_total Total number of HTTP requests.',
+                 '# TYPE http_requests_total counter']
+        for (method, path, status), n in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",path="{path}",status="{status}"}} {n}')
+
+        lines += _render_histograms('http_request_duration_seconds', 'HTTP request latency in seconds.', self.latency)
+        lines += _render_histograms('http_response_size_bytes', 'HTTP response body size in bytes.', self.response_size)
+
+        lines += ['# HELP cache_requests_total Cache lookups, by result (hit or miss).',
+                  '# TYPE cache_requests_total counter']
+        for (cache, result), n in sorted(self.cache.items()):
+            lines.append(f'cache_requests_total{{cache="{cache}",result="{result}"}} {n}')
+
+        return '\n'.join(lines) + '\n'
+
+def save_process_metrics(registry: MetricsRegistry, directory: str):
+    '''
+    Saves the metrics of this process to directory, as '{pid}.json'.
+    '''
+    from utils import io_utils
+    # only this process writes the file, so it is not locked
+    with io_utils.atomic_write(os.path.join(directory, f'{os.getpid()}.json'), mode='w', lock=False) as file:
+        json.dump(registry.to_dict(), file)
+
+def collect_metrics(registry: MetricsRegistry, directory: str) -> MetricsRegistry:
+    '''
+    The metrics of every process saving to directory, including exited ones,
+    added up. The metrics of this process (registry) are saved first, so they are current.
+    '''
+    save_process_metrics(registry, directory)
+    total = MetricsRegistry()
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path, 'r') as file:
+                total.merge(MetricsRegistry.from_dict(json.load(file)))
+        except FileNotFoundError: # renamed by mark_process_dead meanwhile, read it next time
+            continue
+    return total
+
+def mark_process_dead(pid: int, directory: str):
+    '''
+    Keeps the metrics of an exited process, under a name a new process with
+    the same pid cannot overwrite. Call from gunicorn's child_exit hook.
+    '''
+    path = os.path.join(directory, f'{pid}.json')
+    if os.path.exists(path):
+        os.replace(path, os.path.join(directory, f'dead-{pid}-{time_ns()}.json'))
+
+def _render_histograms(name: str, help_text: str, histograms: dict) -> list[str]:
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for path, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{path="{path}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{path="{path}"}} {histogram.sum}')
+        lines.append(f'{name}_count{{path="{path}"}} {cumulative}')
+    return lines
+
+def render_gauges(name: str, help_text: str, values: dict, label: str) -> str:
+    '''
+    Renders a labelled gauge in the Prometheus text format.
+
+    Parameters
+    ----------
+    name : str
+        The metric name.
+    help_text : str
+        The description of the metric.
+    values : dict
+        Maps each label value to the gauge value. None values are skipped.
+    label : str
+        The label name.
+
+    Returns
+    -------
+    str
+        The rendered gauge.
+    '''
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for label_value, value in values.items():
+        if value is not None:
+            lines.append(f'{name}{{{label}="{_escape(label_value)}"}} {float(value)}')
+    return '\n'.join(lines) + '\n'
+
+def _escape(label_value: str) -> str:
+    return str(label_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware that records the count, latency and response size of each request.
+
+    Requests are labelled by their route template (e.g. '/items/{item_id}'),
+    not the raw path, so the number of metrics stays bounded.
+
+    Parameters
+    ----------
+    app
+        The ASGI app.
+    registry : MetricsRegistry
+        Where the metrics are recorded.
+    trace_ids : bool, optional
+        Whether to give each request a trace ID, by default False. The ID is
+        taken from the X-Request-ID header (or generated), stored in
+        scope['state']['trace_id'] and returned in the X-Request-ID header.
+    '''
+
+    def __init__(self, app, registry: MetricsRegistry, trace_ids: bool = False):
+        self.app = app
+        self.registry = registry
+        self.trace_ids = trace_ids
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status, size = 500, 0
+
+        trace_id = None
+        if self.trace_ids:
+            trace_id = _header(scope, b'x-request-id') or f'{_TRACE_PREFIX}{next(_trace_counter):012x}'.encode()
+            scope.setdefault('state', {})['trace_id'] = trace_id.decode('latin-1')
+
+        async def send_and_record(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if trace_id is not None:
+                    message['headers'] = list(message.get('headers', [])) + [(b'x-request-id', trace_id)]
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            self.registry.observe_request(scope['method'], path, status, perf_counter() - start, size)
+
+def _header(scope, name: bytes):
+    for key, value in scope['headers']:
+        if key == name:
+            return value
+    return None
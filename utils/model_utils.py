@@ -3,16 +3,21 @@ from __future__ import annotations
 from sklearn.preprocessing import SplineTransformer
 from sklearn.linear_model import LinearRegression
 from sklearn.pipeline import make_pipeline
-from statsmodels.tsa.deterministic import DeterministicProcess
 from xgboost import XGBRegressor
-
-import joblib
+import xgboost
+from utils import cache_utils, calendar_utils, df_utils, inference_utils, io_utils
+from utils.matrix_utils import FeatureMatrix
+
+import copy
+import os
+import time
+import numpy as np
 import pandas as pd
 import statsmodels
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-def prepare_train_test_split(revenue: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series, pd.DataFrame, pd.Series]:
+def prepare_train_test_split(revenue: pd.DataFrame, horizon: int = 6) -> tuple[pd.DataFrame, pd.Series, pd.DataFrame, pd.Series]:
     '''
     Creates a train-test split features and targets.
 
@@ -20,6 +25,9 @@ def prepare_train_test_split(revenue: pd.DataFrame) -> tuple[pd.DataFrame, pd.Se
     ----------
     revenue : pd.DataFrame
         The revenue DataFrame.
+    horizon : int, optional
+        Number of rows held out for testing, by default 6 (6 months).
+        For daily data, use the number of days in the forecast horizon.
 
     Returns
     -------
@@ -28,8 +36,8 @@ def prepare_train_test_split(revenue: pd.DataFrame) -> tuple[pd.DataFrame, pd.Se
     '''
     revenue = revenue.copy()
 
-    revenue_train = revenue.iloc[:-6] # everything before 6 months for training
-    revenue_test = revenue.iloc[-6:] # last 6 months for testing
+    revenue_train = revenue.iloc[:-horizon] # everything before the last 6 months (horizon) for training
+    revenue_test = revenue.iloc[-horizon:] # last 6 months (horizon) for testing
 
     X_train = revenue_train.drop(columns=['Date', 'JP'])
     y_train = revenue_train['JP']
@@ -39,7 +47,20 @@ def prepare_train_test_split(revenue: pd.DataFrame) -> tuple[pd.DataFrame, pd.Se
 
     return X_train, y_train, X_test, y_test
 
-def drop_columns_residual(df: pd.DataFrame) -> pd.DataFrame:
+# the features the residual model does not use (see drop_columns_residual)
+RESIDUAL_DROPPED_COLUMNS = ['Rerun Count',
+                            'Operation Count',
+                            'Collaboration Event Count',
+                            'Limited Banner Count',
+                            'sin(1,freq=YE-DEC)',
+                            'cos(1,freq=YE-DEC)',
+                            'sin(3,freq=YE-DEC)',
+                            'cos(3,freq=YE-DEC)',
+                            'sin(4,freq=YE-DEC)'
+                            ]
+
+@cache_utils.memoize()
+def drop_columns_residual(df: pd.DataFrame, errors: str = 'raise') -> pd.DataFrame:
     '''
     Drop columns that are not needed for residual analysis.
     Does not drop the target column yet (this is needed to make lags later)
@@ -48,26 +69,19 @@ def drop_columns_residual(df: pd.DataFrame) -> pd.DataFrame:
     ----------
     df : pd.DataFrame
         The input DataFrame.
+    errors : str, optional
+        'raise' (like DataFrame.drop) if a column is missing, or 'ignore' for
+        data without every monthly feature, e.g. daily revenue from
+        df_utils.group_into_daily_activity. By default 'raise'.
 
     Returns
     -------
     pd.DataFrame
         The DataFrame with specified columns dropped.
     '''
-    columns_to_drop = ['Rerun Count', 
-                        'Operation Count', 
-                        'Collaboration Event Count',
-                        'Limited Banner Count',
-                        'sin(1,freq=YE-DEC)',
-                        'cos(1,freq=YE-DEC)',
-                        'sin(3,freq=YE-DEC)',
-                        'cos(3,freq=YE-DEC)',
-                        'sin(4,freq=YE-DEC)'
-                        ]
-    
     df2 = df.copy()
     df2 = df2.drop(columns=['Date'])
-    df2 = df2.drop(columns=columns_to_drop)
+    df2 = df2.drop(columns=RESIDUAL_DROPPED_COLUMNS, errors=errors)
     return df2
 
 def make_lags(df: pd.DataFrame, lags: list) -> pd.DataFrame:
@@ -131,6 +145,7 @@ def fit_spline_trend_model(y_train: pd.Series, window_size=7, plot=True, save=Tr
         Whether to plot the trend model against actual data, by default True.
     save : bool, optional
         Whether to save the trend model to disk, by default True.
+        It is not exported for the API: save_models exports and publishes both models together.
 
     Returns
     -------
@@ -140,7 +155,7 @@ def fit_spline_trend_model(y_train: pd.Series, window_size=7, plot=True, save=Tr
 
     trend = y_train.rolling(window=window_size, center=True).mean()
 
-    dp = DeterministicProcess(index=y_train.index, order=1)
+    dp = calendar_utils.get_trend_process(len(y_train)) # same as DeterministicProcess(index=y_train.index, order=1)
     time_index = dp.in_sample() # points to fit for trend (which is a time index)
 
     # remove first few and last rows to align with rolling mean
@@ -156,7 +171,7 @@ def fit_spline_trend_model(y_train: pd.Series, window_size=7, plot=True, save=Tr
     trend_model.fit(time_index_aligned_array, trend.dropna())
 
     if save:
-        joblib.dump(trend_model, 'data/saved_models/trend_model.joblib')
+        io_utils.dump_joblib(trend_model, 'data/saved_models/trend_model.joblib')
 
     if plot:
         sns.lineplot(trend_model.predict(time_index), label='Spline Trend')
@@ -166,7 +181,9 @@ def fit_spline_trend_model(y_train: pd.Series, window_size=7, plot=True, save=Tr
 
     return trend_model
 
-def create_XGB_features(revenue: pd.DataFrame) -> pd.DataFrame:
+@cache_utils.memoize()
+def create_XGB_features(revenue: pd.DataFrame, lags: list = None, window_size: int = 4, dtype: str = None,
+                        story: pd.DataFrame = None, matrix: bool = False, errors: str = 'raise') -> pd.DataFrame:
     '''
     Creates additional features for the XGB residual model.
 
@@ -174,27 +191,62 @@ def create_XGB_features(revenue: pd.DataFrame) -> pd.DataFrame:
     ----------
     revenue : pd.DataFrame
         The revenue DataFrame.
+    lags : list, optional
+        The lag periods to add, by default None, which means [6]. Lags should be at least 
+        as long as the forecast horizon (e.g. [182] for daily data).
+    window_size : int, optional
+        The window size of the rolling statistics, by default 4.
+    dtype : str, optional
+        If given (e.g. 'float32'), the features (but not the target) 
+        are cast to this dtype. Useful for daily data. Not allowed with 
+        matrix, whose features are always float32.
+    story : pd.DataFrame, optional
+        If given (e.g. from dataloader_utils.load_story_jp), the story features 
+        of df_utils.create_story_features are added. By default None (no story features).
+    matrix : bool, optional
+        Whether to return the features as a FeatureMatrix (one float32 block, 
+        see matrix_utils) and the target separately, by default False.
+    errors : str, optional
+        'ignore' for data without every column that drop_columns_residual
+        drops (e.g. daily or synthetic revenue). By default 'raise'.
 
     Returns
     -------
     pd.DataFrame
-        The DataFrame with additional features for XGB model.
+        The DataFrame with additional features for XGB model. If matrix, 
+        a tuple of the FeatureMatrix of the features and the 'JP' target Series.
     '''
+    if matrix and dtype is not None:
+        raise ValueError(f"dtype={dtype!r} cannot be used with matrix=True, a FeatureMatrix is always float32.")
+
     revenue = revenue.copy()
 
+    # Add story features (before 'Date' is dropped)
+    if story is not None:
+        story_features = df_utils.create_story_features(story, revenue)
+        revenue = pd.concat([revenue, story_features.drop(columns=['Date'])], axis=1)
+
     # Drop uninformative columns
-    revenue = drop_columns_residual(revenue)
+    revenue = drop_columns_residual(revenue, errors)
 
     # Add lag features
-    lags = [6]
+    if lags is None:
+        lags = [6]
     revenue = make_lags(revenue, lags)
 
     # Add rolling statistics
-    revenue = make_rolling_stats(revenue, window_size=4)
+    revenue = make_rolling_stats(revenue, window_size=window_size)
     
     # Drop rows with NaN values
     revenue = revenue.dropna()
 
+    if matrix:
+        return FeatureMatrix.from_frame(revenue, revenue.columns.drop('JP')), revenue['JP']
+
+    if dtype is not None:
+        features = revenue.columns.drop('JP')
+        revenue[features] = revenue[features].astype(dtype)
+
     return revenue
 
 
@@ -204,12 +256,13 @@ def fit_XGB_residual_model(X_train: pd.DataFrame, y_train: pd.Series, save=True)
 
     Parameters
     ----------
-    X_train : pd.DataFrame
+    X_train : pd.DataFrame or FeatureMatrix
         The training features for the residual model.
     y_train : pd.Series
         The training target for the residual model.
     save : bool, optional
         Whether to save the model to disk, by default True
+        It is not exported for the API: save_models exports and publishes both models together.
 
     Returns
     -------
@@ -223,17 +276,395 @@ def fit_XGB_residual_model(X_train: pd.DataFrame, y_train: pd.Series, save=True)
         learning_rate=0.1
     )
 
-    xgb_model.fit(X_train, y_train)
+    if isinstance(X_train, FeatureMatrix):
+        # the same trees as from a DataFrame, which xgboost converts to float32 too
+        xgb_model.fit(X_train.values, y_train)
+        xgb_model.get_booster().feature_names = X_train.feature_names
+    else:
+        xgb_model.fit(X_train, y_train)
 
     if save:
-        joblib.dump(xgb_model, 'data/saved_models/xgb_residual_model.joblib')
+        io_utils.dump_joblib(xgb_model, 'data/saved_models/xgb_residual_model.joblib')
 
     return xgb_model
 
+def save_models(trend_model, xgb_model) -> str:
+    '''
+    Saves and exports both models, and publishes them as the pair the API serves.
+
+    Unlike saving each model in its fit function, the API never sees one
+    new model with the other one old (see inference_utils.publish_models).
+
+    Parameters
+    ----------
+    trend_model : sklearn.pipeline.Pipeline
+        The fitted trend model.
+    xgb_model : XGBRegressor
+        The fitted residual model.
+
+    Returns
+    -------
+    str
+        The model version.
+    '''
+    io_utils.dump_joblib(trend_model, 'data/saved_models/trend_model.joblib')
+    io_utils.dump_joblib(xgb_model, 'data/saved_models/xgb_residual_model.joblib')
+    trend = inference_utils.export_trend_model(trend_model)
+    residual_model = inference_utils.export_residual_model(xgb_model)
+    return inference_utils.publish_models(trend, residual_model)
+
+# the same model as fit_XGB_residual_model, for the lower-level training path below
+XGB_RESIDUAL_PARAMS = {'objective': 'reg:squarederror', 'learning_rate': 0.1, 'tree_method': 'hist'}
+XGB_RESIDUAL_ROUNDS = 40
+
+def available_threads() -> int:
+    '''
+    The number of CPUs this process may run on (which can be fewer than os.cpu_count() in containers).
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def make_residual_dmatrix(X: pd.DataFrame, y: pd.Series, nthread: int = None) -> xgboost.DMatrix:
+    '''
+    Converts the training data of the residual model to an XGBoost matrix once, 
+    to be reused by fit_XGB_residual_booster across backtest folds and tuning trials.
+
+    It is not quantized: the bin edges are computed from the rows each model 
+    is trained on (see fit_XGB_residual_booster).
+
+    Parameters
+    ----------
+    X : pd.DataFrame or FeatureMatrix
+        The features of all rows (e.g. all folds).
+    y : pd.Series
+        The residuals of all rows.
+    nthread : int, optional
+        The number of threads, by default available_threads().
+
+    Returns
+    -------
+    xgboost.DMatrix
+        The training matrix.
+    '''
+    if isinstance(X, FeatureMatrix):
+        return xgboost.DMatrix(X.values, y, feature_names=X.feature_names, nthread=nthread or available_threads())
+    return xgboost.DMatrix(X, y, nthread=nthread or available_threads())
+
+def fit_XGB_residual_booster(dtrain: xgboost.DMatrix, train_rows=None, params: dict = None,
+                             num_boost_round: int = XGB_RESIDUAL_ROUNDS) -> xgboost.Booster:
+    '''
+    Fits the residual model on some rows of a prebuilt training matrix.
+
+    Instead of converting the features again for each fold, the fold's rows 
+    are sliced from dtrain. The bin edges are computed from those rows only, 
+    so the model is the same as fit_XGB_residual_model on those rows, 
+    including its predictions on later rows.
+
+    Parameters
+    ----------
+    dtrain : xgboost.DMatrix
+        The matrix from make_residual_dmatrix.
+    train_rows : array-like, optional
+        The positions (or a boolean mask) of the rows to train on, by default all rows.
+    params : dict, optional
+        Overrides XGB_RESIDUAL_PARAMS, e.g. for a tuning trial. The number of 
+        threads defaults to available_threads().
+    num_boost_round : int, optional
+        The number of trees, by default XGB_RESIDUAL_ROUNDS.
+
+    Returns
+    -------
+    xgboost.Booster
+        The fit model. Predict with booster.inplace_predict(X).
+    '''
+    if train_rows is not None:
+        train_rows = np.asarray(train_rows)
+        dtrain = dtrain.slice(np.flatnonzero(train_rows) if train_rows.dtype == bool else train_rows)
+
+    params = {**XGB_RESIDUAL_PARAMS, 'nthread': available_threads(), **(params or {})}
+    return xgboost.train(params, dtrain, num_boost_round=num_boost_round)
+
+def tune_nthread(dtrain: xgboost.DMatrix, candidates: list = None, num_boost_round: int = 10) -> int:
+    '''
+    Picks the fastest number of threads for training on dtrain by timing a few rounds.
+
+    More threads are not always faster: for small matrices, the cost of 
+    coordinating threads is larger than the work per tree.
+
+    Parameters
+    ----------
+    dtrain : xgboost.DMatrix
+        The matrix from make_residual_dmatrix.
+    candidates : list, optional
+        The numbers of threads to try, by default powers of 2 up to available_threads().
+    num_boost_round : int, optional
+        The number of trees per timing, by default 10.
+
+    Returns
+    -------
+    int
+        The fastest number of threads.
+    '''
+    if candidates is None:
+        candidates = [2 ** i for i in range(available_threads().bit_length()) if 2 ** i <= available_threads()]
+
+    timings = {}
+    for nthread in candidates:
+        start = time.perf_counter()
+        fit_XGB_residual_booster(dtrain, params={'nthread': nthread}, num_boost_round=num_boost_round)
+        timings[nthread] = time.perf_counter() - start
+    return min(timings, key=timings.get)
+
+def backtest_XGB_residual_model(X: pd.DataFrame, y: pd.Series, horizon: int = 6, n_folds: int = 4,
+                                params: dict = None, dtrain: xgboost.DMatrix = None) -> pd.DataFrame:
+    '''
+    Rolling-origin backtest of the residual model: each fold trains on all rows 
+    before its test window of horizon rows, and the last fold tests on the last 
+    horizon rows.
+
+    All folds slice their rows from one training matrix (see fit_XGB_residual_booster), 
+    so each fold is the same as refitting fit_XGB_residual_model on its rows.
+
+    Parameters
+    ----------
+    X : pd.DataFrame or FeatureMatrix
+        The features, in time order.
+    y : pd.Series
+        The residuals.
+    horizon : int, optional
+        The number of rows tested per fold, by default 6.
+    n_folds : int, optional
+        The number of folds, by default 4.
+    params : dict, optional
+        Overrides XGB_RESIDUAL_PARAMS.
+    dtrain : xgboost.DMatrix, optional
+        A matrix from make_residual_dmatrix(X, y), to reuse it across calls 
+        (e.g. tuning trials). Built if not given.
+
+    Returns
+    -------
+    pd.DataFrame
+        The 'train_rows' and the 'mae' of each fold.
+    '''
+    if dtrain is None:
+        dtrain = make_residual_dmatrix(X, y, nthread=(params or {}).get('nthread'))
+
+    results = []
+    for fold in range(n_folds):
+        test_start = len(X) - (n_folds - fold) * horizon
+        booster = fit_XGB_residual_booster(dtrain, np.arange(test_start), params)
+        X_test = X[test_start:test_start + horizon].values if isinstance(X, FeatureMatrix) else X.iloc[test_start:test_start + horizon]
+        predictions = booster.inplace_predict(X_test)
+        mae = np.mean(np.abs(predictions - y.iloc[test_start:test_start + horizon].to_numpy()))
+        results.append({'train_rows': test_start, 'mae': float(mae)})
+    return pd.DataFrame(results)
+
+def trend_sufficient_stats(trend_model, y_train: pd.Series, window_size: int = 7) -> dict:
+    '''
+    The sufficient statistics (X^T X and X^T y) of a spline trend model's linear 
+    regression, for update_spline_trend_model.
+
+    X is the spline basis (plus a column of ones for the intercept) of the 
+    trend index, and y is the centered rolling mean, as in fit_spline_trend_model.
+
+    Parameters
+    ----------
+    trend_model
+        The trend model from fit_spline_trend_model.
+    y_train : pd.Series
+        The training target data the model was fit on.
+    window_size : int, optional
+        The window size of the rolling mean, by default 7.
+
+    Returns
+    -------
+    dict
+        'xtx', 'xty' and 'n_points' (the number of rolling means included).
+    '''
+    stats = {'xtx': 0.0, 'xty': 0.0, 'n_points': 0}
+    return _add_trend_points(trend_model, stats, y_train, window_size)
+
+def _add_trend_points(trend_model, stats: dict, y_train: pd.Series, window_size: int) -> dict:
+    # adds the rolling means that are complete in y_train but not yet in stats
+    half = window_size // 2
+    n_points = len(y_train) - 2 * half
+    if n_points <= stats['n_points']:
+        return stats
+
+    # only the rows the new centered windows need
+    tail = y_train.iloc[stats['n_points']:].to_numpy(dtype=np.float64)
+    trend = pd.Series(tail).rolling(window=window_size, center=True).mean().dropna().to_numpy()
+    time_index = np.arange(stats['n_points'] + half, n_points + half).reshape(-1, 1) + 1
+
+    basis = trend_model[0].transform(time_index)
+    basis = np.hstack([basis, np.ones((len(basis), 1))])
+    return {'xtx': stats['xtx'] + basis.T @ basis, 'xty': stats['xty'] + basis.T @ trend, 'n_points': n_points}
+
+def update_spline_trend_model(trend_model, stats: dict, y_train: pd.Series, window_size: int = 7) -> tuple:
+    '''
+    Updates a spline trend model with newly appended months, without refitting.
+
+    The knots stay where they were at the last full fit. The new rolling means 
+    are added to the sufficient statistics, and the regression is solved from 
+    them, so the cost does not grow with the length of the history. With the 
+    same knots, this gives the same model as refitting on all months.
+
+    Parameters
+    ----------
+    trend_model
+        The trend model from fit_spline_trend_model (it is not modified).
+    stats : dict
+        Its sufficient statistics, from trend_sufficient_stats or a previous update.
+    y_train : pd.Series
+        All training target data, including the new months.
+    window_size : int, optional
+        The window size of the rolling mean, by default 7.
+
+    Returns
+    -------
+    tuple
+        The updated trend model and its sufficient statistics.
+    '''
+    stats = _add_trend_points(trend_model, stats, y_train, window_size)
+
+    # lstsq, since the basis of a knot with no points yet is all zeros
+    coef = np.linalg.lstsq(stats['xtx'], stats['xty'], rcond=None)[0]
+    trend_model = copy.deepcopy(trend_model)
+    trend_model[-1].coef_ = coef[:-1]
+    trend_model[-1].intercept_ = coef[-1]
+    return trend_model, stats
+
+def update_XGB_residual_model(xgb_model: XGBRegressor, X_train: pd.DataFrame, y_train: pd.Series,
+                              n_rounds: int = 5, recent_rows: int = 12) -> XGBRegressor:
+    '''
+    Continues boosting the residual model with a few trees for newly appended months.
+
+    The new trees start from the previous model's predictions (a warm start 
+    with xgb_model=), so the earlier trees are not retrained. They are fit on 
+    the last recent_rows rows, which include the new months: a tree fit on a 
+    single month cannot split, and would shift every prediction.
+
+    Parameters
+    ----------
+    xgb_model : XGBRegressor
+        The previous residual model (it is not modified).
+    X_train : pd.DataFrame or FeatureMatrix
+        All training features, including the new months.
+    y_train : pd.Series
+        All training residuals, including the new months.
+    n_rounds : int, optional
+        The number of trees to add, by default 5.
+    recent_rows : int, optional
+        The number of most recent rows to boost on, by default 12.
+
+    Returns
+    -------
+    XGBRegressor
+        The updated model, with n_rounds more trees.
+    '''
+    # the same hyperparameters as the trees it continues
+    updated_model = XGBRegressor(**{**xgb_model.get_params(), 'n_estimators': n_rounds})
+    booster = xgb_model.get_booster()
+    X_recent = residual_model_input(xgb_model, X_train[-recent_rows:])
+    if isinstance(X_train, FeatureMatrix):
+        # XGBoost checks the (missing) names of an array against the booster's, so they are set back after the fit
+        booster = booster.copy()
+        booster.feature_names, booster.feature_types = None, None
+    updated_model.fit(X_recent, y_train.iloc[-recent_rows:], xgb_model=booster)
+    if isinstance(X_train, FeatureMatrix):
+        updated_model.get_booster().feature_names = xgb_model.get_booster().feature_names
+        updated_model.get_booster().feature_types = xgb_model.get_booster().feature_types
+    return updated_model
+
+def retrain_models(y_train: pd.Series, revenue_2: pd.DataFrame, state: dict = None, full_refit_every: int = 6,
+                   window_size: int = 7, n_rounds: int = 5, recent_rows: int = 12, save: bool = False) -> dict:
+    '''
+    The monthly retrain: updates the trend and residual models incrementally, 
+    with a full refit every full_refit_every months.
+
+    At each full refit, the incremental update it replaces is also made, and 
+    their forecasts are compared ('forecast_gap' and 'forecast_gap_pct' in 
+    state['history']), to track the accuracy lost by the incremental updates.
+
+    Parameters
+    ----------
+    y_train : pd.Series
+        All training target data, including the new months.
+    revenue_2 : pd.DataFrame
+        The residual model features from create_XGB_features, with the 'JP' 
+        target. Rows after the training data (e.g. the forecast months) are 
+        only used to compare forecasts at full refits.
+    state : dict, optional
+        The state returned by the previous retrain, by default None (a full fit).
+    full_refit_every : int, optional
+        The number of incremental updates between full refits, by default 6.
+    window_size : int, optional
+        The window size of the trend's rolling mean, by default 7.
+    n_rounds, recent_rows : int, optional
+        See update_XGB_residual_model.
+    save : bool, optional
+        Whether to save and publish the models with save_models, by default False.
+
+    Returns
+    -------
+    dict
+        The new state: 'trend_model', 'xgb_model', the trend 'stats', 'n_train', 
+        'updates' (since the last full refit) and 'history' (mode, seconds and 
+        the accuracy comparison of each retrain).
+    '''
+    start = time.perf_counter()
+    dp = calendar_utils.get_trend_process(len(y_train))
+    revenue_2_all = revenue_2
+    revenue_2 = revenue_2[revenue_2.index < len(y_train)]
+    X_train2 = revenue_2.drop(columns=['JP'])
+
+    history = [] if state is None else state['history']
+    if state is None or state['updates'] >= full_refit_every:
+        trend_model = fit_spline_trend_model(y_train, window_size, plot=False, save=False)
+        stats = trend_sufficient_stats(trend_model, y_train, window_size)
+        y_train2 = (y_train - trend_model.predict(dp.in_sample())).loc[X_train2.index]
+        xgb_model = fit_XGB_residual_model(X_train2, y_train2, save=False)
+        entry = {'mode': 'full', 'n_train': len(y_train)}
+
+        if state is not None:
+            # the incremental update this refit replaces, to track its accuracy
+            incremental = _update_models(state, y_train, X_train2, dp, window_size, n_rounds, recent_rows)
+            entry.update(_compare_forecasts(incremental[:2], (trend_model, xgb_model), revenue_2_all, dp))
+        updates = 0
+    else:
+        trend_model, xgb_model, stats = _update_models(state, y_train, X_train2, dp, window_size, n_rounds, recent_rows)
+        entry = {'mode': 'incremental', 'n_train': len(y_train)}
+        updates = state['updates'] + 1
+
+    if save:
+        save_models(trend_model, xgb_model)
+
+    entry['seconds'] = time.perf_counter() - start
+    return {'trend_model': trend_model, 'xgb_model': xgb_model, 'stats': stats, 'n_train': len(y_train),
+            'updates': updates, 'history': history + [entry]}
+
+def _update_models(state: dict, y_train: pd.Series, X_train2: pd.DataFrame, dp, window_size: int, n_rounds: int,
+                   recent_rows: int) -> tuple:
+    trend_model, stats = update_spline_trend_model(state['trend_model'], state['stats'], y_train, window_size)
+    y_train2 = (y_train - trend_model.predict(dp.in_sample())).loc[X_train2.index]
+    xgb_model = update_XGB_residual_model(state['xgb_model'], X_train2, y_train2, n_rounds, recent_rows)
+    return trend_model, xgb_model, stats
+
+def _compare_forecasts(incremental: tuple, full: tuple, revenue_2: pd.DataFrame, dp) -> dict:
+    # how far the incremental models' forecast (of the rows after the training data) is from the full refit's
+    X_forecast = revenue_2[revenue_2.index >= len(dp.in_sample())].drop(columns=['JP'])
+    if X_forecast.empty:
+        return {}
+    full_pred = final_prediction(*full, X_forecast, dp)
+    gap = np.abs(final_prediction(*incremental, X_forecast, dp) - full_pred)
+    return {'forecast_gap': float(np.mean(gap)), 'forecast_gap_pct': float(np.mean(gap / np.abs(full_pred)) * 100)}
+
 def final_prediction(trend_model, residual_model, X_test2: pd.DataFrame, dp: statsmodels.tsa.deterministic.DeterministicProcess) -> pd.DataFrame:
     '''
     Make the final prediction for next 6 months of data
     by combining both trend and residual predictions. 
+    The horizon is the number of rows in X_test2.
 
     Parameters
     ----------
@@ -241,10 +672,11 @@ def final_prediction(trend_model, residual_model, X_test2: pd.DataFrame, dp: sta
         The trend model used for prediction.
     residual_model
         The residual model used for prediction.
-    X_test2 : pd.DataFrame
+    X_test2 : pd.DataFrame or FeatureMatrix
         The test data for the residual model.
     dp : DeterministicProcess
         The DeterministicProcess, to be used for out-of-sample prediction.
+        A TrendProcess from calendar_utils.get_trend_process also works.
 
     Returns
     -------
@@ -252,7 +684,51 @@ def final_prediction(trend_model, residual_model, X_test2: pd.DataFrame, dp: sta
         A DataFrame containg the final prediction of revenue.
     '''
 
-    trend_pred = trend_model.predict(dp.out_of_sample(steps=6))
-    residual_pred = residual_model.predict(X_test2)
+    # as arrays, so sklearn does not check (and copy) a DataFrame on every call
+    trend_pred = trend_model.predict(dp.out_of_sample(steps=len(X_test2)).to_numpy())
+    residual_pred = residual_model.predict(residual_model_input(residual_model, X_test2))
     final_pred = trend_pred + residual_pred
-    return final_pred
\ No newline at end of file
+    return final_pred
+
+def residual_model_input(residual_model, X):
+    '''
+    The features to pass to the residual model's predict.
+
+    A FeatureMatrix is passed as its float32 block, with the columns in the 
+    order the model was fit with, so XGBoost predicts from it in place 
+    instead of converting a DataFrame. Other inputs are returned as they are.
+
+    Parameters
+    ----------
+    residual_model
+        An XGBRegressor or an inference_utils.CompiledResidualModel.
+    X : pd.DataFrame or FeatureMatrix
+        The features.
+    '''
+    if not isinstance(X, FeatureMatrix):
+        return X
+    if isinstance(residual_model, inference_utils.CompiledResidualModel):
+        return X # reordered by the model
+    feature_names = residual_model.get_booster().feature_names
+    return X.values if feature_names is None else X.select(feature_names).values
+
+def aggregate_daily_to_monthly(dates: pd.Series, daily_values) -> pd.Series:
+    '''
+    Aggregate daily revenue (or daily predictions) into monthly totals.
+
+    Parameters
+    ----------
+    dates : pd.Series
+        The dates of the daily values.
+    daily_values : array-like
+        The daily values, e.g. the output of final_prediction in daily mode.
+
+    Returns
+    -------
+    pd.Series
+        Monthly totals, indexed by the first day of each month.
+    '''
+    months = pd.DatetimeIndex(dates).to_period('M').to_timestamp()
+    monthly = pd.Series(np.asarray(daily_values, dtype=np.float64), index=months).groupby(level=0).sum()
+    monthly.index.name = 'Date'
+    return monthly
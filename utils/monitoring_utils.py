@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import io_utils
+
+MONITORING_PATH = 'data/results/monitoring.json'
+
+PSI_THRESHOLD = 0.2 # PSI above 0.2 is commonly treated as a significant shift
+
+REVENUE_COLUMNS = ['Date', 'JP']
+BANNER_COLUMNS = ['id', 'gachaType', 'startedAt', 'endedAt', 'rateups', 'startAt', 'endAt']
+EVENT_COLUMNS = ['Name (EN)', 'Start date', 'End date', 'Notes']
+
+GACHA_TYPES = ['PickupGacha', 'LimitedGacha', 'FesGacha']
+EVENT_NOTES = ['Original', 'Rerun', 'Operation', 'Collaboration Event'] # after cleaning_utils.clean_event_data
+
+def check_schema(df: pd.DataFrame, name: str, expected_columns: list, categories: dict = None) -> list[str]:
+    '''
+    Checks that a dataframe still looks like the data the model was trained on.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataframe to check.
+    name : str
+        The name of the dataframe, used in the messages.
+    expected_columns : list
+        Columns that must be present.
+    categories : dict, optional
+        Maps a column to its known values, e.g. {'gachaType': GACHA_TYPES}.
+        Values that are not known (apart from missing values) are reported.
+
+    Returns
+    -------
+    list[str]
+        A message for each problem found. Empty if there are none.
+    '''
+    issues = []
+    missing_columns = [col for col in expected_columns if col not in df.columns]
+    if missing_columns:
+        issues.append(f'{name}: missing columns {missing_columns}')
+    if df.empty:
+        issues.append(f'{name}: no rows')
+
+    for col, known_values in (categories or {}).items():
+        if col not in df.columns:
+            continue
+        new_values = sorted(set(df[col].dropna().unique()) - set(known_values), key=str)
+        if new_values:
+            issues.append(f'{name}: new {col} values {new_values}')
+
+    return issues
+
+class FeatureMonitor:
+    '''
+    Running summaries of numeric features, compared against a reference.
+
+    For each feature, the count, mean and variance are kept with Welford's
+    (parallel) update, and values are counted into fixed histogram bins
+    taken from the deciles of the reference data. Each update only looks
+    at the new rows, and the population stability index (PSI) between
+    the reference and the new rows is computed from the bin counts.
+
+    Create one with FeatureMonitor.from_reference.
+    '''
+
+    def __init__(self, columns, bin_edges, reference_counts, current_counts, count, mean, m2, last_date=None):
+        self.columns = list(columns)
+        self.bin_edges = [np.asarray(edges, dtype=np.float64) for edges in bin_edges]
+        self.reference_counts = [np.asarray(counts, dtype=np.int64) for counts in reference_counts]
+        self.current_counts = [np.asarray(counts, dtype=np.int64) for counts in current_counts]
+        self.count = np.asarray(count, dtype=np.int64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+        self.last_date = None if last_date is None else pd.Timestamp(last_date)
+
+    @classmethod
+    def from_reference(cls, features: pd.DataFrame, dates: pd.Series = None, n_bins: int = 10) -> FeatureMonitor:
+        '''
+        Creates a monitor, using features as the reference (e.g. the training data).
+
+        Parameters
+        ----------
+        features : pd.DataFrame
+            The reference features. Only numeric columns are monitored.
+        dates : pd.Series, optional
+            The date of each row. Used by update to skip rows already seen.
+        n_bins : int, optional
+            The number of histogram bins per feature, by default 10.
+
+        Returns
+        -------
+        FeatureMonitor
+            The monitor, with the reference rows counted in the running statistics.
+        '''
+        features = features.select_dtypes('number')
+        values = features.to_numpy(dtype=np.float64)
+
+        # inner edges only; values below/above them fall into the first/last bin
+        bin_edges = [np.unique(np.nanquantile(col, np.linspace(0, 1, n_bins + 1)[1:-1])) for col in values.T]
+        reference_counts = [_bin_counts(col, edges) for col, edges in zip(values.T, bin_edges)]
+        current_counts = [np.zeros_like(counts) for counts in reference_counts]
+
+        monitor = cls(features.columns, bin_edges, reference_counts, current_counts,
+                      count=np.zeros(len(bin_edges)), mean=np.zeros(len(bin_edges)), m2=np.zeros(len(bin_edges)))
+        monitor._update_moments(values)
+        if dates is not None and len(dates):
+            monitor.last_date = pd.Timestamp(dates.max())
+        return monitor
+
+    def update(self, features: pd.DataFrame, dates: pd.Series = None) -> int:
+        '''
+        Adds new rows to the running statistics.
+
+        Parameters
+        ----------
+        features : pd.DataFrame
+            The features. Must contain the monitored columns.
+        dates : pd.Series, optional
+            The date of each row. If given, only rows after the last date
+            seen are added, so the full history can be passed in each time.
+
+        Returns
+        -------
+        int
+            The number of rows added.
+        '''
+        if dates is not None:
+            is_new = np.ones(len(features), dtype=bool) if self.last_date is None else (dates > self.last_date).to_numpy()
+            features = features[is_new]
+            if is_new.any():
+                self.last_date = pd.Timestamp(dates[is_new].max())
+
+        values = features[self.columns].to_numpy(dtype=np.float64)
+        for i, col in enumerate(values.T):
+            self.current_counts[i] += _bin_counts(col, self.bin_edges[i])
+        self._update_moments(values)
+        return len(values)
+
+    def _update_moments(self, values: np.ndarray):
+        # Chan et al.'s parallel variant of Welford's algorithm, vectorized over the columns
+        batch_count = np.sum(~np.isnan(values), axis=0)
+        if not batch_count.any():
+            return
+        with np.errstate(invalid='ignore'):
+            batch_mean = np.nan_to_num(np.nanmean(values, axis=0))
+        batch_m2 = np.nansum((values - batch_mean) ** 2, axis=0)
+
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        safe_total = np.maximum(total, 1)
+        self.mean = self.mean + delta * batch_count / safe_total
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * batch_count / safe_total
+        self.count = total
+
+    def psi(self) -> np.ndarray:
+        '''
+        The population stability index of each feature, between the reference and the rows added since.
+
+        NaN for features without new rows.
+        '''
+        psi = np.full(len(self.columns), np.nan)
+        for i, (reference, current) in enumerate(zip(self.reference_counts, self.current_counts)):
+            if current.sum() == 0 or reference.sum() == 0:
+                continue
+            # a small floor stops empty bins from giving infinite PSI
+            p = np.maximum(reference / reference.sum(), 1e-4)
+            q = np.maximum(current / current.sum(), 1e-4)
+            psi[i] = np.sum((q - p) * np.log(q / p))
+        return psi
+
+    def summary(self) -> dict:
+        '''
+        The running statistics and PSI of each feature.
+        '''
+        variance = np.where(self.count > 1, self.m2 / np.maximum(self.count - 1, 1), np.nan)
+        psi = self.psi()
+        return {col: {'count': int(self.count[i]),
+                      'mean': _to_json_float(self.mean[i]),
+                      'std': _to_json_float(np.sqrt(variance[i])),
+                      'new_rows': int(self.current_counts[i].sum()),
+                      'psi': _to_json_float(psi[i]),
+                      'drift': bool(psi[i] > PSI_THRESHOLD)}
+                for i, col in enumerate(self.columns)}
+
+    def to_dict(self) -> dict:
+        '''
+        The state of the monitor as a JSON-serializable dict.
+        '''
+        return {'columns': self.columns,
+                'bin_edges': [edges.tolist() for edges in self.bin_edges],
+                'reference_counts': [counts.tolist() for counts in self.reference_counts],
+                'current_counts': [counts.tolist() for counts in self.current_counts],
+                'count': self.count.tolist(),
+                'mean': self.mean.tolist(),
+                'm2': self.m2.tolist(),
+                'last_date': None if self.last_date is None else self.last_date.isoformat()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> FeatureMonitor:
+        '''
+        Recreates a monitor from to_dict().
+        '''
+        return cls(**state)
+
+def _bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    values = values[~np.isnan(values)]
+    return np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+def _to_json_float(value) -> float:
+    return None if np.isnan(value) else float(value)
+
+def update_monitoring(features: pd.DataFrame, dates: pd.Series, residuals: pd.Series = None,
+                      revenue: pd.DataFrame = None, banners: pd.DataFrame = None, events: pd.DataFrame = None,
+                      path: str = MONITORING_PATH) -> dict:
+    '''
+    The monitoring stage of a refresh: checks the schemas of the raw data, and
+    updates the running feature statistics with the rows that are new since
+    the last refresh.
+
+    On the first run, the given rows become the reference. The monitor
+    state and the report are saved to path (and served by the API on /metrics).
+
+    Parameters
+    ----------
+    features : pd.DataFrame
+        The XGB features (e.g. create_XGB_features, without the 'JP' column).
+    dates : pd.Series
+        The date of each row in features.
+    residuals : pd.Series, optional
+        The trend residuals for the same rows, monitored as 'residual'.
+    revenue, banners, events : pd.DataFrame, optional
+        The raw (cleaned) data to check the schema of.
+    path : str, optional
+        Where the monitor is saved, by default MONITORING_PATH.
+
+    Returns
+    -------
+    dict
+        The report, with the overall 'status' ('ok', 'drift' or 'schema_error'),
+        the 'schema_issues', the 'drifted_features' and the per-feature 'features' summary.
+    '''
+    schema_issues = []
+    if revenue is not None:
+        schema_issues += check_schema(revenue, 'revenue', REVENUE_COLUMNS)
+    if banners is not None:
+        schema_issues += check_schema(banners, 'banners', BANNER_COLUMNS, {'gachaType': GACHA_TYPES})
+    if events is not None:
+        schema_issues += check_schema(events, 'events', EVENT_COLUMNS, {'Notes': EVENT_NOTES})
+
+    features = features.copy()
+    if residuals is not None:
+        features['residual'] = residuals
+    dates = pd.Series(np.asarray(dates), index=features.index)
+
+    # held from reading the monitor to saving it, so concurrent refreshes do not lose an update
+    with io_utils.file_lock(path):
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                monitor = FeatureMonitor.from_dict(json.load(file)['state'])
+            missing_features = [col for col in monitor.columns if col not in features.columns]
+            if missing_features:
+                schema_issues.append(f'features: missing columns {missing_features}')
+            else:
+                monitor.update(features, dates)
+        else:
+            monitor = FeatureMonitor.from_reference(features, dates)
+
+        summary = monitor.summary()
+        drifted_features = [col for col, stats in summary.items() if stats['drift']]
+        status = 'schema_error' if schema_issues else 'drift' if drifted_features else 'ok'
+
+        report = {'status': status,
+                  'last_date': None if monitor.last_date is None else monitor.last_date.isoformat(),
+                  'schema_issues': schema_issues,
+                  'drifted_features': drifted_features,
+                  'features': summary}
+        with io_utils.atomic_write(path, mode='w', lock=False) as file: # the lock is already held
+            json.dump({**report, 'state': monitor.to_dict()}, file)
+    return report
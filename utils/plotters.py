@@ -4,6 +4,8 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
+from utils import cleaning_utils
+
 GACHA_COLORS = {
     'PickupGacha' : 'lightblue',
     'LimitedGacha' : 'orange',
@@ -18,11 +20,12 @@ def millions_formatter(x, pos):
     '''
     return f'{x * 1e-6:.1f}M'
 
-def plot_revenue_monthly(df: pd.DataFrame, region: str = 'JP'):
+def plot_revenue_monthly(df: pd.DataFrame, region: str = 'JP', show: bool = True) -> matplotlib.figure.Figure:
     '''
     Plot the monthly revenue time series with one subplot per year.
     df: revenue DataFrame
     region: string, the region to plot (default is 'JP')
+    show: whether to show the figure (default is True). If False, the figure is returned instead, e.g. to save it.
     '''
     # Ensure 'Date' is datetime
     df['Date'] = pd.to_datetime(df['Date'])
@@ -34,9 +37,9 @@ def plot_revenue_monthly(df: pd.DataFrame, region: str = 'JP'):
     years = df['Date'].dt.year.unique()
     
     # Create subplots: one row per year
-    fig, axes = plt.subplots(len(years), 1, figsize=(12, 4*len(years)), sharey=True)
+    fig, axes = plt.subplots(len(years), 1, figsize=(12, 4*len(years)), sharey=True, squeeze=False)
     
-    for ax, year in zip(axes, years):
+    for ax, year in zip(axes[:, 0], years):
         subset = df[df['Date'].dt.year == year]
         sns.lineplot(data=subset, x='Date', y=region, ax=ax)
         
@@ -55,10 +58,13 @@ def plot_revenue_monthly(df: pd.DataFrame, region: str = 'JP'):
 
     # Adjust layout
     plt.tight_layout()
+    if not show:
+        return fig
     plt.show()
 
 def plot_revenue_yearly(df: pd.DataFrame, region: str = 'JP', events_df: pd.DataFrame = None, step: bool = False, 
-                        custom_plotter=None, label: bool = False, legend: bool = False):
+                        custom_plotter=None, label: bool = False, legend: bool = False, 
+                        show: bool = True) -> matplotlib.figure.Figure:
     '''
     Plot the yearly revenue time series.
 
@@ -85,6 +91,9 @@ def plot_revenue_yearly(df: pd.DataFrame, region: str = 'JP', events_df: pd.Data
 
     legend: bool
         Whether to show the legend (default is False)
+
+    show: bool
+        Whether to show the figure (default is True). If False, the figure is returned instead, e.g. to save it.
     '''
 
     # Ensure 'Date' is datetime
@@ -94,7 +103,7 @@ def plot_revenue_yearly(df: pd.DataFrame, region: str = 'JP', events_df: pd.Data
     df = df.sort_values(by='Date')
 
     # Adjust Size
-    plt.figure(figsize=(12, 6))
+    fig = plt.figure(figsize=(12, 6))
     ax = plt.gca()
 
     if step:
@@ -122,6 +131,8 @@ def plot_revenue_yearly(df: pd.DataFrame, region: str = 'JP', events_df: pd.Data
 
     # Adjust layout
     plt.tight_layout()
+    if not show:
+        return fig
     plt.show()
 
 def banner_region_plotter(ax: matplotlib.axes.Axes, event_df: pd.DataFrame, label: bool = False):
@@ -214,16 +225,7 @@ def classify_event(event: str) -> str:
     str
         The category of the event.
     '''
-    if type(event) is not str:
-        return 'Other'
-    if 'collab' in event.lower():
-        return 'Collaboration Event'
-    elif 'rerun' in event.lower():
-        return 'Rerun'
-    elif 'operation' in event.lower():
-        return 'Operation'
-    else: 
-        return 'Other'
+    return cleaning_utils.classify_note(event)
     
 def event_plotter(ax: matplotlib.axes.Axes, event_df: pd.DataFrame, label: bool = False):
     '''
@@ -240,12 +242,11 @@ def event_plotter(ax: matplotlib.axes.Axes, event_df: pd.DataFrame, label: bool
     '''
 
     labelled_events = set()
+    event_types = cleaning_utils.classify_notes(event_df['Notes'])
     
-    for _, row in event_df.iterrows():
-        event_type = classify_event(row['Notes'])
+    for start_date, end_date, event_type in zip(event_df['Start date'], event_df['End date'], event_types):
         if event_type not in labelled_events:
-            ax.axvspan(row['Start date'], row['End date'], color=EVENT_COLORS.get(event_type, 'gray'), alpha=0.3, label=event_type)
+            ax.axvspan(start_date, end_date, color=EVENT_COLORS.get(event_type, 'gray'), alpha=0.3, label=event_type)
             labelled_events.add(event_type) 
         else: 
-            ax.axvspan(row['Start date'], row['End date'], color=EVENT_COLORS.get(event_type, 'gray'), alpha=0.3)
-
+            ax.axvspan(start_date, end_date, color=EVENT_COLORS.get(event_type, 'gray'), alpha=0.3)
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import asyncio
+import json
+import os
+import time
+
+import pandas as pd
+
+from utils import io_utils
+
+FORECAST_PATH = 'data/results/six_month_forecast.json'
+REFRESH_LOCK_PATH = 'data/results/refresh' # file_lock locks 'data/results/refresh.lock'
+
+# With several API processes (e.g. gunicorn workers), only the one holding the scheduler
+# lock runs a RefreshScheduler. The others ask it for a refresh through the trigger
+# file, and read its status from the status file.
+SCHEDULER_LOCK_PATH = 'data/results/scheduler'
+REFRESH_TRIGGER_PATH = 'data/results/refresh_trigger.json'
+REFRESH_STATUS_PATH = 'data/results/refresh_status.json'
+
+def build_revenue_features(revenue: pd.DataFrame, banners_jp: pd.DataFrame, event_jp: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Builds the model's revenue features, the same way as analysis.ipynb.
+
+    Parameters
+    ----------
+    revenue : pd.DataFrame
+        The revenue from dataloader_utils.load_revenue.
+    banners_jp : pd.DataFrame
+        The JP banners from dataloader_utils.load_banners.
+    event_jp : pd.DataFrame
+        The JP events from dataloader_utils.load_events.
+
+    Returns
+    -------
+    pd.DataFrame
+        The JP revenue with banner counts, event counts and Fourier features.
+    '''
+    from utils import cleaning_utils, df_utils
+
+    revenue = cleaning_utils.drop_global_data_from_revenue(revenue)
+
+    event_jp = cleaning_utils.clean_event_data(event_jp)
+
+    revenue = df_utils.group_banner_types_into_monthly_count({'jp': banners_jp}, revenue)
+    revenue = df_utils.group_event_types_into_monthly_count(event_jp, revenue)
+    return df_utils.create_fourier_features(revenue)
+
+def run_refresh(requested_at: float = None, horizon: int = 6, window_size: int = 7) -> dict:
+    '''
+    Refreshes the forecast: fetches the banners, rebuilds the features, retrains
+    the models and writes the forecast, like running analysis.ipynb.
+
+    The models are saved and published for the API (see model_utils.save_models), their
+    explanations are cached (see explain_utils), the drift monitor is updated
+    (see monitoring_utils, served on the API's /metrics), and the forecast is
+    written atomically to FORECAST_PATH.
+
+    Only one refresh runs at a time, across processes (e.g. gunicorn workers).
+    If another process finished a refresh while this one waited for it, that
+    forecast is used instead of refreshing again.
+
+    Parameters
+    ----------
+    requested_at : float, optional
+        When the refresh was requested (time.time()), by default now.
+    horizon : int, optional
+        The number of months forecast, by default 6.
+    window_size : int, optional
+        The window size of the trend's rolling mean, by default 7.
+
+    Returns
+    -------
+    dict
+        The forecast, with its 'dates' and 'predictions'.
+    '''
+    from utils import calendar_utils, cleaning_utils, dataloader_utils, explain_utils, model_utils, monitoring_utils
+
+    requested_at = time.time() if requested_at is None else requested_at
+    with io_utils.file_lock(REFRESH_LOCK_PATH):
+        if os.path.exists(FORECAST_PATH) and os.stat(FORECAST_PATH).st_mtime >= requested_at:
+            with open(FORECAST_PATH, 'r') as file:
+                return json.load(file)
+
+        revenue = dataloader_utils.load_revenue()
+        _, banners_jp = dataloader_utils.load_banners()
+        _, event_jp = dataloader_utils.load_events()
+        revenue = build_revenue_features(revenue, banners_jp, event_jp)
+
+        _, y_train, _, y_test = model_utils.prepare_train_test_split(revenue, horizon)
+        trend_model = model_utils.fit_spline_trend_model(y_train, window_size, plot=False, save=False)
+        dp = calendar_utils.get_trend_process(len(y_train))
+
+        revenue_2 = model_utils.create_XGB_features(revenue)
+        X_train2 = revenue_2.iloc[:-horizon].drop(columns=['JP'])
+        X_test2 = revenue_2.iloc[-horizon:].drop(columns=['JP'])
+        y_train2 = (y_train - trend_model.predict(dp.in_sample())).loc[X_train2.index]
+        xgb_model = model_utils.fit_XGB_residual_model(X_train2, y_train2, save=False)
+        model_utils.save_models(trend_model, xgb_model)
+
+        final_pred = model_utils.final_prediction(trend_model, xgb_model, X_test2, dp)
+        next_months = pd.date_range(start=revenue['Date'].iloc[-1] + pd.DateOffset(months=1), periods=horizon, freq='MS')
+        forecast = {'dates': next_months.strftime('%Y-%m').tolist(), 'predictions': final_pred.tolist()}
+
+        # the API only serves explanations of the models it has loaded
+        explain_utils.update_explanations(trend_model, xgb_model, X_test2, dp.out_of_sample(steps=horizon), forecast['dates'])
+
+        # like the notebook, the monitor sees the features and trend residuals of every month
+        residuals = pd.concat([y_train - trend_model.predict(dp.in_sample()),
+                               y_test - trend_model.predict(dp.out_of_sample(steps=horizon))])
+        monitoring_utils.update_monitoring(features=revenue_2.drop(columns=['JP']),
+                                           dates=revenue.loc[revenue_2.index, 'Date'],
+                                           residuals=residuals.loc[revenue_2.index],
+                                           revenue=revenue, banners=banners_jp,
+                                           events=cleaning_utils.clean_event_data(event_jp))
+
+        # written inside the lock, so waiting refreshes see it as newer than their request
+        io_utils.write_json(forecast, FORECAST_PATH)
+    return forecast
+
+class RefreshScheduler:
+    '''
+    Runs a refresh job in an executor (e.g. a process pool) on a schedule or
+    when triggered, without blocking the event loop.
+
+    Refreshes never overlap: triggering while a refresh runs queues (at most)
+    one more run after it, so a burst of triggers leads to a single extra
+    refresh. When a run succeeds, on_done is called with its result in a
+    thread, e.g. to load and swap in the new models without blocking the event loop.
+
+    Parameters
+    ----------
+    job : callable
+        The refresh, called with the time it was requested. It runs in the
+        executor, so for a process pool it must be picklable (e.g. run_refresh).
+    on_done : callable
+        Called with the result of each successful run, in the event loop's default executor.
+    executor : concurrent.futures.Executor
+        Where the job runs.
+    interval : float, optional
+        The number of seconds between scheduled refreshes, by default None
+        (only when triggered).
+    trigger_path : str, optional
+        A file written by request_refresh (e.g. from other processes), which
+        triggers a refresh whenever it changes, by default None.
+    status_path : str, optional
+        Where to also write the status (see read_status), by default None.
+    poll_interval : float, optional
+        The number of seconds between checks of trigger_path, by default 1.
+    '''
+
+    def __init__(self, job, on_done, executor, interval: float = None, trigger_path: str = None,
+                 status_path: str = None, poll_interval: float = 1.0):
+        self.job = job
+        self.on_done = on_done
+        self.executor = executor
+        self.interval = interval
+        self.trigger_path = trigger_path
+        self.status_path = status_path
+        self.poll_interval = poll_interval
+        self.pending = False
+        self.status = {'running': False, 'runs': 0, 'last_trigger': None, 'last_success': None,
+                       'last_duration': None, 'last_error': None}
+        self._task = None
+        self._schedule_tasks = []
+
+    def start(self):
+        '''
+        Starts the schedule (if there is an interval) and the watch of
+        trigger_path (if given). Call from the event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        if self.interval:
+            self._schedule_tasks.append(loop.create_task(self._schedule()))
+        if self.trigger_path:
+            self._schedule_tasks.append(loop.create_task(self._watch(_mtime(self.trigger_path))))
+        self._save_status()
+
+    async def stop(self):
+        '''
+        Stops the schedule, and waits for a running refresh to finish.
+        '''
+        for task in self._schedule_tasks:
+            task.cancel()
+        self.pending = False
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def trigger(self, reason: str = 'webhook') -> str:
+        '''
+        Starts a refresh, or queues one if a refresh is running.
+
+        Returns
+        -------
+        str
+            'started' or 'queued'.
+        '''
+        self.status['last_trigger'] = reason
+        if self._task is not None and not self._task.done():
+            self.pending = True
+            self._save_status()
+            return 'queued'
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return 'started'
+
+    async def wait(self):
+        '''
+        Waits until the running and queued refreshes are done.
+        '''
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    async def _schedule(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.trigger('schedule')
+
+    async def _watch(self, last_mtime):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            mtime = _mtime(self.trigger_path)
+            if mtime != last_mtime:
+                last_mtime = mtime
+                self.trigger(_read_json(self.trigger_path, {}).get('reason', 'webhook'))
+
+    def _save_status(self):
+        if self.status_path is not None:
+            io_utils.write_json({**self.status, 'pending': self.pending}, self.status_path)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.status['running'] = True
+            self._save_status()
+            start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self.executor, self.job, time.time())
+                await loop.run_in_executor(None, self.on_done, result)
+                self.status['last_success'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+                self.status['last_error'] = None
+            except Exception as e:
+                self.status['last_error'] = f'{type(e).__name__}: {e}'
+            finally:
+                self.status['running'] = False
+                self.status['runs'] += 1
+                self.status['last_duration'] = time.perf_counter() - start
+            if not self.pending:
+                self._save_status()
+                return
+            self.pending = False
+
+def request_refresh(reason: str = 'webhook', path: str = REFRESH_TRIGGER_PATH):
+    '''
+    Asks the RefreshScheduler watching path (e.g. in another API worker) for a refresh.
+    '''
+    io_utils.write_json({'reason': reason, 'requested_at': time.time()}, path)
+
+def read_status(path: str = REFRESH_STATUS_PATH) -> dict | None:
+    '''
+    The status written by the RefreshScheduler with this status_path, or None if there is none.
+    '''
+    return _read_json(path, None)
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _read_json(path: str, default):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return default
@@ -0,0 +1,424 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+import functools
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import cache_utils, io_utils
+
+REPORT_DIR = 'data/results/report'
+
+# the models the report evaluates, fit on all but the last test months
+MODEL_FILES = ['data/saved_models/trend_model.joblib', 'data/saved_models/xgb_residual_model.joblib']
+
+# editing the plotting code re-renders every figure
+_CODE_FILES = [os.path.join(os.path.dirname(__file__), name) for name in ['plotters.py', 'report_utils.py']]
+
+class ReportFigure:
+    '''
+    One figure of the report.
+
+    Parameters
+    ----------
+    name : str
+        The name of the figure, which is also its file name ('{name}.png').
+    title : str
+        The caption of the figure in the report.
+    section : str
+        The section of the report the figure is in.
+    plot : callable
+        A module-level function (so it can be sent to worker processes) that
+        takes the inputs as keyword arguments and returns a matplotlib Figure.
+    inputs : dict or callable
+        The inputs of plot, e.g. DataFrames, or a function returning them,
+        which is only called when the figure is rendered.
+    depends_on : optional
+        What the inputs are built from (e.g. the data and the models), by
+        default the inputs themselves; required when inputs is a function.
+        The figure is only rendered again when it (or the plotting code) changes.
+    '''
+
+    def __init__(self, name: str, title: str, section: str, plot, inputs, depends_on=None):
+        if callable(inputs) and depends_on is None:
+            raise ValueError(f'{name}: depends_on is required when inputs is a function')
+        self.name = name
+        self.title = title
+        self.section = section
+        self.plot = plot
+        self.inputs = inputs
+        self.depends_on = inputs if depends_on is None else depends_on
+
+    def key(self, code_version: str) -> str:
+        '''
+        A fingerprint of what the figure depends on and of its plotting code.
+        '''
+        return cache_utils.fingerprint(self.name, code_version, self.plot.__module__, self.plot.__qualname__, self.depends_on)
+
+    def build_inputs(self) -> dict:
+        '''
+        The inputs of plot, built now if inputs is a function.
+        '''
+        return self.inputs() if callable(self.inputs) else self.inputs
+
+def code_version() -> str:
+    '''
+    A hash of the plotting code (plotters.py and this module).
+    '''
+    return _file_digest(_CODE_FILES)
+
+def _file_digest(paths: list) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+    # like analysis.ipynb, with a Japanese font for the story names if one is installed
+    from matplotlib import font_manager
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    families = [family for family in ['Meiryo', 'Hiragino Sans', 'Noto Sans CJK JP'] if family in installed]
+    matplotlib.rcParams['font.family'] = families + ['DejaVu Sans']
+
+def _render_figure(plot, inputs: dict, path: str) -> float:
+    # runs in a worker process; returns the seconds it took
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    fig = plot(**inputs)
+    try:
+        with io_utils.atomic_write(path, lock=False) as file:
+            fig.savefig(file, format='png', dpi=100)
+    finally:
+        plt.close(fig)
+    return time.perf_counter() - start
+
+def render_figures(figures: list, out_dir: str = REPORT_DIR, workers: int = None, force: bool = False) -> dict:
+    '''
+    Renders the figures to PNG files, in parallel worker processes with the Agg backend.
+
+    Figures whose inputs (see ReportFigure.depends_on) and plotting code have
+    not changed since the last run (recorded in '{out_dir}/manifest.json') are
+    skipped, unless force. The inputs of skipped figures are never built.
+    A figure that fails is reported and rendered again on the next run;
+    the other figures are still rendered.
+
+    Parameters
+    ----------
+    figures : list[ReportFigure]
+        The figures.
+    out_dir : str, optional
+        Where to write the figures, by default REPORT_DIR.
+    workers : int, optional
+        The number of worker processes, by default one per available CPU.
+        0 renders the figures in this process (e.g. for debugging).
+    force : bool, optional
+        Whether to render every figure, by default False.
+
+    Returns
+    -------
+    dict
+        The names of the 'rendered' and 'skipped' figures, the 'failed' ones
+        (with their error), the 'seconds' each rendered figure took, and the
+        'keys' of the figures.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+
+    version = code_version()
+    keys = {figure.name: figure.key(version) for figure in figures}
+    paths = {figure.name: os.path.join(out_dir, f'{figure.name}.png') for figure in figures}
+    todo = [figure for figure in figures
+            if force or manifest.get(figure.name) != keys[figure.name] or not os.path.exists(paths[figure.name])]
+
+    result = {'rendered': [], 'skipped': [figure.name for figure in figures if figure not in todo],
+              'failed': {}, 'seconds': {}, 'keys': keys}
+
+    def record(figure, run):
+        try:
+            result['seconds'][figure.name] = run()
+            result['rendered'].append(figure.name)
+            manifest[figure.name] = keys[figure.name]
+        except Exception as e:
+            result['failed'][figure.name] = f'{type(e).__name__}: {e}'
+            manifest.pop(figure.name, None)
+
+    if todo and workers == 0:
+        _init_worker()
+        for figure in todo:
+            record(figure, lambda: _render_figure(figure.plot, figure.build_inputs(), paths[figure.name]))
+    elif todo:
+        from utils.model_utils import available_threads
+        workers = min(workers or available_threads(), len(todo))
+        # spawned, so the workers do not inherit the state of pyplot (or anything else) from this process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker) as executor:
+            def submit(figure):
+                try:
+                    return executor.submit(_render_figure, figure.plot, figure.build_inputs(), paths[figure.name])
+                except Exception as e:
+                    # inputs that cannot be built fail like a figure that cannot be rendered
+                    future = Future()
+                    future.set_exception(e)
+                    return future
+
+            futures = [(figure, submit(figure)) for figure in todo]
+            for figure, future in futures:
+                record(figure, future.result)
+
+    io_utils.write_json(manifest, manifest_path)
+    return result
+
+def write_html(figures: list, metrics: pd.DataFrame, out_dir: str = REPORT_DIR, result: dict = None,
+               title: str = 'Blue Archive Revenue Analysis') -> str:
+    '''
+    Writes the report page, with the figures grouped by section and the metrics table.
+
+    Parameters
+    ----------
+    figures : list[ReportFigure]
+        The figures, in the order they are shown.
+    metrics : pd.DataFrame
+        The metrics table.
+    out_dir : str, optional
+        Where the figures are, by default REPORT_DIR.
+    result : dict, optional
+        The result of render_figures. Failed figures are shown as their error,
+        and images link to their key, so browsers reload changed figures.
+    title : str, optional
+        The title of the page.
+
+    Returns
+    -------
+    str
+        The path of the page, '{out_dir}/index.html'.
+    '''
+    result = result or {'failed': {}, 'keys': {}}
+    parts = [f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{html.escape(title)}</title>\n'
+             '<style>body{font-family:sans-serif;max-width:1200px;margin:auto} img{max-width:100%} '
+             'table{border-collapse:collapse} td,th{border:1px solid #ccc;padding:4px 8px;text-align:right}</style>\n'
+             f'</head>\n<body>\n<h1>{html.escape(title)}</h1>\n'
+             f'<p>Generated {pd.Timestamp.now():%Y-%m-%d %H:%M}</p>\n']
+
+    sections = list(dict.fromkeys(figure.section for figure in figures))
+    for section in sections:
+        parts.append(f'<h2>{html.escape(section)}</h2>\n')
+        for figure in [figure for figure in figures if figure.section == section]:
+            parts.append(f'<h3>{html.escape(figure.title)}</h3>\n')
+            if figure.name in result['failed']:
+                parts.append(f'<p><em>Failed: {html.escape(result["failed"][figure.name])}</em></p>\n')
+            else:
+                key = result['keys'].get(figure.name, '')[:12]
+                parts.append(f'<img src="{html.escape(figure.name)}.png?v={key}" alt="{html.escape(figure.title)}">\n')
+
+    parts.append('<h2>Metrics</h2>\n')
+    parts.append(metrics.to_html(float_format=lambda value: f'{value:,.2f}'))
+    parts.append('\n</body>\n</html>\n')
+
+    path = os.path.join(out_dir, 'index.html')
+    with io_utils.atomic_write(path, mode='w', lock=False) as file:
+        file.write(''.join(parts))
+    return path
+
+# The figures. Each takes its inputs as keyword arguments and returns the figure.
+
+def plot_revenue_monthly(revenue: pd.DataFrame):
+    from utils import plotters
+    return plotters.plot_revenue_monthly(revenue.copy(), show=False)
+
+def plot_revenue_overlay(revenue: pd.DataFrame, events: pd.DataFrame = None, plotter: str = None,
+                         label: bool = False, legend: bool = False, step: bool = True):
+    # plotter is the name of a plotters function, e.g. 'banner_region_plotter'
+    from utils import plotters
+    return plotters.plot_revenue_yearly(revenue.copy(), events_df=events, step=step,
+                                        custom_plotter=getattr(plotters, plotter) if plotter else None,
+                                        label=label, legend=legend, show=False)
+
+def plot_lines(series: dict, title: str, xlabel: str = None, ylabel: str = None):
+    # series maps each label to its values (a Series, or an array plotted against its position)
+    import matplotlib.pyplot as plt
+    from utils import plotters
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    for label, values in series.items():
+        if isinstance(values, pd.Series):
+            ax.plot(values.index, values.to_numpy(), label=label)
+        else:
+            ax.plot(np.asarray(values), label=label)
+    ax.yaxis.set_major_formatter(plotters.millions_formatter)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel or '')
+    ax.set_ylabel(ylabel or '')
+    ax.legend(loc='upper left')
+    fig.tight_layout()
+    return fig
+
+def plot_feature_importance(importance: pd.Series):
+    import matplotlib.pyplot as plt
+
+    importance = importance.sort_values()
+    fig, ax = plt.subplots(figsize=(10, 0.4 * len(importance) + 1.5))
+    ax.barh(importance.index, importance.to_numpy())
+    ax.set_title('XGBoost Residual Model Feature Importance')
+    fig.tight_layout()
+    return fig
+
+def build_report(horizon: int = 6) -> tuple[list, pd.DataFrame]:
+    '''
+    Loads the data and the saved models, and lists the report's figures.
+
+    The banners are read from the fixtures last saved by dataloader_utils.load_banners
+    and the models from MODEL_FILES (e.g. as saved by analysis.ipynb, which fits
+    them on all but the last horizon months), so a report never fetches or
+    fits anything. Only the metrics are computed here; the inputs of each
+    figure are built when it is rendered.
+
+    Parameters
+    ----------
+    horizon : int, optional
+        The number of test months, by default 6.
+
+    Returns
+    -------
+    tuple[list, pd.DataFrame]
+        The ReportFigures, and the metrics (mean absolute error and mean
+        absolute percentage error on the test months) of the model and of
+        the naive baselines.
+    '''
+    import joblib
+    from utils import calendar_utils, cleaning_utils, dataloader_utils, model_utils, refresh_utils
+
+    revenue = dataloader_utils.load_revenue()
+    _, banners_jp = dataloader_utils.load_banner_fixtures()
+    _, event_jp = dataloader_utils.load_events()
+    story_jp = dataloader_utils.load_story_jp()
+    trend_model, xgb_model = (joblib.load(path) for path in MODEL_FILES)
+    models = _file_digest(MODEL_FILES)
+
+    features = refresh_utils.build_revenue_features(revenue, banners_jp, event_jp)
+    revenue_jp = features[['Date', 'JP']]
+    _, y_train, _, y_test = model_utils.prepare_train_test_split(features, horizon)
+    dp = calendar_utils.get_trend_process(len(y_train))
+    X_test2 = model_utils.create_XGB_features(features).iloc[-horizon:].drop(columns=['JP'])
+    final_pred = model_utils.final_prediction(trend_model, xgb_model, X_test2, dp)
+
+    predictions = {'Final prediction': final_pred,
+                   'Last seen value': np.full(horizon, y_train.iloc[-1]),
+                   'Average of last 6 values': np.full(horizon, y_train.iloc[-6:].mean())}
+    actual = y_test.to_numpy()
+    metrics = pd.DataFrame({'MAE': {name: np.mean(np.abs(pred - actual)) for name, pred in predictions.items()},
+                            'MAPE (%)': {name: np.mean(np.abs(pred - actual) / actual) * 100 for name, pred in predictions.items()}})
+    revenue_dates = revenue_jp.set_index('Date')['JP']
+    test_dates = features['Date'].iloc[-horizon:]
+
+    # shared by several figures, and only built for the figures that are rendered
+    @functools.cache
+    def banner_categories():
+        return dataloader_utils.categorize_banners(banners_jp)
+
+    @functools.cache
+    def event_types():
+        return cleaning_utils.classify_notes(event_jp['Notes'])
+
+    @functools.cache
+    def trend():
+        time_index = pd.concat([dp.in_sample(), dp.out_of_sample(steps=horizon)]).to_numpy()
+        return pd.Series(trend_model.predict(time_index), index=features.index)
+
+    def banner_figure(category, **inputs):
+        return lambda: {'revenue': revenue_jp, 'events': banner_categories()[category],
+                        'plotter': 'banner_region_plotter', **inputs}
+
+    def event_figure(event_type):
+        return lambda: {'revenue': revenue_jp, 'events': event_jp[event_types() == event_type],
+                        'plotter': 'event_plotter', 'legend': True}
+
+    on_banners = (revenue_jp, banners_jp)
+    on_events = (revenue_jp, event_jp)
+    on_models = (features, models, horizon)
+
+    figures = [
+        ReportFigure('revenue_monthly', 'Monthly revenue by year', 'Revenue', plot_revenue_monthly, 
+                     {'revenue': revenue_jp}),
+        ReportFigure('revenue_yearly', 'Revenue', 'Revenue', plot_revenue_overlay, 
+                     {'revenue': revenue_jp, 'step': False}),
+        ReportFigure('fes_banners', 'Revenue and Fes banners', 'Banners and events', plot_revenue_overlay,
+                     banner_figure('fes', label=True), on_banners),
+        ReportFigure('limited_banners', 'Revenue and limited banners', 'Banners and events', plot_revenue_overlay,
+                     banner_figure('limited'), on_banners),
+        ReportFigure('pickup_banners', 'Revenue and pickup banners', 'Banners and events', plot_revenue_overlay,
+                     banner_figure('pickup'), on_banners),
+        ReportFigure('story', 'Revenue and main story releases', 'Banners and events', plot_revenue_overlay,
+                     {'revenue': revenue_jp, 'events': story_jp, 'plotter': 'story_plotter', 'legend': True}),
+        ReportFigure('rerun_events', 'Revenue and rerun events', 'Banners and events', plot_revenue_overlay,
+                     event_figure('Rerun'), on_events),
+        ReportFigure('other_events', 'Revenue and other events', 'Banners and events', plot_revenue_overlay,
+                     event_figure('Other'), on_events),
+        ReportFigure('trend', 'Revenue vs spline trend', 'Model', plot_lines,
+                     lambda: {'series': {'Spline Trend': trend().set_axis(features['Date']), 'Revenue': revenue_dates},
+                              'title': 'Revenue vs Spline Trend (Full Dataset)'}, on_models),
+        ReportFigure('residuals', 'Residuals after removing the spline trend', 'Model', plot_lines,
+                     lambda: {'series': {'Train Residuals': (y_train - trend().iloc[:len(y_train)]).set_axis(features['Date'].iloc[:len(y_train)]),
+                                         'Test Residuals': (y_test - trend().iloc[-horizon:]).set_axis(test_dates)},
+                              'title': 'Residuals after Removing Spline Trend'}, on_models),
+        ReportFigure('feature_importance', 'Residual model feature importance', 'Model', plot_feature_importance,
+                     lambda: {'importance': pd.Series(xgb_model.feature_importances_, index=X_test2.columns)}, on_models),
+        ReportFigure('forecast_vs_actual', f'Forecast vs actual revenue of the last {horizon} months', 'Forecast', plot_lines,
+                     {'series': {**{f'{name} (MAE {metrics.loc[name, "MAE"]:,.0f})': pd.Series(pred, index=test_dates)
+                                    for name, pred in predictions.items()},
+                                 'Actual Revenue': y_test.set_axis(test_dates)},
+                      'title': f'Forecast vs Actual Revenue (Last {horizon} Months)'}),
+    ]
+
+    if os.path.exists(refresh_utils.FORECAST_PATH):
+        with open(refresh_utils.FORECAST_PATH, 'r') as file:
+            forecast = json.load(file)
+        forecast = pd.Series(forecast['predictions'], index=pd.to_datetime(forecast['dates']))
+        figures.append(ReportFigure('six_month_forecast', 'The served six-month forecast', 'Forecast', plot_lines,
+                                    {'series': {'Revenue': revenue_dates, 'Forecast': forecast},
+                                     'title': 'Revenue and Six-Month Forecast'}))
+    return figures, metrics
+
+def generate_report(out_dir: str = REPORT_DIR, workers: int = None, force: bool = False, horizon: int = 6) -> dict:
+    '''
+    Generates the analysis report without the notebook: the revenue, banner,
+    event and model figures as PNG files, the metrics, and an index.html page.
+
+    See build_report and render_figures.
+
+    Parameters
+    ----------
+    out_dir : str, optional
+        Where to write the report, by default REPORT_DIR.
+    workers : int, optional
+        The number of worker processes, by default one per available CPU.
+    force : bool, optional
+        Whether to render every figure, even unchanged ones, by default False.
+    horizon : int, optional
+        The number of test months, by default 6.
+
+    Returns
+    -------
+    dict
+        The result of render_figures, with the 'html' path.
+    '''
+    figures, metrics = build_report(horizon)
+    result = render_figures(figures, out_dir, workers, force)
+    metrics.to_csv(os.path.join(out_dir, 'metrics.csv'))
+    result['html'] = write_html(figures, metrics, out_dir, result)
+    return result
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# How much of the contracts the loaders check:
+#   'dtypes' (default) - column names and dtypes only, which reads the metadata and never the values
+#   'full'             - also missing values, ranges and row checks, one pass over the values
+#   'off'              - nothing
+# Set with PIPELINE_VALIDATE, or for one call with validate(..., level=...).
+VALIDATION = os.environ.get('PIPELINE_VALIDATE', 'dtypes')
+LEVELS = ['off', 'dtypes', 'full']
+
+# the numpy dtype kinds each column kind accepts; 'date' is for spreadsheet
+# columns where a cell typed as text makes the whole column object
+KINDS = {'datetime': 'M', 'float': 'iuf', 'int': 'iu', 'object': 'O', 'date': 'MO'}
+
+class SchemaError(ValueError):
+    '''
+    Raised when a loaded dataframe breaks its contract, e.g. a renamed column.
+    '''
+
+class Column:
+    '''
+    The contract of one column.
+
+    Parameters
+    ----------
+    name : str
+        The column name.
+    kind : str, optional
+        A key of KINDS, by default None (any dtype).
+    nullable : bool, optional
+        Whether missing values are allowed (full checks only), by default True.
+    min, max : optional
+        The range of the non-missing values, inclusive (full checks only), by default None.
+    '''
+
+    def __init__(self, name: str, kind: str = None, nullable: bool = True, min=None, max=None):
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f'Unknown column kind: {kind}')
+        self.name = name
+        self.kind = kind
+        self.nullable = nullable
+        self.min = min
+        self.max = max
+
+class Schema:
+    '''
+    The contract of a dataframe at a loader boundary: required columns with
+    their dtypes, plus value rules that are only checked on request.
+
+    The columns are compiled once into (name, accepted dtype kinds) pairs,
+    so the default check is a lookup per column in df.dtypes.
+
+    Parameters
+    ----------
+    name : str
+        The name of the data, used in the error messages.
+    columns : list[Column]
+        The required columns.
+    checks : dict, optional
+        Maps a description to a function of the dataframe returning a boolean
+        mask of the valid rows (full checks only), by default None.
+    strict : bool, optional
+        Whether other columns are an error, e.g. when columns are selected
+        by position and a shifted sheet would add or move one, by default False.
+    '''
+
+    def __init__(self, name: str, columns: list[Column], checks: dict = None, strict: bool = False):
+        self.name = name
+        self.columns = columns
+        self.checks = checks or {}
+        self.strict = strict
+        self._kinds = [(column.name, KINDS[column.kind] if column.kind else None) for column in columns]
+        self._names = {column.name for column in columns}
+
+    def check_dtypes(self, df: pd.DataFrame) -> list[str]:
+        '''
+        The problems with the column names and dtypes of df. Does not read the values.
+        '''
+        issues = []
+        dtypes = dict(zip(df.columns, df.dtypes))
+        if len(dtypes) != len(df.columns):
+            issues.append(f'duplicated columns {sorted(set(df.columns[df.columns.duplicated()]), key=str)}')
+
+        missing = [name for name, _ in self._kinds if name not in dtypes]
+        if missing:
+            issues.append(f'missing columns {missing}')
+        if self.strict:
+            unexpected = [name for name in dtypes if name not in self._names]
+            if unexpected:
+                issues.append(f'unexpected columns {unexpected}')
+
+        for name, kinds in self._kinds:
+            if kinds is not None and name in dtypes and dtypes[name].kind not in kinds:
+                issues.append(f"'{name}' has dtype {dtypes[name]}, expected {self._kind_of(name)}")
+        return issues
+
+    def check_values(self, df: pd.DataFrame) -> list[str]:
+        '''
+        The problems with the values of df: missing values, ranges and row checks.
+        Assumes check_dtypes passed.
+        '''
+        issues = []
+        for column in self.columns:
+            values = df[column.name]
+            nulls = values.isna()
+            if not column.nullable and nulls.any():
+                issues.append(f"'{column.name}' has {int(nulls.sum())} missing values")
+            if column.kind == 'date' and values.dtype.kind == 'O':
+                dates = pd.to_datetime(values, errors='coerce', format='mixed')
+                unparsed = dates.isna() & ~nulls
+                if unparsed.any():
+                    issues.append(f"'{column.name}' has values that are not dates: {_head(values[unparsed])}")
+                values = dates
+            if column.min is not None and (values < column.min).any():
+                issues.append(f"'{column.name}' has values below {column.min}: {_head(values[values < column.min])}")
+            if column.max is not None and (values > column.max).any():
+                issues.append(f"'{column.name}' has values above {column.max}: {_head(values[values > column.max])}")
+
+        for description, check in self.checks.items():
+            valid = np.asarray(check(df), dtype=bool)
+            if not valid.all():
+                issues.append(f'{description} fails for rows {_head(df.index[~valid])}')
+        return issues
+
+    def _kind_of(self, name: str) -> str:
+        return next(column.kind for column in self.columns if column.name == name)
+
+    def __repr__(self) -> str:
+        return f"Schema('{self.name}', {[column.name for column in self.columns]})"
+
+def _head(values, n: int = 5) -> list:
+    values = list(values)
+    return values[:n] + ['...'] * (len(values) > n)
+
+def validate(df: pd.DataFrame, schema: Schema, level: str = None) -> pd.DataFrame:
+    '''
+    Checks a dataframe against its contract.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The dataframe, e.g. as returned by a dataloader_utils loader.
+    schema : Schema
+        Its contract, e.g. REVENUE.
+    level : str, optional
+        'off', 'dtypes' or 'full' (see VALIDATION), by default VALIDATION.
+
+    Returns
+    -------
+    pd.DataFrame
+        df itself, unchanged.
+
+    Raises
+    ------
+    SchemaError
+        With every problem found.
+    '''
+    level = VALIDATION if level is None else level
+    if level not in LEVELS:
+        raise ValueError(f'Unknown validation level: {level}, expected one of {LEVELS}')
+    if level == 'off':
+        return df
+
+    issues = schema.check_dtypes(df)
+    if level == 'full' and not issues:
+        issues = schema.check_values(df)
+    if issues:
+        raise SchemaError(f'{schema.name} does not match its schema: ' + '; '.join(issues))
+    return df
+
+def _ends_after_start(start: str, end: str):
+    def check(df):
+        starts = pd.to_datetime(df[start], errors='coerce', format='mixed')
+        ends = pd.to_datetime(df[end], errors='coerce', format='mixed')
+        return ~(ends < starts) # rows with a missing date pass
+    return check
+
+REVENUE = Schema('revenue',
+                 [Column('Date', 'datetime', nullable=False),
+                  Column('JP', 'float', min=0),
+                  Column('Global', 'float', min=0)],
+                 checks={'Date is increasing and unique': lambda df: np.append(True, np.diff(df['Date'].to_numpy()) > np.timedelta64(0))},
+                 strict=True)
+
+BANNERS = Schema('banners',
+                 [Column('id', 'int', nullable=False),
+                  Column('gachaType', 'object', nullable=False),
+                  Column('startedAt', 'int', nullable=False, min=0),
+                  Column('endedAt', 'int', nullable=False, min=0),
+                  Column('rateups', 'object'),
+                  Column('startAt', 'datetime', nullable=False),
+                  Column('endAt', 'datetime', nullable=False)],
+                 checks={'id is unique': lambda df: ~df['id'].duplicated(),
+                         'endAt is not before startAt': _ends_after_start('startAt', 'endAt')})
+
+EVENTS_EN = Schema('events (EN)',
+                   [Column('Name (EN)', 'object', nullable=False),
+                    Column('Start date', 'date', nullable=False),
+                    Column('End date', 'date'),
+                    Column('Notes', 'object')],
+                   checks={'End date is not before Start date': _ends_after_start('Start date', 'End date')})
+
+# the JP events are used with .dt downstream, so their dates must be parsed
+EVENTS_JP = Schema('events (JP)',
+                   [Column('Name (EN)', 'object', nullable=False),
+                    Column('Name (JP)', 'object'),
+                    Column('Start date', 'datetime', nullable=False),
+                    Column('End date', 'datetime', nullable=False),
+                    Column('Notes', 'object')],
+                   checks={'End date is not before Start date': _ends_after_start('Start date', 'End date')},
+                   strict=True)
+
+STORY_JP = Schema('story (JP)',
+                  [Column('Volume', nullable=False),
+                   Column('Full Name', 'object'),
+                   Column('Chapter', 'float', nullable=False, min=0),
+                   Column('Part', 'float', min=0),
+                   Column('Release Date', 'date', nullable=False)],
+                  strict=True)
@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+DAY_MS = 86_400_000
+
+# roughly the mix of the real JP banners
+GACHA_TYPES = np.array(['PickupGacha', 'LimitedGacha', 'FesGacha'])
+GACHA_TYPE_PROBABILITIES = [0.74, 0.22, 0.04]
+
+# revenue uplift of each banner running in a period, by gacha type
+BANNER_EFFECTS = {'PickupGacha': 0.04, 'LimitedGacha': 0.15, 'FesGacha': 0.45}
+
+PERIODS_PER_YEAR = {'MS': 12, 'D': 365.25}
+
+# each table (and each chunk of it) has its own random stream
+_STREAMS = {'banners': 0, 'revenue': 1, 'panel': 2, 'events': 3, 'story': 4}
+
+def _rng(seed: int, table: str, chunk: int = 0) -> np.random.Generator:
+    # the same seed and chunksize always give the same data
+    return np.random.default_rng([seed, _STREAMS[table], chunk])
+
+def iter_banners(n_banners: int, start: str = '2021-02-04', seed: int = 0, chunksize: int = 100_000):
+    '''
+    Generates banners in chunks, with the same columns as dataloader_utils.load_banners.
+
+    Like the real banners, they are released in weekly batches (often
+    several on the same day), mostly pickup banners with some limited and
+    fes banners, and last one or two weeks.
+
+    Parameters
+    ----------
+    n_banners : int
+        The total number of banners.
+    start : str, optional
+        The release date of the first banner, by default '2021-02-04'.
+    seed : int, optional
+        The random seed, by default 0.
+    chunksize : int, optional
+        The number of banners per chunk, by default 100000.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next chunk of banners, in order of release.
+    '''
+    # banners are released at 02:00 UTC
+    release_ms = (pd.Timestamp(start).normalize() + pd.Timedelta(hours=2)).value // 1_000_000
+    first_id = 50000
+
+    for chunk, chunk_start in enumerate(range(0, n_banners, chunksize)):
+        rng = _rng(seed, 'banners', chunk)
+        n = min(chunksize, n_banners - chunk_start)
+
+        # about half of the banners share a release day with the previous banner
+        gap_days = np.where(rng.random(n) < 0.5, 0, rng.choice([7, 7, 14], size=n))
+        if chunk == 0:
+            gap_days[0] = 0
+        started_at = release_ms + np.cumsum(gap_days) * DAY_MS
+        release_ms = started_at[-1]
+
+        gacha_type = rng.choice(GACHA_TYPES, size=n, p=GACHA_TYPE_PROBABILITIES)
+        days = np.where(gacha_type == 'FesGacha', 7, rng.choice([7, 9, 14], size=n, p=[0.5, 0.1, 0.4]))
+        ended_at = started_at + days * DAY_MS - 1000
+
+        # one rate-up student, sometimes two
+        n_rateups = 1 + (rng.random(n) < 0.05)
+        students = np.char.add('Student ', rng.integers(1, 500, size=n_rateups.sum()).astype(str))
+        rateups = [students.tolist() for students in np.split(students, np.cumsum(n_rateups)[:-1])]
+
+        yield pd.DataFrame({
+            'id': np.arange(first_id + chunk_start, first_id + chunk_start + n),
+            'gachaType': gacha_type,
+            'startedAt': started_at,
+            'endedAt': ended_at,
+            'rateups': rateups,
+            # millisecond resolution, since a million weekly banners go past the last nanosecond date (in 2262)
+            'startAt': started_at.astype('datetime64[ms]'),
+            'endAt': ended_at.astype('datetime64[ms]'),
+        }, index=pd.RangeIndex(chunk_start, chunk_start + n))
+
+def generate_banners(n_banners: int, start: str = '2021-02-04', seed: int = 0) -> pd.DataFrame:
+    '''
+    Generates a banner table (see iter_banners).
+    '''
+    return pd.concat(iter_banners(n_banners, start, seed))
+
+def _seasonality(rng: np.random.Generator, t: np.ndarray, n_series: int, freq: str) -> np.ndarray:
+    # yearly fourier terms with random amplitudes (and a weekly pattern for daily data)
+    log_season = np.zeros((n_series, len(t)))
+    for order in range(1, 4):
+        amplitudes = rng.normal(0, 0.12 / order, size=(n_series, 2))
+        log_season += amplitudes[:, :1] * np.sin(2 * np.pi * order * t) + amplitudes[:, 1:] * np.cos(2 * np.pi * order * t)
+    if freq == 'D':
+        weekly = rng.normal(0, 0.05, size=(n_series, 1))
+        log_season += weekly * np.cos(2 * np.pi * t * PERIODS_PER_YEAR['D'] / 7)
+    return log_season
+
+def _trend(rng: np.random.Generator, t: np.ndarray, n_series: int) -> np.ndarray:
+    # piecewise-linear log trend, with a new slope every 2 years or so
+    knots = np.arange(0, t[-1] + 2, 2.0)
+    slopes = rng.normal(0.05, 0.15, size=(n_series, len(knots) - 1))
+    knot_values = np.concatenate([np.zeros((n_series, 1)), np.cumsum(slopes * 2.0, axis=1)], axis=1)
+    segment = np.minimum((t // 2).astype(int), len(knots) - 2)
+    return knot_values[:, segment] + slopes[:, segment] * (t - knots[segment])
+
+def banner_activity(banners: pd.DataFrame, dates: pd.DatetimeIndex) -> dict[str, np.ndarray]:
+    '''
+    Counts the banners of each gacha type running in each period.
+
+    Parameters
+    ----------
+    banners : pd.DataFrame
+        Banners with 'gachaType', 'startAt' and 'endAt' columns.
+    dates : pd.DatetimeIndex
+        The (sorted) start of each period.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        Maps each gacha type to the number of its banners running in each period.
+    '''
+    first = np.searchsorted(dates, banners['startAt'].to_numpy(), side='right') - 1
+    last = np.searchsorted(dates, banners['endAt'].to_numpy(), side='right') - 1
+    is_counted = (last >= 0) & (first < len(dates))
+    first, last = np.maximum(first, 0), np.minimum(last, len(dates) - 1)
+
+    activity = {}
+    for gacha_type in GACHA_TYPES:
+        is_type = is_counted & (banners['gachaType'] == gacha_type).to_numpy()
+        # +1 where a banner starts, -1 after it ends
+        change = np.bincount(first[is_type], minlength=len(dates) + 1) - np.bincount(last[is_type] + 1, minlength=len(dates) + 1)
+        activity[gacha_type] = np.cumsum(change[:-1])
+    return activity
+
+def generate_revenue(n_periods: int, start: str = '2021-02-01', freq: str = 'MS', banners: pd.DataFrame = None,
+                     seed: int = 0, base: float = 5e6) -> pd.DataFrame:
+    '''
+    Generates a revenue series with the columns of dataloader_utils.load_revenue.
+
+    Revenue is a piecewise-linear (log) trend, times yearly seasonality, times
+    an uplift for each banner running in the period (see BANNER_EFFECTS), times noise.
+    Global revenue is about a third of JP revenue.
+
+    Parameters
+    ----------
+    n_periods : int
+        The number of months (or days).
+    start : str, optional
+        The first date, by default '2021-02-01'.
+    freq : str, optional
+        'MS' for monthly or 'D' for daily revenue, by default 'MS'.
+    banners : pd.DataFrame or iterable of pd.DataFrame, optional
+        The banners driving revenue, or chunks of them (e.g. from iter_banners),
+        by default banners from iter_banners covering the same dates. The
+        chunks are counted one at a time, so the banners are never all in memory.
+    seed : int, optional
+        The random seed, by default 0.
+    base : float, optional
+        The typical revenue per month at the start, by default 5 million.
+
+    Returns
+    -------
+    pd.DataFrame
+        The 'Date', 'JP' and 'Global' revenue.
+    '''
+    rng = _rng(seed, 'revenue')
+    dates = pd.date_range(start, periods=n_periods, freq=freq)
+    t = np.arange(n_periods) / PERIODS_PER_YEAR[freq]
+
+    if banners is None:
+        n_banners = int(100 * (t[-1] + 1)) # about 100 banners a year
+        banners = iter_banners(n_banners, start=dates[0], seed=seed)
+
+    activity = dict.fromkeys(GACHA_TYPES, 0)
+    for chunk in [banners] if isinstance(banners, pd.DataFrame) else banners:
+        for gacha_type, counts in banner_activity(chunk, dates).items():
+            activity[gacha_type] = activity[gacha_type] + counts
+    uplift = 1 + sum(BANNER_EFFECTS[gacha_type] * counts for gacha_type, counts in activity.items())
+
+    log_revenue = _trend(rng, t, 1)[0] + _seasonality(rng, t, 1, freq)[0]
+    jp = base / (PERIODS_PER_YEAR[freq] / 12) * np.exp(log_revenue) * uplift * rng.lognormal(0, 0.1, n_periods)
+    global_revenue = jp * rng.normal(0.35, 0.03) * rng.lognormal(0, 0.1, n_periods)
+
+    return pd.DataFrame({'Date': dates, 'JP': jp.round(-4), 'Global': global_revenue.round(-4)})
+
+def iter_revenue_panel(n_series: int, n_periods: int, start: str = '2021-02-01', freq: str = 'MS', seed: int = 0,
+                       chunksize: int = 100):
+    '''
+    Generates the revenue of many titles in chunks of series, as a long panel
+    (the input of global_model_utils.create_global_features).
+
+    Each series has its own size, trend and seasonality. Banner effects come
+    from a random number of banners of each gacha type per period.
+
+    Parameters
+    ----------
+    n_series : int
+        The number of series (titles or regions).
+    n_periods : int
+        The number of months (or days) per series.
+    start : str, optional
+        The first date, by default '2021-02-01'.
+    freq : str, optional
+        'MS' for monthly or 'D' for daily revenue, by default 'MS'.
+    seed : int, optional
+        The random seed, by default 0.
+    chunksize : int, optional
+        The number of series per chunk, by default 100.
+
+    Yields
+    ------
+    pd.DataFrame
+        The 'series', 'Date', 'revenue' and banner count columns of the next series.
+    '''
+    dates = pd.date_range(start, periods=n_periods, freq=freq)
+    t = np.arange(n_periods) / PERIODS_PER_YEAR[freq]
+    banners_per_period = {'PickupGacha': 6, 'LimitedGacha': 2, 'FesGacha': 0.4} # per month
+    months_per_period = 12 / PERIODS_PER_YEAR[freq]
+
+    for chunk, chunk_start in enumerate(range(0, n_series, chunksize)):
+        rng = _rng(seed, 'panel', chunk)
+        n = min(chunksize, n_series - chunk_start)
+
+        counts = {gacha_type: rng.poisson(rate * max(months_per_period, 1 / 7), size=(n, n_periods))
+                  for gacha_type, rate in banners_per_period.items()}
+        uplift = 1 + sum(BANNER_EFFECTS[gacha_type] * count for gacha_type, count in counts.items())
+
+        scale = rng.lognormal(np.log(5e6 * months_per_period), 1, size=(n, 1))
+        revenue = scale * np.exp(_trend(rng, t, n) + _seasonality(rng, t, n, freq)) * uplift * rng.lognormal(0, 0.1, size=(n, n_periods))
+
+        series_ids = np.char.add('title_', np.arange(chunk_start, chunk_start + n).astype(str))
+        yield pd.DataFrame({
+            'series': np.repeat(series_ids, n_periods),
+            'Date': np.tile(dates, n),
+            'revenue': revenue.ravel(),
+            'Pickup Banner Count': counts['PickupGacha'].ravel(),
+            'Limited Banner Count': counts['LimitedGacha'].ravel(),
+            'Fes Banner Count': counts['FesGacha'].ravel(),
+        })
+
+def iter_events(n_events: int, start: str = '2021-02-25', seed: int = 0, chunksize: int = 100_000):
+    '''
+    Generates events in chunks, with the columns of the event sheets (dataloader_utils.load_events).
+
+    About every 2-5 weeks there is an event lasting 1-3 weeks. About a third
+    are reruns of an earlier event, named '(Rerun) ...' with the note 'Rerun'
+    or no note (like the real sheet), and a few are operations or collaboration events.
+
+    Parameters
+    ----------
+    n_events : int
+        The total number of events.
+    start : str, optional
+        The start date of the first event, by default '2021-02-25'.
+    seed : int, optional
+        The random seed, by default 0.
+    chunksize : int, optional
+        The number of events per chunk, by default 100000.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next chunk of events, in order of start date.
+    '''
+    start_date = np.datetime64(pd.Timestamp(start).date(), 'D')
+    n_originals = 0 # events that can be rerun, across chunks
+
+    for chunk, chunk_start in enumerate(range(0, n_events, chunksize)):
+        rng = _rng(seed, 'events', chunk)
+        n = min(chunksize, n_events - chunk_start)
+
+        kind = rng.choice(['Original', 'Rerun', 'Operation', 'Collaboration Event'], size=n, p=[0.58, 0.35, 0.05, 0.02])
+        is_original = kind == 'Original'
+        originals_before = n_originals + np.cumsum(is_original) - is_original
+        kind[(kind == 'Rerun') & (originals_before == 0)] = 'Original' # nothing to rerun yet
+        is_original = kind == 'Original'
+        originals_before = n_originals + np.cumsum(is_original) - is_original
+
+        # originals are numbered in order; reruns pick an earlier original
+        number = np.where(is_original, originals_before,
+                          np.floor(rng.random(n) * np.maximum(originals_before, 1)).astype(int))
+        n_originals += int(is_original.sum())
+        event_number = chunk_start + np.arange(n)
+
+        name_en = np.where(kind == 'Operation', np.char.add('Special Operation ', event_number.astype(str)),
+                  np.where(kind == 'Collaboration Event', np.char.add('Collaboration ', event_number.astype(str)),
+                           np.char.add('Event ', number.astype(str))))
+        name_en = np.where(kind == 'Rerun', np.char.add('(Rerun) ', name_en), name_en)
+        name_jp = np.char.add('イベント', event_number.astype(str))
+
+        notes = np.full(n, None, dtype=object)
+        notes[kind == 'Rerun'] = np.where(rng.random((kind == 'Rerun').sum()) < 0.5, 'Rerun', None)
+        notes[kind == 'Operation'] = 'Combined Operations'
+        notes[kind == 'Collaboration Event'] = 'Collaboration Event'
+
+        start_days = np.cumsum(rng.choice([14, 21, 28, 35], size=n))
+        start_days -= start_days[0]
+        # second resolution (the banners use milliseconds), so long event sheets also go past 2262
+        start_dates = start_date + start_days
+        end_dates = start_dates + rng.choice([7, 14, 14, 14, 21], size=n)
+        start_date = start_dates[-1] + rng.choice([14, 21, 28, 35])
+
+        yield pd.DataFrame({
+            'Name (EN)': name_en,
+            'Name (JP)': name_jp,
+            'Start date': start_dates.astype('datetime64[s]'),
+            'End date': end_dates.astype('datetime64[s]'),
+            'Notes': notes,
+        }, index=pd.RangeIndex(chunk_start, chunk_start + n))
+
+def generate_events(n_events: int, start: str = '2021-02-25', seed: int = 0) -> pd.DataFrame:
+    '''
+    Generates an event sheet (see iter_events).
+    '''
+    return pd.concat(iter_events(n_events, start, seed))
+
+def generate_story(n_volumes: int, start: str = '2021-02-04', seed: int = 0) -> pd.DataFrame:
+    '''
+    Generates a story sheet with the columns of dataloader_utils.load_story_jp.
+
+    Each volume has a few chapters of a few parts, released every few weeks.
+
+    Parameters
+    ----------
+    n_volumes : int
+        The number of story volumes.
+    start : str, optional
+        The release date of the first part, by default '2021-02-04'.
+    seed : int, optional
+        The random seed, by default 0.
+
+    Returns
+    -------
+    pd.DataFrame
+        The 'Volume', 'Full Name', 'Chapter', 'Part' and 'Release Date' of each part.
+    '''
+    rng = _rng(seed, 'story')
+    chapters_per_volume = rng.integers(2, 6, size=n_volumes)
+    volume = np.repeat(np.arange(1, n_volumes + 1), chapters_per_volume)
+    chapter = np.concatenate([np.arange(1, n + 1) for n in chapters_per_volume])
+
+    parts_per_chapter = rng.integers(1, 5, size=len(chapter))
+    story = pd.DataFrame({'Volume': np.repeat(volume, parts_per_chapter),
+                          'Chapter': np.repeat(chapter, parts_per_chapter)})
+    # chapters with a single part have no part number, like the real sheet
+    story['Part'] = story.groupby(['Volume', 'Chapter']).cumcount().astype(float) + 1
+    story.loc[np.repeat(parts_per_chapter == 1, parts_per_chapter), 'Part'] = np.nan
+
+    story['Full Name'] = np.char.add('Volume ', story['Volume'].to_numpy().astype(str))
+    release_days = np.cumsum(rng.choice([7, 14, 28, 56], size=len(story))) - 7
+    story['Release Date'] = pd.Timestamp(start) + pd.to_timedelta(release_days, unit='D')
+    story['Volume'] = story['Volume'].astype(str)
+    return story[['Volume', 'Full Name', 'Chapter', 'Part', 'Release Date']]